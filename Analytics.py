@@ -1,8 +1,27 @@
+import os
+import argparse
 from datetime import datetime, timedelta
 from collections import defaultdict
-from statistics import mean
+from pymongo import ReturnDocument, UpdateOne
+from dotenv import load_dotenv
 
-def calculate_analytics(pdf_collection, period="month", user_id=None):
+load_dotenv()
+
+# Serve /analytics and /analytics/trends from the per-day rollups. Even when on, a
+# user's dashboard only switches over once `python Analytics.py` has backfilled them.
+ANALYTICS_USE_ROLLUPS = os.getenv("ANALYTICS_USE_ROLLUPS", "0").lower() in ("1", "true", "yes")
+
+FIELDS = ["name", "contractAmount", "issueDate"]
+
+_EMPTY = {
+    "total_pdfs": 0,
+    "field_confidences": {},
+    "top_review_fields": [],
+    "lowest_accuracy_pdf": None
+}
+
+
+def _analytics_query(period, user_id):
     days = {"day": 0, "week": 7, "month": 30, "all": 10000}
     now = datetime.utcnow()
 
@@ -16,60 +35,325 @@ def calculate_analytics(pdf_collection, period="month", user_id=None):
     query = {"timestamp": {"$gte": cutoff}} if period != "all" else {}
     if user_id:
         query["user_id"] = user_id
+    return query
+
+
+def _accuracy(corrected):
+    return round(((3 - corrected) / 3) * 100, 2)
+
+
+def count_corrections(ai_data, user_data):
+    """Fields the user changed compared to the AI value (what the accuracy is based on)."""
+    return sum(
+        1 for f in FIELDS
+        if user_data.get(f) and str(user_data[f]).strip() != str(ai_data.get(f, "")).strip()
+    )
+
+
+# ------------------ Aggregation Pipeline ------------------
+def _truthy(expr):
+    # Python truthiness for the scalar values these fields hold ("" is truthy in MongoDB)
+    return {"$eq": [{"$in": [{"$ifNull": [expr, None]}, [None, "", 0, False]]}, False]}
+
+
+def _text(expr):
+    # str(value).strip(): a missing value compares as "", null as "None"
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$type": expr}, "missing"]}, "then": ""},
+            {"case": {"$eq": [{"$type": expr}, "null"]}, "then": "None"},
+        ],
+        "default": {"$trim": {"input": {"$convert": {"input": expr, "to": "string", "onError": ""}}}},
+    }}
+
+
+def analytics_pipeline(query):
+    """
+    Server-side version of the per-record loop: only the aggregates come
+    back (totals and averages in one facet, the least accurate PDF in the other).
+    """
+    conf, reviewed, corrected = {}, {}, []
+    for f in FIELDS:
+        ai, user = f"$ai_data.{f}", f"$user_updated_data.{f}"
+        conf[f] = {"$convert": {
+            "input": f"$ai_data.field_confidences.{f}", "to": "double", "onError": None, "onNull": None
+        }}
+        reviewed[f] = {"$cond": [
+            {"$and": [_truthy(ai), _truthy(user), {"$ne": [_text(ai), _text(user)]}]}, 1, 0
+        ]}
+        corrected.append({"$cond": [{"$and": [_truthy(user), {"$ne": [_text(user), _text(ai)]}]}, 1, 0]})
+
+    totals = {"_id": None, "total_pdfs": {"$sum": 1}}
+    for f in FIELDS:
+        totals[f"conf_{f}"] = {"$avg": f"$conf.{f}"}
+        totals[f"reviews_{f}"] = {"$sum": f"$reviewed.{f}"}
+        # Earliest record with a correction of the field, to order ties like the loop did
+        totals[f"first_{f}"] = {"$min": {"$cond": [{"$eq": [f"$reviewed.{f}", 1]}, "$_id", None]}}
 
-    records = list(pdf_collection.find(query))
+    return [
+        {"$match": query},
+        {"$project": {"pdfName": 1, "conf": conf, "reviewed": reviewed, "corrected": {"$add": corrected}}},
+        {"$facet": {
+            "totals": [{"$group": totals}],
+            "lowest": [
+                {"$match": {"corrected": {"$gt": 0}}},
+                {"$sort": {"corrected": -1, "_id": 1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "pdfName": 1, "corrected": 1}},
+            ],
+        }},
+    ]
 
-    if not records:
-        return {
-            "total_pdfs": 0,
-            "field_confidences": {},
-            "top_review_fields": [],
-            "lowest_accuracy_pdf": None
-        }
 
-    total_pdfs = len(records)
-    field_confidence = defaultdict(list)
-    manual_reviews = defaultdict(int)
+def calculate_analytics(pdf_collection, period="month", user_id=None):
+    result = next(pdf_collection.aggregate(analytics_pipeline(_analytics_query(period, user_id))), None)
+    if not result or not result["totals"] or not result["totals"][0]["total_pdfs"]:
+        return dict(_EMPTY)
+    totals = result["totals"][0]
+
+    field_avg_conf = {
+        f: round(totals[f"conf_{f}"], 2) for f in FIELDS if totals.get(f"conf_{f}") is not None
+    }
+    reviewed = [f for f in FIELDS if totals[f"reviews_{f}"]]
+    reviewed.sort(key=lambda f: (-totals[f"reviews_{f}"], totals[f"first_{f}"], FIELDS.index(f)))
+
     lowest_accuracy_pdf = {"pdfName": None, "accuracy": 100.0}
+    if result["lowest"]:
+        worst = result["lowest"][0]
+        lowest_accuracy_pdf = {"pdfName": worst.get("pdfName"), "accuracy": _accuracy(worst["corrected"])}
+
+    return {
+        "total_pdfs": totals["total_pdfs"],
+        "field_confidences": field_avg_conf,
+        "top_review_fields": reviewed[:3],
+        "lowest_accuracy_pdf": lowest_accuracy_pdf
+    }
+
+
+# ------------------ Daily Rollups ------------------
+# One document per user and UTC day in the rollup collection:
+#   {_id: "<user_id>:<YYYY-MM-DD>", user_id, day, documents,
+#    conf_sum.<field>, conf_count.<field>, reviews.<field>,
+#    corrected.<0-3> (documents by number of corrected fields),
+#    accuracy_sum, accuracy_count}
+# Every write to an extraction record applies the difference between its
+# contribution before and after the write with a single $inc per day.
+
+def _day(ts):
+    return datetime(ts.year, ts.month, ts.day)
+
+
+def record_counters(rec):
+    """What one extraction record adds to the rollup of its day."""
+    ai_data = rec.get("ai_data") or {}
+    user_data = rec.get("user_updated_data") or {}
+    confidences = ai_data.get("field_confidences") or {}
+    counters = {"documents": 1}
+    for f in FIELDS:
+        conf = confidences.get(f)
+        if conf is not None:
+            try:
+                counters[f"conf_sum.{f}"] = float(conf)
+                counters[f"conf_count.{f}"] = 1
+            except (TypeError, ValueError):
+                pass
+        ai_val, user_val = ai_data.get(f), user_data.get(f)
+        if ai_val and user_val and str(ai_val).strip() != str(user_val).strip():
+            counters[f"reviews.{f}"] = 1
+    counters[f"corrected.{count_corrections(ai_data, user_data)}"] = 1
+    accuracy = ai_data.get("accuracy")
+    if isinstance(accuracy, (int, float)) and not isinstance(accuracy, bool):
+        counters["accuracy_sum"] = accuracy
+        counters["accuracy_count"] = 1
+    return counters
+
+
+def _rollup_deltas(before, after):
+    """{(user_id, day): {counter: delta}} turning `before` into `after` (either may be None)."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for rec, sign in ((before, -1), (after, 1)):
+        if not rec or not rec.get("user_id") or not rec.get("timestamp"):
+            continue
+        key = (rec["user_id"], _day(rec["timestamp"]))
+        for name, value in record_counters(rec).items():
+            deltas[key][name] += sign * value
+    return {key: {k: v for k, v in inc.items() if v} for key, inc in deltas.items()}
+
 
-    for rec in records:
-        ai_data = rec.get("ai_data", {})
-        user_data = rec.get("user_updated_data", {})
-
-     
-        for field in ["name", "contractAmount", "issueDate"]:
-            ai_conf = ai_data.get("field_confidences", {}).get(field)
-            if ai_conf is not None:
-                try:
-                    field_confidence[field].append(float(ai_conf))
-                except ValueError:
-                    pass  # skip non-numeric
-
-            ai_val = ai_data.get(field)
-            user_val = user_data.get(field)
-            if ai_val:
-                is_corrected = user_val and str(ai_val).strip() != str(user_val).strip()
-                if is_corrected:
-                    manual_reviews[field] += 1
-
-        corrected = sum(
-            1 for f in ["name", "contractAmount", "issueDate"]
-            if user_data.get(f) and str(user_data[f]).strip() != str(ai_data.get(f, "")).strip()
-        )
-        accuracy = round(((3 - corrected) / 3) * 100, 2)
-
-        if accuracy < lowest_accuracy_pdf["accuracy"]:
-            lowest_accuracy_pdf = {
-                "pdfName": rec.get("pdfName"),
-                "accuracy": accuracy
-            }
-
-    field_avg_conf = {k: round(mean(v), 2) for k, v in field_confidence.items()}
-    top_fields_review = sorted(manual_reviews, key=manual_reviews.get, reverse=True)[:3]
+def _rollup_update(user_id, day, inc):
+    return (
+        {"_id": f"{user_id}:{day:%Y-%m-%d}"},
+        {"$inc": inc, "$setOnInsert": {"user_id": user_id, "day": day}},
+    )
+
+
+def apply_rollup(rollups, before, after):
+    """Move a record's contribution from `before` to `after` (None for an insert / delete)."""
+    for (user_id, day), inc in _rollup_deltas(before, after).items():
+        if inc:
+            rollups.update_one(*_rollup_update(user_id, day, inc), upsert=True)
+
+
+def insert_record(pdf_collection, rollups, record):
+    """insert_one plus its rollup update."""
+    record.setdefault("corrections", count_corrections(record.get("ai_data") or {}, record.get("user_updated_data") or {}))
+    pdf_collection.insert_one(record)
+    apply_rollup(rollups, None, record)
+
+
+def update_record(pdf_collection, rollups, query, fields):
+    """
+    $set `fields` on one record and update the rollups from the record as
+    it was right before this write. Returns the updated record or None.
+    """
+    before = pdf_collection.find_one_and_update(query, {"$set": fields}, return_document=ReturnDocument.BEFORE)
+    if before is None:
+        return None
+    after = {**before, **fields}
+    corrections = count_corrections(after.get("ai_data") or {}, after.get("user_updated_data") or {})
+    if corrections != before.get("corrections"):
+        pdf_collection.update_one({"_id": before["_id"]}, {"$set": {"corrections": corrections}})
+        after["corrections"] = corrections
+    apply_rollup(rollups, before, after)
+    return after
+
+
+def _rollup_days(rollups, user_id, cutoff):
+    query = {"user_id": user_id}
+    if cutoff is not None:
+        query["day"] = {"$gte": _day(cutoff)}
+    return list(rollups.find(query).sort("day", 1))
+
+
+def calculate_analytics_from_rollups(pdf_collection, rollups, period="month", user_id=None):
+    """
+    calculate_analytics read from the per-day rollups: O(days) small
+    documents plus one indexed lookup for the least accurate PDF. The
+    period is widened to whole UTC days.
+    """
+    query = _analytics_query(period, user_id)
+    cutoff = query.get("timestamp", {}).get("$gte")
+    days = _rollup_days(rollups, user_id, cutoff)
+
+    totals = defaultdict(float)
+    for doc in days:
+        totals["documents"] += doc.get("documents", 0)
+        for group in ("conf_sum", "conf_count", "reviews", "corrected"):
+            for key, value in (doc.get(group) or {}).items():
+                totals[f"{group}.{key}"] += value
+    if not totals["documents"]:
+        return dict(_EMPTY)
+
+    field_avg_conf = {
+        f: round(totals[f"conf_sum.{f}"] / totals[f"conf_count.{f}"], 2)
+        for f in FIELDS if totals.get(f"conf_count.{f}")
+    }
+    reviewed = [f for f in FIELDS if totals.get(f"reviews.{f}")]
+    reviewed.sort(key=lambda f: -totals[f"reviews.{f}"])
+
+    lowest_accuracy_pdf = {"pdfName": None, "accuracy": 100.0}
+    worst = max((c for c in range(1, 4) if totals.get(f"corrected.{c}")), default=0)
+    if worst:
+        record_query = {"user_id": user_id, "corrections": worst}
+        if cutoff is not None:
+            record_query["timestamp"] = {"$gte": _day(cutoff)}
+        rec = pdf_collection.find_one(record_query, {"pdfName": 1}, sort=[("timestamp", 1)])
+        lowest_accuracy_pdf = {"pdfName": (rec or {}).get("pdfName"), "accuracy": _accuracy(worst)}
 
     return {
-        "total_pdfs": total_pdfs,
+        "total_pdfs": int(totals["documents"]),
         "field_confidences": field_avg_conf,
-        "top_review_fields": top_fields_review,
+        "top_review_fields": reviewed[:3],
         "lowest_accuracy_pdf": lowest_accuracy_pdf
     }
+
+
+def accuracy_trend_from_rollups(rollups, user_id, start_time):
+    """[{"date": "dd-mm-YYYY", "avg_accuracy"}] per day since `start_time` (None = all)."""
+    trend = []
+    for doc in _rollup_days(rollups, user_id, start_time):
+        if not doc.get("documents"):
+            continue
+        count = doc.get("accuracy_count") or 0
+        trend.append({
+            "date": doc["day"].strftime("%d-%m-%Y"),
+            "avg_accuracy": doc["accuracy_sum"] / count if count else None
+        })
+    return trend
+
+
+def user_document_total(rollups, user_id):
+    """All extraction records of a user, summed over the user's rollup days."""
+    result = list(rollups.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {"_id": None, "documents": {"$sum": "$documents"}}},
+    ]))
+    return int(result[0]["documents"]) if result else 0
+
+
+def _backfill_marker(user_id=None):
+    # No user_id field, so the per-user rollup queries never see it
+    return f"backfilled:{user_id or '*'}"
+
+
+_backfilled = set()  # markers already seen by this process
+
+
+def rollups_ready(rollups, user_id):
+    """True once a backfill has covered `user_id` (all users, or this one)."""
+    markers = [_backfill_marker(), _backfill_marker(user_id)]
+    if any(m in _backfilled for m in markers):
+        return True
+    found = {doc["_id"] for doc in rollups.find({"_id": {"$in": markers}}, {"_id": 1})}
+    _backfilled.update(found)
+    return bool(found)
+
+
+def backfill_rollups(pdf_collection, rollups, user_id=None, batch_size=1000):
+    """
+    Rebuild the rollups (of one user, or everyone) from the extraction
+    records and store each record's correction count, then mark them
+    ready for rollups_ready(). Run it with writes paused, or it may miss
+    records written meanwhile.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    projection = {"user_id": 1, "timestamp": 1, "ai_data": 1, "user_updated_data": 1, "corrections": 1}
+    totals = defaultdict(lambda: defaultdict(int))
+    record_updates, records = [], 0
+
+    for rec in pdf_collection.find(query, projection):
+        records += 1
+        for key, inc in _rollup_deltas(None, rec).items():
+            for name, value in inc.items():
+                totals[key][name] += value
+        corrections = count_corrections(rec.get("ai_data") or {}, rec.get("user_updated_data") or {})
+        if rec.get("corrections") != corrections:
+            record_updates.append(UpdateOne({"_id": rec["_id"]}, {"$set": {"corrections": corrections}}))
+        if len(record_updates) >= batch_size:
+            pdf_collection.bulk_write(record_updates, ordered=False)
+            record_updates = []
+    if record_updates:
+        pdf_collection.bulk_write(record_updates, ordered=False)
+
+    rollups.delete_many(query)
+    day_updates = [UpdateOne(*_rollup_update(uid, day, dict(inc)), upsert=True) for (uid, day), inc in totals.items()]
+    for i in range(0, len(day_updates), batch_size):
+        rollups.bulk_write(day_updates[i:i + batch_size], ordered=False)
+    rollups.update_one({"_id": _backfill_marker(user_id)}, {"$set": {"at": datetime.utcnow()}}, upsert=True)
+    return {"records": records, "days": len(day_updates)}
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rebuild the per-day analytics rollups.")
+    parser.add_argument("--user-id", action="append", help="only this user (repeatable); default all users")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri)["pdf_data"]
+    for user_id in args.user_id or [None]:
+        stats = backfill_rollups(db["extracted_data"], db["analytics_daily"], user_id)
+        print(f"✅ Rolled up {stats['records']} records into {stats['days']} days ({user_id or 'all users'})")
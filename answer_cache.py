@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Cosine similarity above which a differently-worded question reuses an answer
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Entries compared per similarity lookup (oldest in the scope evicted first)
+ANSWER_CACHE_MAX_PER_SCOPE = int(os.getenv("ANSWER_CACHE_MAX_PER_SCOPE", "200"))
+
+
+def normalize_question(question: str) -> str:
+    text = re.sub(r"\s+", " ", (question or "").lower()).strip()
+    return text.rstrip("?.! ")
+
+
+def _unit(vector):
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else None
+
+
+class AnswerCache:
+    """
+    In-process chat answer cache scoped to the set of documents a question
+    was asked against. Lookups try the normalized question text first, then
+    the questions already answered for the same documents by embedding
+    similarity. Entries expire after a TTL, the least recently used are
+    evicted past the size limit, and every entry touching a document is
+    dropped when that document is deleted or re-ingested.
+
+    Once attached to a versions collection, each source also has a shared
+    version number that invalidate() bumps. Scopes carry the versions
+    read when the question came in, so a re-ingest or delete in any
+    process or instance makes every other process miss its old entries.
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL_SECONDS, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity=ANSWER_CACHE_SIMILARITY, max_per_scope=ANSWER_CACHE_MAX_PER_SCOPE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.max_per_scope = max_per_scope
+        self.versions = None            # collection of {_id: source, version}
+        self._entries = OrderedDict()   # (scope, question) → entry
+        self._by_source = {}            # source → keys of entries using it
+        self._by_scope = {}             # scope → keys in insertion order, for similarity lookups
+        self._lock = threading.Lock()
+        self.stats = {
+            "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+            "evictions": 0, "expirations": 0, "invalidations": 0, "seconds_saved": 0.0
+        }
+
+    def attach(self, versions):
+        """Share invalidations through `versions` (a Mongo collection) with every other process."""
+        self.versions = versions
+
+    def scope(self, kind, sources):
+        """
+        Cache scope of a question over `sources`, or None when the shared
+        versions can't be read (the question then bypasses the cache).
+        """
+        sources = frozenset(sources)
+        if self.versions is None:
+            return kind, sources, ()
+        try:
+            found = {d["_id"]: d["version"] for d in self.versions.find({"_id": {"$in": list(sources)}})}
+        except Exception as e:
+            logging.error(f"❌ Answer cache versions unavailable, bypassing the cache: {e}")
+            return None
+        return kind, sources, tuple(sorted((s, found.get(s, 0)) for s in sources))
+
+    # ---------- Internals (lock held) ----------
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope = key[0]
+        for source in scope[1]:
+            keys = self._by_source.get(source)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_source[source]
+        keys = self._by_scope.get(scope)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self._by_scope[scope]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry["created"] > self.ttl:
+            self._drop(key)
+            self.stats["expirations"] += 1
+            return None
+        return entry
+
+    def _hit(self, key, entry, kind):
+        self._entries.move_to_end(key)
+        self.stats[kind] += 1
+        self.stats["seconds_saved"] += entry["elapsed"]
+        return entry
+
+    # ---------- Public API ----------
+    def get_exact(self, scope, question):
+        """Cached entry for the same normalized question, or None (not counted as a miss)."""
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._live(key, time.time())
+            return self._hit(key, entry, "exact_hits") if entry else None
+
+    def get_similar(self, scope, vector):
+        """Best cached entry in scope whose question embedding is similar enough, else None."""
+        unit = _unit(vector) if vector else None
+        keys, matrix = [], None
+        if unit is not None:
+            with self._lock:
+                now = time.time()
+                for key in list(self._by_scope.get(scope, ())):
+                    entry = self._live(key, now)
+                    if entry is not None and entry["vector"] is not None:
+                        keys.append(key)
+                if keys:
+                    matrix = np.stack([self._entries[k]["vector"] for k in keys])
+        # Scored outside the lock; the winner is re-checked below
+        best_key = None
+        if matrix is not None:
+            scores = matrix @ unit
+            i = int(np.argmax(scores))
+            if scores[i] >= self.similarity:
+                best_key = keys[i]
+        with self._lock:
+            best = self._live(best_key, time.time()) if best_key else None
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            return self._hit(best_key, best, "semantic_hits")
+
+    def put(self, scope, question, answer, vector=None, sources=None, elapsed=0.0):
+        """Remember an answer; `elapsed` is what producing it cost, reported as time saved on hits."""
+        key = (scope, normalize_question(question))
+        entry = {
+            "answer": answer,
+            "sources": sources or [],
+            "vector": _unit(vector) if vector else None,
+            "created": time.time(),
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            for source in scope[1]:
+                self._by_source.setdefault(source, set()).add(key)
+            in_scope = self._by_scope.setdefault(scope, {})
+            in_scope[key] = None
+            while len(in_scope) > self.max_per_scope:
+                self._drop(next(iter(in_scope)))
+                self.stats["evictions"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, source):
+        """
+        Drop every cached answer that used `source`; returns how many were
+        dropped here. Other processes stop matching theirs through the
+        shared version.
+        """
+        if self.versions is not None:
+            try:
+                self.versions.update_one({"_id": source}, {"$inc": {"version": 1}}, upsert=True)
+            except Exception as e:
+                logging.error(f"❌ Could not bump answer cache version of {source}: {e}")
+        with self._lock:
+            keys = list(self._by_source.get(source, ()))
+            for key in keys:
+                self._drop(key)
+            self.stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stats
+
+
+answer_cache = AnswerCache()
@@ -1,22 +1,40 @@
 import os
 import json
+import time
 import uuid
 import logging
 from datetime import timedelta, datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask import send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from bson import ObjectId
+from bson.errors import InvalidId
 from werkzeug.security import generate_password_hash, check_password_hash
 import fitz  # PyMuPDF
 from dateutil import parser as dateparser
-from openai import AzureOpenAI
-import requests
+from azure_clients import get_blob_service, get_openai_client
 from Analytics import (
-    calculate_analytics,
+    calculate_analytics, calculate_analytics_from_rollups, accuracy_trend_from_rollups,
+    user_document_total, insert_record, update_record, rollups_ready, ANALYTICS_USE_ROLLUPS
 )
 from ingest_pdf import push_chunks_to_search, extract_chunks
+from embeddings import get_embedding
+from embedding_cache import embedding_cache
+from answer_cache import answer_cache
+from context_budget import build_context, truncate_to_tokens, CHAT_CONTEXT_TOKENS
+from field_preselect import preselect_pages, loads_model_json, merge_extractions
+from jobs import JobQueue, NO_PROGRESS
+from pdf_pages import open_pdf, extract_pages
+from ocr import ocr_sparse_pages
+from chunking import chunk_pages
+from retrieval import get_backend
+from mongo_indexes import ensure_indexes, MONGO_ENSURE_INDEXES
+from auth_tokens import TokenAuth
+from keyword_matcher import KeywordMatcherCache
+from classify_pipeline import classify_files, classify_summary, OTHER
+from concurrent.futures import ThreadPoolExecutor
 # ------------------ CONFIG ------------------
 load_dotenv()
 
@@ -34,12 +52,6 @@ CORS(app, supports_credentials=True, resources={r"/*": {
 }})
 
 # -------------- Azure OpenAI & Azure Search Config --------------
-EMBEDDING_URL = f"{os.getenv('AZURE_OPENAI_ENDPOINT')}openai/deployments/{os.getenv('AZURE_EMBEDDING_DEPLOYMENT')}/embeddings?api-version={os.getenv('AZURE_API_VERSION')}"
-EMBEDDING_HEADERS = {
-    "api-key": os.getenv("AZURE_OPENAI_API_KEY"),
-    "Content-Type": "application/json"
-}
-
 SEARCH_HEADERS = {
     "Content-Type": "application/json",
     "api-key": os.getenv("AZURE_SEARCH_API_KEY")
@@ -51,22 +63,33 @@ SEARCH_HEADERS = {
 logging.basicConfig(level=logging.INFO)
 
 # Azure OpenAI Setup
-client_azure = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version=os.getenv("AZURE_API_VERSION")
-)
+client_azure = get_openai_client()
 DEPLOYMENT_NAME = os.getenv("AZURE_GPT_DEPLOYMENT")
 # MongoDB Setup
 mongo_client = MongoClient(os.getenv("MONGO_URI"))
 db = mongo_client["pdf_data"]
 pdf_collection = db["extracted_data"]
 users_collection = db["users"]
+analytics_rollups = db["analytics_daily"]
+# Re-ingests and deletes in any worker invalidate cached answers in all of them
+answer_cache.attach(db["answer_cache_versions"])
+job_queue = JobQueue(db["jobs"])
+token_auth = TokenAuth(users_collection, db["revoked_tokens"])
+
+# Indexes for the hot queries (idempotent; see mongo_indexes.py)
+if MONGO_ENSURE_INDEXES:
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        logging.error(f"❌ Could not ensure MongoDB indexes: {e}")
 
 # Azure Search Setup
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_API_KEY")
 AZURE_SEARCH_INDEX = os.getenv("AZURE_SEARCH_INDEX")
+# /chat retrieval: chunks put in the prompt / vector neighbours considered
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", "5"))
+CHAT_VECTOR_K = int(os.getenv("CHAT_VECTOR_K", "20"))
 
 
 # ------------------ Document classification helper ------------------
@@ -101,7 +124,8 @@ def login():
             return jsonify({"error": "Invalid credentials"}), 401
 
         return jsonify({
-            "token": str(user["_id"]),
+            "token": token_auth.issue(user),
+            "user_id": str(user["_id"]),
             "name": user.get("name", email.split("@")[0])
         })
     except Exception as e:
@@ -109,6 +133,35 @@ def login():
         return jsonify({"error": "Server error"}), 500
 
 
+# ------------------ LOGOUT / PASSWORD CHANGE ------------------
+@app.route("/logout", methods=["POST"])
+def logout():
+    if g.token_claims:
+        token_auth.revoke(g.token_claims)
+    return jsonify({"message": "Logged out"})
+
+
+@app.route("/change-password", methods=["POST"])
+def change_password():
+    if not g.token_claims:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(force=True)
+    current_password = data.get("current_password")
+    new_password = data.get("new_password")
+    if not current_password or not new_password:
+        return jsonify({"error": "current_password and new_password are required"}), 400
+
+    user = users_collection.find_one({"_id": ObjectId(g.token_claims["uid"])})
+    if not user or not check_password_hash(user.get("password", ""), current_password):
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    users_collection.update_one({"_id": user["_id"]}, {"$set": {"password": generate_password_hash(new_password)}})
+    # Every session of the user ends; this one continues with a fresh token
+    user = token_auth.revoke_user(g.token_claims["uid"])
+    return jsonify({"message": "Password changed", "token": token_auth.issue(user)})
+
+
 #---------------------------------------------------
 def format_ai_data(ai_data):
     try:
@@ -135,107 +188,37 @@ def format_ai_data(ai_data):
         logging.warning(f"⚠️ format_ai_data() failed: {e}")
         return ai_data
 
-#-------------------------image to text -------------------------
-def extract_text_with_tesseract(file_path):
-    from pdf2image import convert_from_path
-    import pytesseract
-    from pytesseract import pytesseract as tesseract_cmd
-
-    # ✅ Tell pytesseract where tesseract.exe is
-    tesseract_cmd.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-
-    try:
-        # ✅ Convert each page of PDF to image
-        images = convert_from_path(file_path, dpi=300, poppler_path=r"C:\poppler-24.08.0\Library\bin")
-        all_text = []
-
-        for img in images:
-            # ✅ OCR each image page
-            text = pytesseract.image_to_string(img)
-            all_text.append(text)
-
-        return "\n".join(all_text)
-    except Exception as e:
-        logging.error(f"❌ Tesseract OCR failed: {e}")
-        return ""
-
-
-
-# ------------------ PDF EXTRACTION ------------------
 # ------------------ PDF EXTRACTION ------------------
-@app.route("/extract", methods=["POST"])
-def extract_data():
-    try:
-        file = request.files.get("pdf")
-        if not file:
-            return jsonify({"error": "No PDF file provided"}), 400
-
-        pdf_id = str(uuid.uuid4())
-        if not file or file.filename == "":
-            logging.error("❌ No PDF file uploaded.")
-            return jsonify({"error": "No PDF file uploaded"}), 400
-
-        filename = (file.filename or f"uploaded_{uuid.uuid4()}.pdf").replace(" ", "_")
+EXTRACT_STAGES = ["download", "ocr", "index", "ai_extract", "save"]
+_background_pool = ThreadPoolExecutor(max_workers=4)
 
 
+def _blob_container():
+    return get_blob_service().get_container_client(os.getenv("AZURE_STORAGE_CONTAINER"))
 
-        from azure.storage.blob import BlobServiceClient
-        from io import BytesIO
-
-        BLOB_CONN_STR = os.getenv("AZURE_BLOB_CONNECTION_STRING")
-        BLOB_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER")
-        blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
-        container_client = blob_service.get_container_client(BLOB_CONTAINER)
-
-        # Upload to Azure Blob
-        blob_name = f"{uuid.uuid4()}_{filename}"
-        blob_client = container_client.get_blob_client(blob_name)
-        blob_client.upload_blob(file, overwrite=True)
 
-        # Download file into memory
-        file_stream = BytesIO()
-        blob_client.download_blob().readinto(file_stream)
-        file_stream.seek(0)
+def _log_upload_failure(future, blob_name):
+    if future.exception():
+        logging.error(f"❌ Background blob upload failed for {blob_name}: {future.exception()}")
 
-        text = ""
-        word_count = 0
-        empty_pages = 0
 
-        pdf_file = fitz.open(stream=file_stream.read(), filetype="pdf")
+def _wants_async():
+    flag = request.args.get("async") or request.form.get("async") or ""
+    return flag.lower() in ("1", "true", "yes")
 
-        # Push chunks to Azure Cognitive Search
-        chunks = [page.get_text().strip() for page in pdf_file if page.get_text().strip()]
-        push_chunks_to_search(chunks, source_name=filename)
 
-        page_count = len(pdf_file)
-
-        # Count words & detect empty pages
-        file_stream.seek(0)
-        pdf_file = fitz.open(stream=file_stream.read(), filetype="pdf")
-        for page in pdf_file:
-            page_text = page.get_text().strip()
-            if not page_text:
-                empty_pages += 1
-            else:
-                text += page_text + "\n"
-                word_count += len(page_text.split())
+def chunk_source_key(user_id, pdf_id):
+    """
+    Source key the chunks of an /extract upload are indexed under. One per
+    document, so /chat on a record never retrieves another upload's chunks,
+    even one of the same user with the same filename.
+    """
+    return f"{user_id}:{pdf_id}"
 
-        empty_ratio = empty_pages / page_count
 
-        # OCR fallback
-        if word_count < 30 or empty_ratio > 0.5:
-            logging.warning(
-                f"⚠️ Detected scanned PDF (word_count={word_count}, empty_pages={empty_pages}/{page_count}) — using Tesseract OCR fallback."
-            )
-            import tempfile
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(file_stream.getvalue())
-                tmp_path = tmp.name
-            text = extract_text_with_tesseract(tmp_path)
-            word_count = len(text.split())
-
-        # GPT prompt for structured data extraction
-        prompt = f"""
+def extraction_prompt(text):
+    """GPT prompt for structured data extraction from the (preselected) PDF text."""
+    return f"""
 You are a professional document parser AI. Your task is to extract **structured information** from health insurance policy documents, regardless of how messy or inconsistent the text may be.
 
 Use the following schema to return the extracted data as pure JSON only (no extra text):
@@ -290,109 +273,194 @@ Use the following schema to return the extracted data as pure JSON only (no extr
 """
 
 
-
+def _extract_fields(batches):
+    """
+    Run the extraction prompt over each batch of page text. A single batch
+    returns the model's answer as is; several are extracted in parallel and
+    merged field by field (highest confidence wins).
+    """
+    def ask(text):
         response = client_azure.chat.completions.create(
             model=DEPLOYMENT_NAME,
             messages=[
                 {"role": "system", "content": "You extract structured data from contracts, even if the format is messy."},
-                {"role": "user", "content": prompt}
+                {"role": "user", "content": extraction_prompt(text)}
             ],
             temperature=0.2
         )
+        return response.choices[0].message.content.strip()
 
-        extracted_data = response.choices[0].message.content.strip()
-
-        # Clean JSON
-        import re
-        cleaned = re.sub(r"^```(?:json)?|```$", "", extracted_data.strip(), flags=re.MULTILINE).strip()
-        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        cleaned = match.group(0) if match else extracted_data
+    if len(batches) == 1:
+        return ask(batches[0])
 
-        # Parse and flatten JSON
+    with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+        answers = list(pool.map(ask, batches))
+    partials = []
+    for answer in answers:
         try:
-            parsed_data = json.loads(cleaned)
-            flattened = {
-                "policyholderName": parsed_data.get("policyholderName", {}).get("value"),
-                "policyholderName_confidence": parsed_data.get("policyholderName", {}).get("confidence", 0),
-                "issueDateRaw": parsed_data.get("issueDateRaw"),
-                "issueDate": parsed_data.get("issueDate", {}).get("value"),
-                "issueDate_confidence": parsed_data.get("issueDate", {}).get("confidence", 0),
-                "expirationDateRaw": parsed_data.get("expirationDateRaw"),
-                "expirationDate": parsed_data.get("expirationDate", {}).get("value"),
-                "expirationDate_confidence": parsed_data.get("expirationDate", {}).get("confidence", 0),
-                "providerName": parsed_data.get("providerName", {}).get("value"),
-                "providerName_confidence": parsed_data.get("providerName", {}).get("confidence", 0),
-                "policyholderAddress": parsed_data.get("policyholderAddress", {}).get("value"),
-                "policyholderAddress_confidence": parsed_data.get("policyholderAddress", {}).get("confidence", 0),
-                "policyNumber": parsed_data.get("policyNumber", {}).get("value"),
-                "policyNumber_confidence": parsed_data.get("policyNumber", {}).get("confidence", 0),
-                "premiumAmount": parsed_data.get("premiumAmount", {}).get("value"),
-                "premiumAmount_confidence": parsed_data.get("premiumAmount", {}).get("confidence", 0),
-                "deductibles": parsed_data.get("deductibles", {}).get("value"),
-                "deductibles_confidence": parsed_data.get("deductibles", {}).get("confidence", 0),
-                "termsAndExclusions": parsed_data.get("termsAndExclusions"),
-            }
-            # Always extract Premium from the Policy Schedule line explicitly
-            import re
+            partials.append(loads_model_json(answer))
+        except json.JSONDecodeError:
+            logging.warning(f"⚠️ Skipping unparsable partial extraction: {answer[:200]}")
+    return json.dumps(merge_extractions(partials)) if partials else "\n".join(answers)
+
+
+def run_extraction(pdf_bytes, filename, pdf_id, user_id, progress=NO_PROGRESS):
+    """
+    Index the PDF for chat, extract the structured policy fields with GPT and
+    save the record. Shared by the synchronous /extract route and its jobs.
+    """
+    pdf_file = open_pdf(pdf_bytes)
+    pages = extract_pages(pdf_file)
+    page_count = len(pages)
+
+    # Count words & detect empty pages
+    word_count = sum(p.word_count for p in pages)
+    empty_pages = sum(1 for p in pages if p.empty)
+    empty_ratio = empty_pages / page_count if page_count else 1.0
+
+    # OCR fallback – only the pages whose text layer is (near-)empty
+    if word_count < 30 or empty_ratio > 0.5:
+        logging.warning(
+            f"⚠️ Detected scanned PDF (word_count={word_count}, empty_pages={empty_pages}/{page_count}) — using Tesseract OCR fallback."
+        )
+        progress.stage("ocr")
+        pages = ocr_sparse_pages(pdf_bytes, pages)
+        word_count = sum(p.word_count for p in pages)
+
+    # Push chunks to Azure Cognitive Search
+    progress.stage("index")
+    # A retried job re-indexes the same document: only changed chunks are re-embedded
+    source_key = chunk_source_key(user_id, pdf_id)
+    push_chunks_to_search(chunk_pages(pages), source_name=source_key, reingest=True)
+    text = "".join(p.text + "\n" for p in pages if not p.empty)
+
+    progress.stage("ai_extract")
+    # Only the pages likely to hold the fields go to the model, under a token cap;
+    # fields spread over more pages than one prompt holds are map-reduced
+    extracted_data = _extract_fields(preselect_pages(pages))
+
+    # Parse and flatten JSON
+    try:
+        parsed_data = loads_model_json(extracted_data)
+        flattened = {
+            "policyholderName": parsed_data.get("policyholderName", {}).get("value"),
+            "policyholderName_confidence": parsed_data.get("policyholderName", {}).get("confidence", 0),
+            "issueDateRaw": parsed_data.get("issueDateRaw"),
+            "issueDate": parsed_data.get("issueDate", {}).get("value"),
+            "issueDate_confidence": parsed_data.get("issueDate", {}).get("confidence", 0),
+            "expirationDateRaw": parsed_data.get("expirationDateRaw"),
+            "expirationDate": parsed_data.get("expirationDate", {}).get("value"),
+            "expirationDate_confidence": parsed_data.get("expirationDate", {}).get("confidence", 0),
+            "providerName": parsed_data.get("providerName", {}).get("value"),
+            "providerName_confidence": parsed_data.get("providerName", {}).get("confidence", 0),
+            "policyholderAddress": parsed_data.get("policyholderAddress", {}).get("value"),
+            "policyholderAddress_confidence": parsed_data.get("policyholderAddress", {}).get("confidence", 0),
+            "policyNumber": parsed_data.get("policyNumber", {}).get("value"),
+            "policyNumber_confidence": parsed_data.get("policyNumber", {}).get("confidence", 0),
+            "premiumAmount": parsed_data.get("premiumAmount", {}).get("value"),
+            "premiumAmount_confidence": parsed_data.get("premiumAmount", {}).get("confidence", 0),
+            "deductibles": parsed_data.get("deductibles", {}).get("value"),
+            "deductibles_confidence": parsed_data.get("deductibles", {}).get("confidence", 0),
+            "termsAndExclusions": parsed_data.get("termsAndExclusions"),
+        }
+        # Always extract Premium from the Policy Schedule line explicitly
+        import re
 
 # 👇 Fallback logic if GPT misses the values
 
 # Premium Amount (Total Sum Assured or Maturity)
-            if not flattened.get("premiumAmount"):
-                match = re.search(
-                    r"(sum assured|total benefit|maturity amount)[^\n]*?(Rs\.?\s*[\d,]+)",
-                    text,
-                    re.IGNORECASE
-                )
-                if match:
-                    flattened["premiumAmount"] = match.group(2).strip()
-                    flattened["premiumAmount_confidence"] = 75
+        if not flattened.get("premiumAmount"):
+            match = re.search(
+                r"(sum assured|total benefit|maturity amount)[^\n]*?(Rs\.?\s*[\d,]+)",
+                text,
+                re.IGNORECASE
+            )
+            if match:
+                flattened["premiumAmount"] = match.group(2).strip()
+                flattened["premiumAmount_confidence"] = 75
 
 # Deductibles (Recurring Premiums)
-            if not flattened.get("deductibles"):
-                match = re.search(
-                    r"(premium(?: per| payable)?(?:.*)?)[^\n]*?(Rs\.?\s*[\d,]+\s*(?:monthly|quarterly|annually|yearly)?)",
-                    text,
-                    re.IGNORECASE
-                )
-                if match:
-                    flattened["deductibles"] = match.group(2).strip()
-                    flattened["deductibles_confidence"] = 70
-
+        if not flattened.get("deductibles"):
+            match = re.search(
+                r"(premium(?: per| payable)?(?:.*)?)[^\n]*?(Rs\.?\s*[\d,]+\s*(?:monthly|quarterly|annually|yearly)?)",
+                text,
+                re.IGNORECASE
+            )
+            if match:
+                flattened["deductibles"] = match.group(2).strip()
+                flattened["deductibles_confidence"] = 70
+
+
+
+        # Format extracted dates to DD-MM-YYYY
+        for field in ["issueDate", "expirationDate"]:
+            if flattened.get(field):
+                try:
+                    dt = dateparser.parse(flattened[field], fuzzy=True)
+                    flattened[field] = dt.strftime("%d-%m-%Y")
+                except Exception as e:
+                    logging.warning(f"⚠️ Could not format {field}: {e}")
+
+        parsed_data = format_ai_data(flattened)
+
+    except json.JSONDecodeError:
+        logging.error(f"⚠️ Invalid JSON from model: {extracted_data}")
+        parsed_data = {"raw_output": extracted_data}
+
+    # Save to MongoDB
+    progress.stage("save")
+    insert_record(pdf_collection, analytics_rollups, {
+        "pdf_id": pdf_id,
+        "pdfName": filename,
+        "chunkSource": source_key,
+        "ai_data": parsed_data,
+        "pageCount": page_count,
+        "wordCount": word_count,
+        "timestamp": datetime.utcnow(),
+        "user_id": user_id
+    })
 
+    return {"pdf_id": pdf_id, **parsed_data}
 
-            # Format extracted dates to DD-MM-YYYY
-            for field in ["issueDate", "expirationDate"]:
-                if flattened.get(field):
-                    try:
-                        dt = dateparser.parse(flattened[field], fuzzy=True)
-                        flattened[field] = dt.strftime("%d-%m-%Y")
-                    except Exception as e:
-                        logging.warning(f"⚠️ Could not format {field}: {e}")
 
-            parsed_data = format_ai_data(flattened)
+@app.route("/extract", methods=["POST"])
+def extract_data():
+    try:
+        file = request.files.get("pdf")
+        if not file:
+            return jsonify({"error": "No PDF file provided"}), 400
 
-        except json.JSONDecodeError:
-            logging.error(f"⚠️ Invalid JSON from model: {cleaned}")
-            parsed_data = {"raw_output": extracted_data}
+        pdf_id = str(uuid.uuid4())
+        if not file or file.filename == "":
+            logging.error("❌ No PDF file uploaded.")
+            return jsonify({"error": "No PDF file uploaded"}), 400
 
-        # Save to MongoDB
-        user_id = request.form.get("user_id")
+        user_id = g.uid
         if not user_id:
-            return jsonify({"error": "Missing user_id in form data"}), 400
-
-        user_id = request.form.get("user_id")
-        pdf_collection.insert_one({
-            "pdf_id": pdf_id,
-            "pdfName": filename,
-            "ai_data": parsed_data,
-            "pageCount": page_count,
-            "wordCount": word_count,
-            "timestamp": datetime.utcnow(),
-            "user_id": user_id
-        })
+            return jsonify({"error": "Unauthorized"}), 401
 
-        return jsonify({"pdf_id": pdf_id, **parsed_data})
+        filename = (file.filename or f"uploaded_{uuid.uuid4()}.pdf").replace(" ", "_")
+
+        pdf_bytes = file.read()
+        container_client = _blob_container()
+        blob_name = f"{uuid.uuid4()}_{filename}"
+        blob_client = container_client.get_blob_client(blob_name)
+
+        # Async mode: store the file, then hand it to a background worker
+        if _wants_async():
+            blob_client.upload_blob(pdf_bytes, overwrite=True)
+            job_id = job_queue.enqueue(
+                "extract",
+                {"blob_name": blob_name, "filename": filename, "pdf_id": pdf_id, "user_id": user_id},
+                stages=EXTRACT_STAGES
+            )
+            return jsonify({"job_id": job_id, "pdf_id": pdf_id, "status": "queued"}), 202
+
+        # Upload to Azure Blob in the background, extract from the bytes we already have
+        upload = _background_pool.submit(blob_client.upload_blob, pdf_bytes, overwrite=True)
+        upload.add_done_callback(lambda f: _log_upload_failure(f, blob_name))
+
+        return jsonify(run_extraction(pdf_bytes, filename, pdf_id, user_id))
 
     except Exception as e:
         logging.error(f"❌ Error during extraction: {str(e)}")
@@ -401,8 +469,11 @@ Use the following schema to return the extracted data as pure JSON only (no extr
 # ------------------ SAVE EDITED DATA ------------------
 @app.route("/save", methods=["POST"])
 def save():
+    user_id = g.uid
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
     data = request.get_json()
-    user_id = data.get("user_id")
     pdf_id = data.get("pdf_id")
     updated_fields = data.get("user_updated_data")
 
@@ -419,7 +490,7 @@ def save():
 
     # Get the original document to compare
     existing = pdf_collection.find_one({"pdf_id": pdf_id})
-    if not existing:
+    if not existing or existing.get("user_id") != user_id:
         return jsonify({"error": "PDF not found"}), 404
 
     ai_data = existing.get("ai_data", {})
@@ -429,16 +500,11 @@ def save():
     if not changes:
         return jsonify({"message": "Data Saved"}), 200
 
-    result = pdf_collection.update_one(
-    {"pdf_id": pdf_id},
-    {
-        "$set": {
-            "user_updated_data": changes,
-            "user_id": user_id,  # ensure update preserves user
-            "timestamp": datetime.utcnow()
-        }
-    }
-)
+    # Rollups are moved from the record's old day/state to the new one in the same step
+    update_record(pdf_collection, analytics_rollups, {"pdf_id": pdf_id, "user_id": user_id}, {
+        "user_updated_data": changes,
+        "timestamp": datetime.utcnow()
+    })
 
 
     return jsonify({"message": "User updated data saved successfully"})
@@ -447,20 +513,132 @@ def save():
 
 
 # ------------------ CHATBOT ------------------
-def query_azure_search(question, top_k=5):
-    url = f"{AZURE_SEARCH_ENDPOINT}/indexes/{AZURE_SEARCH_INDEX}/docs/search?api-version=2023-07-01-Preview"
-    headers = {"Content-Type": "application/json", "api-key": AZURE_SEARCH_KEY}
-    body = {"search": question, "top": top_k}
+def query_azure_search(question, source=None, top_k=None, vector=None):
+    """
+    Hybrid (keyword + vector) retrieval of the top chunks for the question,
+    restricted to one document's chunks when `source` is given. Hits carry
+    their source and page provenance.
+    """
+    top_k = top_k or CHAT_TOP_K
+    if vector is None:
+        try:
+            vector = get_embedding(question)
+        except Exception as e:
+            logging.warning(f"⚠️ Question embedding failed, keyword search only: {e}")
     try:
-        response = requests.post(url, headers=headers, json=body)
-        response.raise_for_status()
-        results = response.json()
-        return [doc["content"] for doc in results.get("value", [])]
+        return get_backend("pdf").search(
+            text=question, vector=vector, k=CHAT_VECTOR_K, top=top_k,
+            sources=[source] if source else None,
+            select="content,metadata,page,page_end"
+        )
     except Exception as e:
         print("❌ Azure Search Query Failed:", e)
         return []
 
 
+def _source_refs(hits):
+    """Compact source metadata sent ahead of a streamed answer."""
+    refs = []
+    for h in hits:
+        ref = {"source": (h.get("metadata") or "").replace("source:", "", 1)}
+        for key in ("filename", "page", "page_end"):
+            if h.get(key) is not None:
+                ref[key] = h[key]
+        if "@search.score" in h:
+            ref["score"] = h["@search.score"]
+        refs.append(ref)
+    return refs
+
+
+# ------------------ STREAMING ANSWERS ------------------
+def _wants_stream():
+    """Clients opt in with ?stream=1, "stream": true in the body, or Accept: text/event-stream."""
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return True
+    body = request.get_json(silent=True) or {}
+    return body.get("stream") is True
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(events):
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a reverse proxy buffer the stream
+    })
+
+
+def stream_chat_answer(messages, temperature, sources, on_complete=None):
+    """
+    Server-sent events for a chat answer: one "sources" event with the
+    retrieved chunks' metadata, a "token" event per streamed delta, then
+    "done" (or "error"). If the client disconnects, Werkzeug closes the
+    generator and the upstream completion stream is closed with it, which
+    cancels the generation. `on_complete(answer)` runs once the whole
+    answer has been sent.
+    """
+    def generate():
+        yield _sse("sources", {"sources": sources})
+        stream = None
+        parts = []
+        try:
+            stream = client_azure.chat.completions.create(
+                model=DEPLOYMENT_NAME,
+                messages=messages,
+                temperature=temperature,
+                stream=True
+            )
+            for chunk in stream:
+                # Azure sends content-filter chunks without choices
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield _sse("token", {"text": delta})
+            yield _sse("done", {})
+            if on_complete:
+                on_complete("".join(parts).strip())
+        except Exception as e:
+            logging.error(f"❌ Streaming chat failed: {e}")
+            yield _sse("error", {"error": str(e)})
+        finally:
+            if stream is not None:
+                stream.close()
+
+    return _sse_response(generate())
+
+
+def cached_answer_response(entry):
+    """Serve an answer cache hit in whichever form the client asked for."""
+    if _wants_stream():
+        def generate():
+            yield _sse("sources", {"sources": entry["sources"]})
+            yield _sse("token", {"text": entry["answer"]})
+            yield _sse("done", {"cached": True})
+        return _sse_response(generate())
+    return jsonify({"answer": entry["answer"], "cached": True})
+
+
+def lookup_answer(scope, question):
+    """
+    Answer cache lookup: exact question first, then embedding similarity.
+    Returns (entry or None, question vector or None); the vector is reused
+    for retrieval on a miss.
+    """
+    if scope is None:
+        return None, None
+    entry = answer_cache.get_exact(scope, question)
+    if entry:
+        return entry, None
+    vector = get_embedding(question)
+    return answer_cache.get_similar(scope, vector), vector
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     data = request.json
@@ -471,9 +649,21 @@ def chat():
     if not record:
         return jsonify({"error": "PDF data not found"}), 404
 
+    started = time.perf_counter()
     ai_summary = json.dumps(record.get("ai_data", {}), indent=2)
-    search_chunks = query_azure_search(question)
-    full_text = "\n\n---\n\n".join(search_chunks) if search_chunks else ai_summary
+    # Records from before chunkSource was stored were indexed under the bare filename
+    source = record.get("chunkSource") or record.get("pdfName")
+    scope = answer_cache.scope("pdf", [source]) if source else None
+    question_vector = None
+    if scope:
+        cached, question_vector = lookup_answer(scope, question)
+        if cached:
+            return cached_answer_response(cached)
+    hits = query_azure_search(question, source=source, vector=question_vector) if source else []
+    # Best chunks packed into the token budget, each tagged with its page
+    full_text, hits, _ = build_context(hits, default_name=record.get("pdfName"))
+    if not full_text:
+        full_text = truncate_to_tokens(ai_summary, CHAT_CONTEXT_TOKENS)
 
     prompt = f"""
 You are  —Chatbot a smart, human-like assistant trained to help users understand complex PDFs such as contracts, insurance policies, business reports, or legal documents.
@@ -516,17 +706,27 @@ Help the user by answering their question **only using the content of the provid
 (Reply naturally like a helpful assistant would. Avoid sounding robotic.)
 """
 
+    messages = [
+        {"role": "system", "content": "You are a conversational assistant answering based on PDF content."},
+        {"role": "user", "content": prompt}
+    ]
+    refs = _source_refs(hits)
+
+    def remember(answer):
+        if scope and answer:
+            answer_cache.put(scope, question, answer, question_vector, refs, time.perf_counter() - started)
+
+    if _wants_stream():
+        return stream_chat_answer(messages, 0.5, refs, on_complete=remember)
 
     try:
         response = client_azure.chat.completions.create(
             model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You are a conversational assistant answering based on PDF content."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=messages,
             temperature=0.5
         )
         answer = response.choices[0].message.content.strip()
+        remember(answer)
         return jsonify({"answer": answer})
     except Exception as e:
         logging.error(f"❌ Error in chatbot: {str(e)}")
@@ -539,15 +739,19 @@ Help the user by answering their question **only using the content of the provid
 @app.route("/analytics", methods=["POST"])
 def get_user_analytics():
     try:
-        data = request.get_json()
-        user_id = data.get("user_id")
-        period = data.get("filter", "month")  
-
+        user_id = g.uid
         if not user_id:
-            return jsonify({"error": "Missing user_id"}), 400
+            return jsonify({"error": "Unauthorized"}), 401
+
+        data = request.get_json()
+        period = data.get("filter", "month")
 
-        from Analytics import calculate_analytics
-        analytics_data = calculate_analytics(pdf_collection, period=period, user_id=user_id)
+        if ANALYTICS_USE_ROLLUPS and rollups_ready(analytics_rollups, user_id):
+            analytics_data = calculate_analytics_from_rollups(
+                pdf_collection, analytics_rollups, period=period, user_id=user_id
+            )
+        else:
+            analytics_data = calculate_analytics(pdf_collection, period=period, user_id=user_id)
         return jsonify(analytics_data)
 
     except Exception as e:
@@ -557,13 +761,13 @@ def get_user_analytics():
 
 @app.route("/analytics/trends", methods=["POST"])
 def analytics_trends():
+    user_id = g.uid
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
     data = request.get_json()
-    user_id = data.get("user_id")
     filter_by = data.get("filter", "month")
 
-    if not user_id:
-        return jsonify({"error": "Missing user ID"}), 400
-
     now = datetime.now()
     if filter_by == "day":
         start_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -574,6 +778,10 @@ def analytics_trends():
     else:
         start_time = datetime.min
 
+    if ANALYTICS_USE_ROLLUPS and rollups_ready(analytics_rollups, user_id):
+        start = start_time if start_time != datetime.min else None
+        return jsonify({"trend": accuracy_trend_from_rollups(analytics_rollups, user_id, start)})
+
     pipeline = [
         {
             "$match": {
@@ -606,211 +814,210 @@ def analytics_trends():
 
     return jsonify({"trend": trend})
 
+PDF_DETAILS_PAGE_SIZE = int(os.getenv("PDF_DETAILS_PAGE_SIZE", "50"))
+PDF_DETAILS_MAX_PAGE_SIZE = int(os.getenv("PDF_DETAILS_MAX_PAGE_SIZE", "500"))
+# Only what the Analytics.js table renders
+PDF_DETAILS_PROJECTION = {
+    "pdfName": 1, "timestamp": 1, "pageCount": 1, "wordCount": 1,
+    "ai_data.accuracy": 1, "ai_data.field_confidences": 1
+}
+
+
+def _encode_cursor(pdf):
+    return f"{pdf['timestamp'].isoformat()}|{pdf['_id']}"
+
+
+def _decode_cursor(cursor):
+    ts, oid = cursor.rsplit("|", 1)
+    return datetime.fromisoformat(ts), ObjectId(oid)
+
+
 @app.route("/analytics/pdf-details", methods=["POST"])
 def analytics_pdf_details():
-    data = request.get_json()
-    user_id = data.get("user_id")
-
+    """
+    A user's PDFs, newest first, one page at a time: keyset pagination on
+    (timestamp, _id) with "cursor" set to the previous page's next_cursor,
+    "page_size" rows per page, and "include_total" for the total count.
+    """
+    user_id = g.uid
     if not user_id:
-        return jsonify({"error": "Missing user ID"}), 400
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json()
 
-    pdfs = list(pdf_collection.find(
-    {"user_id": user_id},
-    {"pdfName": 1, "ai_data": 1, "timestamp": 1, "pageCount": 1, "wordCount": 1}
-).sort("timestamp", -1))
+    try:
+        page_size = max(1, min(int(data.get("page_size") or PDF_DETAILS_PAGE_SIZE), PDF_DETAILS_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "page_size must be an integer"}), 400
 
+    query = {"user_id": user_id}
+    if data.get("cursor"):
+        try:
+            ts, oid = _decode_cursor(data["cursor"])
+        except (ValueError, InvalidId):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query["$or"] = [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": oid}}]
+
+    pdfs = list(
+        pdf_collection.find(query, PDF_DETAILS_PROJECTION)
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(page_size + 1)
+    )
+    has_more = len(pdfs) > page_size
+    pdfs = pdfs[:page_size]
+    next_cursor = _encode_cursor(pdfs[-1]) if has_more else None
 
     for pdf in pdfs:
         pdf["_id"] = str(pdf["_id"])
 
         # Extract from ai_data if not top-level
-        ai_data = pdf.get("ai_data", {})
+        ai_data = pdf.pop("ai_data", None) or {}
         pdf["accuracy"] = ai_data.get("accuracy")
         pdf["field_confidences"] = ai_data.get("field_confidences", {})
 
         # Format timestamp for display
         if "timestamp" in pdf:
             pdf["timestamp"] = pdf["timestamp"].strftime("%d-%m-%Y %H:%M")
-    return jsonify({"pdfs": pdfs})
+
+    result = {"pdfs": pdfs, "next_cursor": next_cursor}
+    if data.get("include_total"):
+        if ANALYTICS_USE_ROLLUPS and rollups_ready(analytics_rollups, user_id):
+            result["total"] = user_document_total(analytics_rollups, user_id)
+        else:
+            result["total"] = pdf_collection.count_documents({"user_id": user_id})
+    return jsonify(result)
 # --------------------------- PDF COMPARE ---------------------------
-import fitz  # PyMuPDF
-import re
-from dateutil import parser as dateparser
-from flask import Flask, request, jsonify
-from rapidfuzz import fuzz
-import diff_match_patch as dmp_module
+from compare_blocks import (
+    ComparisonStore, extract_paragraphs_with_pages, iter_compare_blocks,
+    iter_block_pages, render_html, COMPARE_PAGE_SIZE
+)
 
-# ---------- Config ----------
-PARA_MATCH_THRESHOLD = 80   # lower to catch minor changes
-LINE_MATCH_THRESHOLD = 85   # slightly lower for OCR tolerance
-MIN_PARTIAL_THRESHOLD = 60
+comparison_store = ComparisonStore(db["comparisons"], db["comparison_blocks"])
 
-DATE_RE = re.compile(r"\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b")
-NUMERIC_RE = re.compile(r"\b\d+(?:\.\d+)?\b")  # matches integers and decimals
 
-# ---------- Helpers ----------
+def _ndjson(record):
+    return json.dumps(record) + "\n"
 
-def normalize_whitespace(text: str) -> str:
-    text = text.replace('\r', '\n')
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    text = "\n".join(ln.strip() for ln in text.splitlines())
-    return text.strip()
 
-def normalize_dates(text: str) -> str:
-    def repl(m):
-        try:
-            d = dateparser.parse(m.group(0), dayfirst=True)
-            return d.strftime("%d-%m-%Y")
-        except Exception:
-            return m.group(0)
-    return DATE_RE.sub(repl, text)
-
-def extract_paragraphs_from_pdf_bytes(file_bytes: bytes):
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    paras = []
-    for page in doc:
-        raw = page.get_text("text") or ""
-        raw = normalize_whitespace(raw)
-        # Split on blank lines OR newline + capital letter
-        for p in re.split(r"(?:\n\s*\n)|(?:\n(?=[A-Z]))", raw):
-            p = p.strip()
-            if p:
-                p = normalize_dates(p)
-                paras.append(p)
-    doc.close()
-    return paras
-
-def numbers_changed(a: str, b: str) -> bool:
-    """Check if numeric values differ between strings."""
-    nums_a = re.findall(r"\b\d+(?:\.\d+)?\b", a)
-    nums_b = re.findall(r"\b\d+(?:\.\d+)?\b", b)
-    return nums_a != nums_b
-
-def dates_changed(a: str, b: str) -> bool:
-    """Check if date values differ between strings (after normalization)."""
-    dates_a = [normalize_dates(m) for m in DATE_RE.findall(a)]
-    dates_b = [normalize_dates(m) for m in DATE_RE.findall(b)]
-    return dates_a != dates_b
-
-def word_level_diff_html(a: str, b: str) -> str:
-    # NEW: if numeric or date values differ, mark whole thing removed/new
-    if numbers_changed(a, b) or dates_changed(a, b):
-        return f'<span class="removed">{a}</span><span class="new">{b}</span>'
-    
-    dmp = dmp_module.diff_match_patch()
-    diffs = dmp.diff_main(a, b)
-    dmp.diff_cleanupSemantic(diffs)
-    parts = []
-    for op, data in diffs:
-        txt = data.replace("\n", "<br/>")
-        if op == 0:
-            parts.append(f'<span class="same">{txt}</span>')
-        elif op == -1:
-            parts.append(f'<span class="removed">{txt}</span>')
-        elif op == 1:
-            parts.append(f'<span class="new">{txt}</span>')
-    return "".join(parts)
+def stream_comparison(comparison_id, paras1, paras2):
+    """
+    NDJSON stream of a comparison: a "meta" record, one "blocks" record per
+    page as the alignment reaches it (each page is stored before it is
+    sent), then "done" (or "error"). A client that disconnects leaves the
+    comparison marked "aborted" with the blocks stored so far.
+    """
+    total, status, error = 0, "aborted", None
+    try:
+        yield _ndjson({
+            "type": "meta", "comparison_id": comparison_id,
+            "paragraphs1": len(paras1), "paragraphs2": len(paras2)
+        })
+        for doc, page, blocks in iter_block_pages(iter_compare_blocks(paras1, paras2)):
+            comparison_store.append(comparison_id, blocks)
+            total += len(blocks)
+            yield _ndjson({"type": "blocks", "doc": doc, "page": page, "blocks": blocks})
+        status = "done"
+        yield _ndjson({"type": "done", "comparison_id": comparison_id, "total": total})
+    except Exception as e:
+        logging.error(f"❌ Compare stream failed: {e}")
+        status, error = "failed", str(e)
+        yield _ndjson({"type": "error", "error": str(e)})
+    finally:
+        comparison_store.finish(comparison_id, total, status=status, error=error)
+
 
 # ---------- Main Compare Route ----------
 
 @app.route("/compare", methods=["POST"])
 def compare_pdfs():
+    """
+    Compare two PDFs. Returns {"html_result"} by default; with ?format=blocks
+    the structured blocks are stored and the first page of them returned
+    (more via GET /compare/<comparison_id>/blocks); with ?stream=1 the
+    blocks are streamed page by page as NDJSON. Stored comparisons (blocks,
+    stream) belong to the caller and need a token.
+    """
     try:
         pdf1 = request.files.get("pdf1")
         pdf2 = request.files.get("pdf2")
         if not pdf1 or not pdf2:
             return jsonify({"error": "Both pdf1 and pdf2 are required"}), 400
 
-        paras1 = extract_paragraphs_from_pdf_bytes(pdf1.read())
-        paras2 = extract_paragraphs_from_pdf_bytes(pdf2.read())
+        output = request.args.get("format") or request.form.get("format") or "html"
+        if (_wants_stream() or output == "blocks") and not g.uid:
+            return jsonify({"error": "Unauthorized"}), 401
 
-        matched_2 = set()
-        html_blocks = []
+        paras1 = extract_paragraphs_with_pages(pdf1.read())
+        paras2 = extract_paragraphs_with_pages(pdf2.read())
 
-        # Match paragraphs regardless of order
-        for p1 in paras1:
-            best_score = -1
-            best_j = None
-            for j, p2 in enumerate(paras2):
-                if j in matched_2:
-                    continue
-                score = fuzz.ratio(p1, p2)
-                if score > best_score:
-                    best_score = score
-                    best_j = j
-
-            if best_score >= PARA_MATCH_THRESHOLD and best_j is not None:
-                wl_html = word_level_diff_html(p1, paras2[best_j])
-                html_blocks.append(f'<div class="para same">{wl_html}</div>')
-                matched_2.add(best_j)
-            else:
-                best_para_j = None
-                best_para_score = -1
-                for j, p2 in enumerate(paras2):
-                    if j in matched_2:
-                        continue
-                    score = fuzz.partial_ratio(p1, p2)
-                    if score > best_para_score:
-                        best_para_score = score
-                        best_para_j = j
-
-                if best_para_j is None or best_para_score < MIN_PARTIAL_THRESHOLD:
-                    html_blocks.append(f'<div class="para removed">{p1}</div>')
-                else:
-                    p2 = paras2[best_para_j]
-                    matched_2.add(best_para_j)
-
-                    lines1 = [ln.strip() for ln in p1.splitlines() if ln.strip()]
-                    lines2 = [ln.strip() for ln in p2.splitlines() if ln.strip()]
-                    matched_lines2 = set()
-                    para_html = ['<div class="para">']
-
-                    for l1 in lines1:
-                        best_lscore = -1
-                        best_lidx = None
-                        for idx2, l2 in enumerate(lines2):
-                            if idx2 in matched_lines2:
-                                continue
-                            score = fuzz.ratio(l1, l2)
-                            if score > best_lscore:
-                                best_lscore = score
-                                best_lidx = idx2
-                        if best_lscore >= LINE_MATCH_THRESHOLD and best_lidx is not None:
-                            wl_html = word_level_diff_html(l1, lines2[best_lidx])
-                            para_html.append(f'<div class="line same">{wl_html}</div>')
-                            matched_lines2.add(best_lidx)
-                        elif best_lscore >= MIN_PARTIAL_THRESHOLD and best_lidx is not None:
-                            wl_html = word_level_diff_html(l1, lines2[best_lidx])
-                            para_html.append(f'<div class="line partial">{wl_html}</div>')
-                            matched_lines2.add(best_lidx)
-                        else:
-                            para_html.append(f'<div class="line removed">{l1}</div>')
-
-                    # New lines in p2 not matched
-                    for idx2, l2 in enumerate(lines2):
-                        if idx2 not in matched_lines2:
-                            para_html.append(f'<div class="line new">{l2}</div>')
-
-                    para_html.append('</div>')
-                    html_blocks.append("".join(para_html))
-
-        # Any paras in PDF2 not matched at all → NEW
-        for j, p2 in enumerate(paras2):
-            if j not in matched_2:
-                html_blocks.append(f'<div class="para new">{p2}</div>')
-
-        final_html = '<div class="compare-output">' + "\n".join(html_blocks) + '</div>'
-        return jsonify({"html_result": final_html}), 200
+        if _wants_stream():
+            comparison_id = comparison_store.create(
+                pdf1=pdf1.filename, pdf2=pdf2.filename, user_id=g.uid
+            )
+            return Response(stream_comparison(comparison_id, paras1, paras2), mimetype="application/x-ndjson",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        # Hash anchors → cdist score matrix → order-preserving assignment
+        blocks = list(iter_compare_blocks(paras1, paras2))
+
+        if output == "blocks":
+            comparison_id = comparison_store.create(
+                pdf1=pdf1.filename, pdf2=pdf2.filename, user_id=g.uid
+            )
+            comparison_store.append(comparison_id, blocks)
+            comparison_store.finish(comparison_id, len(blocks))
+            first = blocks[:COMPARE_PAGE_SIZE]
+            return jsonify({
+                "comparison_id": comparison_id,
+                "total": len(blocks),
+                "blocks": first,
+                "next_cursor": first[-1]["seq"] if len(blocks) > len(first) else None
+            }), 200
+
+        return jsonify({"html_result": render_html(blocks)}), 200
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+
+@app.route("/compare/<comparison_id>/blocks", methods=["GET"])
+def compare_blocks_page(comparison_id):
+    """
+    Page through a stored comparison: blocks with seq > ?cursor (default 0),
+    at most ?limit. next_cursor is null once the last block was returned;
+    while the comparison is still running it stays at the last seen seq.
+    ?format=html renders the page as HTML instead.
+    """
+    if not g.uid:
+        return jsonify({"error": "Unauthorized"}), 401
+    comparison = comparison_store.get(comparison_id, user_id=g.uid)
+    if not comparison:
+        return jsonify({"error": "Comparison not found"}), 404
+    try:
+        cursor = int(request.args.get("cursor", 0))
+        limit = int(request.args.get("limit", COMPARE_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "cursor and limit must be integers"}), 400
+
+    blocks, next_cursor = comparison_store.page(comparison_id, cursor, limit)
+    if next_cursor is None and comparison["status"] == "running":
+        next_cursor = blocks[-1]["seq"] if blocks else cursor
+
+    result = {
+        "comparison_id": comparison_id,
+        "status": comparison["status"],
+        "total": comparison.get("total"),
+        "next_cursor": next_cursor,
+    }
+    if request.args.get("format") == "html":
+        result["html_result"] = render_html(blocks)
+    else:
+        result["blocks"] = blocks
+    return jsonify(result), 200
+
 # ------------------ MULTI-DOC UPLOAD ------------------
-from azure.storage.blob import BlobServiceClient
-import tempfile
 
 @app.route("/upload-multi-doc", methods=["POST"])
 def upload_multi_doc():
@@ -819,12 +1026,10 @@ def upload_multi_doc():
         if not files:
             return jsonify({"error": "No files provided"}), 400
 
-        BLOB_CONN_STR = os.getenv("AZURE_BLOB_CONNECTION_STRING")
-        BLOB_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER")
-        blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
-        container_client = blob_service.get_container_client(BLOB_CONTAINER)
+        container_client = _blob_container()
 
         uploaded_docs = []
+        async_mode = _wants_async()
 
         for file in files:
             filename = file.filename
@@ -837,21 +1042,32 @@ def upload_multi_doc():
             file.stream.seek(0)
             file_bytes = file.read()
 
-            status = "Uploaded"
-            try:
-                from ingest_multi_doc import process_blob
-                process_blob(blob_name, filename)  # pass filename for better logging
-            except Exception as ingest_err:
-                logging.error(f"❌ Failed to process {filename}: {str(ingest_err)}")
-                status = "Failed"
-
-            uploaded_docs.append({
+            job_id = None
+            if async_mode:
+                job_id = job_queue.enqueue(
+                    "multi_doc", {"blob_name": blob_name, "filename": filename, "user_id": g.uid},
+                    stages=MULTI_DOC_STAGES
+                )
+                status = "Queued"
+            else:
+                status = "Uploaded"
+                try:
+                    from ingest_multi_doc import process_blob
+                    process_blob(blob_name, filename)  # pass filename for better logging
+                except Exception as ingest_err:
+                    logging.error(f"❌ Failed to process {filename}: {str(ingest_err)}")
+                    status = "Failed"
+
+            doc_info = {
                 "name": filename,
                 "date": datetime.utcnow().strftime("%d-%m-%Y %H:%M"),
                 "status": status,
                 "size": f"{len(file_bytes) / 1024:.1f} KB",
                 "blob_name": blob_name
-            })
+            }
+            if job_id:
+                doc_info["job_id"] = job_id
+            uploaded_docs.append(doc_info)
 
         return jsonify({"documents": uploaded_docs})
 
@@ -860,48 +1076,95 @@ def upload_multi_doc():
         return jsonify({"error": str(e)}), 500
 
 
-from flask import request, jsonify
-from azure.storage.blob import BlobServiceClient
-import os, requests, logging
+# ------------------ BACKGROUND JOBS ------------------
+MULTI_DOC_STAGES = ["ingest"]
 
-SEARCH_HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": os.getenv("AZURE_SEARCH_API_KEY")
-}
+
+def _extract_job(payload, progress):
+    progress.stage("download")
+    blob_client = _blob_container().get_blob_client(payload["blob_name"])
+    pdf_bytes = blob_client.download_blob().readall()
+    return run_extraction(pdf_bytes, payload["filename"], payload["pdf_id"], payload["user_id"], progress)
+
+
+def _multi_doc_job(payload, progress):
+    from ingest_multi_doc import process_blob
+
+    progress.stage("ingest")
+    summary = process_blob(payload["blob_name"], payload["filename"])
+    return {
+        "blob_name": payload["blob_name"],
+        "chunks": summary["chunks"],
+        "uploaded": summary["uploaded"],
+        "failed": len(summary["embed_failures"]) + len(summary["upload_failures"])
+    }
+
+
+job_queue.register("extract", _extract_job)
+job_queue.register("multi_doc", _multi_doc_job)
+job_queue.start()
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    if not g.uid:
+        return jsonify({"error": "Unauthorized"}), 401
+    job = job_queue.get(job_id, user_id=g.uid)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    job["job_id"] = job.pop("_id")
+    return jsonify(job)
+
+
+from flask import request, jsonify
+import os, logging
 
 def get_doc_ids_by_blob(blob_name):
     """
     Query Azure Search to get all document IDs for a given blob name.
-    Escapes single quotes for OData.
+    Pages through the results, so blobs with more than 1000 chunks are covered.
     """
-    safe_blob = blob_name.replace("'", "''")
-    search_url = f"{os.getenv('AZURE_SEARCH_ENDPOINT')}/indexes/{os.getenv('AZURE_MULTI_DOC_INDEX')}/docs/search?api-version=2023-07-01-Preview"
-    query_payload = {
-        "filter": f"metadata eq 'source:{safe_blob}'",
-        "select": "id",
-        "top": 1000
-    }
-    res = requests.post(search_url, headers=SEARCH_HEADERS, json=query_payload)
-    if res.status_code == 200:
-        docs = res.json().get("value", [])
-        return [doc["id"] for doc in docs]
-    else:
-        logging.error(f"❌ Failed to get doc IDs from Azure Search for {blob_name}: {res.text}")
+    try:
+        return sorted(get_backend("multi_doc").source_ids(blob_name))
+    except Exception as e:
+        logging.error(f"❌ Failed to get doc IDs from Azure Search for {blob_name}: {e}")
         return []
 
 def delete_from_search(blob_name):
     """Delete all indexed chunks in Azure Search for a given blob."""
+    answer_cache.invalidate(blob_name)
     doc_ids = get_doc_ids_by_blob(blob_name)
     if not doc_ids:
         logging.warning(f"⚠ No matching chunks found in Azure Search for blob {blob_name}")
         return
 
-    delete_url = f"{os.getenv('AZURE_SEARCH_ENDPOINT')}/indexes/{os.getenv('AZURE_MULTI_DOC_INDEX')}/docs/index?api-version=2023-07-01-Preview"
-    delete_payload = {
-        "value": [{"@search.action": "delete", "id": doc_id} for doc_id in doc_ids]
-    }
-    res = requests.post(delete_url, headers=SEARCH_HEADERS, json=delete_payload)
-    logging.info(f"🔄 Azure Search delete response for {blob_name}: {res.status_code} - {res.text}")
+    failed = get_backend("multi_doc").delete(doc_ids)
+    logging.info(f"🔄 Azure Search delete for {blob_name}: {len(doc_ids) - len(failed)}/{len(doc_ids)} chunks removed")
+
+
+@app.route("/reingest-blob", methods=["POST"])
+def reingest_blob():
+    """Re-index a stored blob, embedding only the chunks that changed."""
+    try:
+        data = request.get_json()
+        blob_name = data.get("blob_name")
+        if not blob_name:
+            return jsonify({"error": "Missing blob_name"}), 400
+        filename = data.get("filename") or blob_name.split("_", 1)[-1]
+
+        from ingest_multi_doc import process_blob
+        summary = process_blob(blob_name, filename, reingest=True)
+        return jsonify({
+            "blob_name": blob_name,
+            "chunks": summary["chunks"],
+            "uploaded": summary["uploaded"],
+            "unchanged": summary["unchanged"],
+            "deleted": summary["deleted"]
+        })
+
+    except Exception as e:
+        logging.error(f"❌ Re-ingest error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route("/delete-blob", methods=["POST"])
@@ -913,10 +1176,7 @@ def delete_blob():
             return jsonify({"error": "Missing blob_name"}), 400
 
         # ---------- 1. Delete from Azure Blob ----------
-        BLOB_CONN_STR = os.getenv("AZURE_BLOB_CONNECTION_STRING")
-        BLOB_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER")
-        blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
-        blob_client = blob_service.get_blob_client(BLOB_CONTAINER, blob_name)
+        blob_client = _blob_container().get_blob_client(blob_name)
         blob_client.delete_blob()
         logging.info(f"✅ Deleted blob: {blob_name}")
 
@@ -938,14 +1198,12 @@ def delete_multiple_blobs():
         if not blob_names:
             return jsonify({"error": "Missing blob_names list"}), 400
 
-        BLOB_CONN_STR = os.getenv("AZURE_BLOB_CONNECTION_STRING")
-        BLOB_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER")
-        blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
+        container_client = _blob_container()
 
         deleted_count = 0
         for blob_name in blob_names:
             try:
-                blob_client = blob_service.get_blob_client(BLOB_CONTAINER, blob_name)
+                blob_client = container_client.get_blob_client(blob_name)
                 blob_client.delete_blob()
                 logging.info(f"✅ Deleted blob: {blob_name}")
 
@@ -1028,40 +1286,35 @@ def chat_multidoc():
         if not question.strip():
             return jsonify({"error": "Question is empty"}), 400
 
-        # 1️⃣ Get embedding of the question
-        embed_payload = {"input": question, "model": os.getenv("AZURE_EMBEDDING_DEPLOYMENT")}
-        embed_res = requests.post(EMBEDDING_URL, headers=EMBEDDING_HEADERS, json=embed_payload)
-        if embed_res.status_code != 200:
+        # 0️⃣ Same question (or a near-paraphrase) over the same documents → cached answer
+        started = time.perf_counter()
+        scope = answer_cache.scope("multi_doc", blob_names)
+        cached, question_vector = lookup_answer(scope, question)
+        if cached:
+            return cached_answer_response(cached)
+
+        # 1️⃣ Embedding of the question (served from the embedding cache when seen before);
+        # computed here when the answer cache was unavailable
+        if question_vector is None:
+            question_vector = get_embedding(question)
+        if not question_vector:
             return jsonify({"error": "Embedding failed"}), 500
-        question_vector = embed_res.json()["data"][0]["embedding"]
-
-        # Escape blob_names for OData filter
-        safe_blob_names = [bn.replace("'", "''") for bn in blob_names]
-        filter_str = " or ".join([f"metadata eq 'source:{bn}'" for bn in safe_blob_names])
-
-        # 2️⃣ Query Azure Cognitive Search (Hybrid: keyword + vector)
-        search_payload = {
-            "search": question,
-            "vector": {
-                "value": question_vector,
-                "fields": "embedding",
-                "k": 20
-            },
-            "filter": filter_str,
-            "select": "content,metadata,filename"
-        }
-        search_url = f"{os.getenv('AZURE_SEARCH_ENDPOINT')}/indexes/{os.getenv('AZURE_MULTI_DOC_INDEX')}/docs/search?api-version=2023-07-01-Preview"
-        search_res = requests.post(search_url, headers=SEARCH_HEADERS, json=search_payload)
-        if search_res.status_code != 200:
+
+        # 2️⃣ Hybrid retrieval (keyword + vector) restricted to the selected blobs
+        try:
+            hits = get_backend("multi_doc").search(
+                text=question, vector=question_vector, k=20,
+                sources=blob_names, select="content,metadata,filename,page,page_end"
+            )
+        except Exception as e:
+            logging.error(f"❌ Multi-doc search failed: {e}")
             return jsonify({"error": "Search failed"}), 500
-        hits = search_res.json().get("value", [])
 
         if not hits:
             return jsonify({"answer": "No relevant content found in the selected documents."})
 
-        # 3️⃣ Use top chunks directly (like single-PDF flow)
-        top_chunks = hits[:8]  # trust Cognitive Search ranking
-        context_text = "\n\n".join([h["content"] for h in top_chunks if "content" in h])
+        # 3️⃣ Pack the best chunks (search ranking order) into the token budget
+        context_text, top_chunks, _ = build_context(hits, separator="\n\n")
 
         prompt = f"""
 You are —Chatbot a smart, human-like assistant trained to help users understand complex PDFs such as contracts, insurance policies, business reports, or legal documents.
@@ -1087,44 +1340,59 @@ Question:
 Answer:
 """
 
-        # 4️⃣ Ask Azure OpenAI
+        # 4️⃣ Ask Azure OpenAI (token stream for clients that asked for one)
+        messages = [
+            {"role": "system", "content": "Answer based only on the provided context."},
+            {"role": "user", "content": prompt}
+        ]
+        refs = _source_refs(top_chunks)
+
+        def remember(answer):
+            if scope and answer:
+                answer_cache.put(scope, question, answer, question_vector, refs, time.perf_counter() - started)
+
+        if _wants_stream():
+            return stream_chat_answer(messages, 0, refs, on_complete=remember)
+
         response = client_azure.chat.completions.create(
             model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "Answer based only on the provided context."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=messages,
             temperature=0
         )
         answer = response.choices[0].message.content.strip()
+        remember(answer)
 
         return jsonify({"answer": answer})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# ------------------ CACHE STATS ------------------
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "embedding_cache": embedding_cache.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "keyword_matchers": keyword_matchers.get_stats()
+    })
+
 #-----------------------------------------------------------------
-import os, re, chardet, fitz, smtplib, io, logging
+import os, re, fitz, smtplib, logging
 from email.mime.text import MIMEText
 from flask import request, jsonify, g
-from pymongo import MongoClient
 from datetime import datetime
 from bson import ObjectId
 
-try:
-    import docx
-except ImportError:
-    docx = None
-
 logging.basicConfig(level=logging.INFO)
 
 # ---------- MongoDB Setup ----------
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+# Reuse the process-wide client (and its connection pool) created above
+client = mongo_client
 
 db = client["pdf_data"]
 categories_col = db["categories"]
 users_collection = db["users"]
+keyword_matchers = KeywordMatcherCache(categories_col)
 
 
 
@@ -1136,60 +1404,27 @@ def load_current_user():
 
     auth_header = request.headers.get("Authorization")
     g.user_id = None
+    g.uid = None
+    g.token_claims = None
     if not auth_header or not auth_header.startswith("Bearer "):
         return
 
     token = auth_header.split(" ")[1].strip()
     try:
-        user = users_collection.find_one({"_id": ObjectId(token)})
-        if user:
-            g.user_id = user["email"]
+        # Signature, expiry and revocation are checked in-process, no DB round-trip
+        claims = token_auth.verify(token)
+        if claims:
+            g.user_id = claims["email"]
+            g.uid = claims["uid"]  # extracted records are keyed by the user's id, categories by email
+            g.token_claims = claims
     except Exception as e:
         logging.error(f"Auth error: {e}")
 
-def _safe_lower(s: str) -> str:
-    return (s or "").lower()
-
-
 EMAIL_REGEX = re.compile(r"(?i)^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$")
-OTHER = "Other"
-
-# ---------- Extract text ----------
-def extract_text_from_bytes(file_bytes: bytes, filename: str) -> str:
-    name = (filename or "").lower()
-    if name.endswith(".pdf"):
-        try:
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            text = []
-            for page in doc:
-                txt = page.get_text() or ""
-                if txt.strip():
-                    text.append(txt)
-            doc.close()
-            return _safe_lower("\n".join(text))
-        except Exception as e:
-            logging.error(f"PDF read failed: {e}")
-    if name.endswith(".docx") and docx:
-        try:
-            d = docx.Document(io.BytesIO(file_bytes))
-            return _safe_lower(" ".join(p.text for p in d.paragraphs))
-        except Exception as e:
-            logging.error(f"DOCX read failed: {e}")
-    try:
-        det = chardet.detect(file_bytes or b"")
-        enc = det.get("encoding") or "utf-8"
-        return _safe_lower(file_bytes.decode(enc, errors="ignore"))
-    except Exception:
-        return _safe_lower(file_bytes.decode("utf-8", errors="ignore"))
 
 # ---------- AI Intent ----------
 try:
-    from openai import AzureOpenAI
-    _openai_client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_API_VERSION", "2024-12-01-preview"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+    _openai_client = get_openai_client()
 except Exception:
     _openai_client = None
 
@@ -1222,36 +1457,8 @@ Document:
 
 # ---------- Classification ----------
 def classify_document(text: str, user_id: str):
-    # Fetch categories for this user
-    doc = categories_col.find_one({"user_id": user_id}, {"categories": 1})
-    if not doc or not doc.get("categories"):
-        return OTHER, None
-
-    scores = {}
-    for cat in doc["categories"]:
-        cname = (cat.get("name") or "").strip()
-        if not cname:
-            continue
-        scores[cname] = 0
-        for kw in cat.get("keywords", []):
-            kw = (kw or "").lower().strip()
-            if not kw:
-                continue
-            pattern = r"(?<!\w)" + re.escape(kw) + r"(?!\w)"
-            scores[cname] += len(re.findall(pattern, text))
-
-    if not scores:
-        return OTHER, None
-
-    best_cat = max(scores, key=scores.get)
-    if scores[best_cat] == 0:
-        return OTHER, None
-
-    for cat in doc["categories"]:
-        if (cat.get("name") or "").strip() == best_cat:
-            return best_cat, cat.get("receiver_email")
-
-    return OTHER, None
+    # Compiled once per user; the category routes invalidate it
+    return keyword_matchers.get(user_id).classify(text, default=OTHER)
 
 
 # ---------- Email ----------
@@ -1273,34 +1480,64 @@ def send_email(receiver, subject, body):
         return False, str(e)
 
 # ---------- Routes ----------
+def _classification_records(files, user_id):
+    """Per-file results as they complete, then the summary; files that never got a result are reported Failed."""
+    started = time.perf_counter()
+    results = []
+    try:
+        for result in classify_files(files, lambda text: classify_document(text, user_id), extract_intent):
+            results.append(result)
+            yield "result", result
+    except Exception as e:
+        logging.error(f"❌ Classify batch failed: {e}")
+        seen = {r["index"] for r in results}
+        for index, (filename, _) in enumerate(files):
+            if index not in seen:
+                result = {"index": index, "name": filename, "status": "Failed",
+                          "category": OTHER, "intent": "", "error": str(e)}
+                results.append(result)
+                yield "result", result
+    summary = classify_summary(results, started)
+    logging.info(f"🗂️ Classified {summary['done']}/{summary['total']} files in {summary['seconds']}s")
+    yield "done", summary
+
+
 @app.route("/classify-docs", methods=["POST"])
 def classify_docs():
+    """
+    Classify uploaded files concurrently. Returns {"results", "summary"}
+    with results in upload order; with ?stream=1 each file's result is
+    streamed as NDJSON ({"type": "result", "index", ...}) as soon as it
+    completes, and a {"type": "done", "total", "done", "failed", "seconds"}
+    record closes the stream. A file that fails has status "Failed" and an
+    "error"; the other files are unaffected.
+    """
     if not g.user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    files = request.files.getlist("files")
-    if not files:
+    uploads = request.files.getlist("files")
+    if not uploads:
         return jsonify({"error": "No files provided"}), 400
 
-    results = []
-    for fs in files:
-        filename = fs.filename or "document"
-        file_bytes = fs.read() or b""
-        text = extract_text_from_bytes(file_bytes, filename)
-
-        category, _receiver = classify_document(text, g.user_id)
-        # Always ensure a value
-        category = category or OTHER
-
-        intent = extract_intent(text)
-        results.append({
-            "name": filename,
-            "status": "Done",
-            "category": category,
-            "intent": intent
-        })
+    files = [(fs.filename or "document", fs.read() or b"") for fs in uploads]
+    records = _classification_records(files, g.user_id)
+
+    if _wants_stream():
+        def stream():
+            yield _ndjson({"type": "meta", "total": len(files), "names": [name for name, _ in files]})
+            for kind, record in records:
+                yield _ndjson({"type": kind, **record})
+        return Response(stream(), mimetype="application/x-ndjson",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    return jsonify({"results": results})
+    results, summary = [], None
+    for kind, record in records:
+        if kind == "result":
+            results.append(record)
+        else:
+            summary = record
+    results.sort(key=lambda r: r["index"])
+    return jsonify({"results": results, "summary": summary})
 
 
 @app.route("/send-classification", methods=["POST"])
@@ -1362,6 +1599,7 @@ def update_categories():
         },
         upsert=True
     )
+    keyword_matchers.invalidate(g.user_id)
     return jsonify({"message": "Category saved"})
 
 
@@ -1416,6 +1654,7 @@ def edit_category():
     if result.matched_count == 0:
         return jsonify({"error": "Category not found"}), 404
 
+    keyword_matchers.invalidate(g.user_id)
     return jsonify({"message": "Category updated"})
 
 
@@ -1445,6 +1684,7 @@ def delete_category():
     if result.modified_count == 0:
         return jsonify({"error": "Category not found"}), 404
 
+    keyword_matchers.invalidate(g.user_id)
     return jsonify({"message": f"Category '{name}' deleted successfully"})
 
 @app.route("/")
@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Required: signing key shared by every worker and instance, e.g. python -c "import secrets; print(secrets.token_urlsafe(32))".
+# Changing it signs everyone out.
+AUTH_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET")
+AUTH_TOKEN_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", str(12 * 3600)))
+# How often each process reloads the revocation list written by other instances
+AUTH_REVOCATION_REFRESH_SECONDS = float(os.getenv("AUTH_REVOCATION_REFRESH_SECONDS", "30"))
+# Opt-in: accept the old raw user-id tokens (one cached DB lookup each) while users log in again,
+# never on or after AUTH_LEGACY_TOKENS_UNTIL (ISO date, UTC) when that is set
+AUTH_ACCEPT_LEGACY_TOKENS = os.getenv("AUTH_ACCEPT_LEGACY_TOKENS", "0").lower() in ("1", "true", "yes")
+AUTH_LEGACY_TOKENS_UNTIL = os.getenv("AUTH_LEGACY_TOKENS_UNTIL")
+AUTH_LEGACY_TOKENS_UNTIL = datetime.fromisoformat(AUTH_LEGACY_TOKENS_UNTIL) if AUTH_LEGACY_TOKENS_UNTIL else None
+AUTH_LEGACY_CACHE_SECONDS = int(os.getenv("AUTH_LEGACY_CACHE_SECONDS", "300"))
+
+if AUTH_ACCEPT_LEGACY_TOKENS and not AUTH_LEGACY_TOKENS_UNTIL:
+    logging.warning("⚠️ Legacy user-id tokens are accepted with no end date: set AUTH_LEGACY_TOKENS_UNTIL")
+
+
+def _legacy_accepted():
+    if not AUTH_ACCEPT_LEGACY_TOKENS:
+        return False
+    return AUTH_LEGACY_TOKENS_UNTIL is None or datetime.utcnow() < AUTH_LEGACY_TOKENS_UNTIL
+
+
+class TTLCache:
+    """Small thread-safe dict whose entries expire `ttl` seconds after they were set."""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                now = time.monotonic()
+                for k in [k for k, (_, exp) in self._data.items() if exp < now]:
+                    del self._data[k]
+                if len(self._data) >= self.max_entries:
+                    self._data.pop(next(iter(self._data)))
+            self._data[key] = (value, time.monotonic() + self.ttl)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class TokenAuth:
+    """
+    Signed, expiring bearer tokens verified in-process.
+
+    A token carries the user id and email, a token id (jti) and the user's
+    token_version. Logout revokes one jti; a password change bumps the
+    version, revoking every older token of the user. Revocations are stored in `revocations`
+    (expiring with the tokens they cover) and mirrored in memory: the
+    process that revokes sees it at once, other processes on their next
+    refresh.
+
+    Legacy user-id tokens can't expire on their own: revoking one (logout
+    or password change) sets users.legacy_revoked, which ends every legacy
+    session of the user for good.
+    """
+
+    def __init__(self, users, revocations, secret=AUTH_TOKEN_SECRET, ttl=AUTH_TOKEN_TTL_SECONDS):
+        if not secret:
+            raise RuntimeError("❌ Missing AUTH_TOKEN_SECRET in .env: tokens must be signed with a key shared by all workers")
+        self.users = users
+        self.revocations = revocations
+        self.ttl = ttl
+        self._serializer = URLSafeTimedSerializer(secret, salt="smartdoc-auth")
+        self._revoked_ids = set()
+        self._min_version = {}           # user id → lowest token_version still valid
+        self._refreshed = 0.0
+        self._lock = threading.Lock()
+        self._legacy = TTLCache(AUTH_LEGACY_CACHE_SECONDS)
+
+    # ---------- Issue ----------
+    def issue(self, user):
+        return self._serializer.dumps({
+            "uid": str(user["_id"]),
+            "email": user["email"],
+            "jti": uuid.uuid4().hex,
+            "ver": user.get("token_version", 0),
+        })
+
+    # ---------- Verify ----------
+    def _refresh(self):
+        if time.monotonic() - self._refreshed < AUTH_REVOCATION_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if time.monotonic() - self._refreshed < AUTH_REVOCATION_REFRESH_SECONDS:
+                return
+            try:
+                revoked, min_version = set(), {}
+                for doc in self.revocations.find({"expires_at": {"$gt": datetime.utcnow()}}):
+                    if doc.get("jti"):
+                        revoked.add(doc["jti"])
+                    elif doc.get("user_id"):
+                        min_version[doc["user_id"]] = doc["min_version"]
+                self._revoked_ids, self._min_version = revoked, min_version
+            except Exception as e:
+                # Keep the last known list; retry on the next refresh
+                logging.error(f"❌ Could not refresh token revocations: {e}")
+            self._refreshed = time.monotonic()
+
+    def verify(self, token):
+        """Claims of a valid token ({"uid", "email", "jti", "ver", "iat"}), else None."""
+        if ObjectId.is_valid(token):
+            return self._verify_legacy(token) if _legacy_accepted() else None
+        try:
+            claims, signed_at = self._serializer.loads(token, max_age=self.ttl, return_timestamp=True)
+        except (SignatureExpired, BadSignature):
+            return None
+        claims["iat"] = signed_at.timestamp()
+        self._refresh()
+        if claims["jti"] in self._revoked_ids:
+            return None
+        if claims.get("ver", 0) < self._min_version.get(claims["uid"], 0):
+            return None
+        return claims
+
+    def _verify_legacy(self, token):
+        claims = self._legacy.get(token)
+        if claims is None:
+            user = self.users.find_one({"_id": ObjectId(token)}, {"email": 1, "legacy_revoked": 1})
+            claims = False
+            if user and not user.get("legacy_revoked"):
+                claims = {"uid": token, "email": user["email"], "jti": None, "ver": None, "iat": None}
+            self._legacy.set(token, claims)
+        return claims or None
+
+    # ---------- Revoke ----------
+    def revoke(self, claims):
+        """Revoke one token (logout)."""
+        if not claims.get("jti"):
+            self.users.update_one({"_id": ObjectId(claims["uid"])}, {"$set": {"legacy_revoked": True}})
+            self._legacy.pop(claims["uid"])
+            return
+        expires_at = datetime.utcfromtimestamp(claims["iat"]) + timedelta(seconds=self.ttl)
+        self.revocations.update_one(
+            {"_id": f"jti:{claims['jti']}"},
+            {"$set": {"jti": claims["jti"], "expires_at": expires_at}},
+            upsert=True
+        )
+        with self._lock:
+            self._revoked_ids.add(claims["jti"])
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued so far to a user (password change); returns the updated user."""
+        user = self.users.find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            {"$inc": {"token_version": 1}, "$set": {"legacy_revoked": True}},
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            return None
+        self.revocations.update_one(
+            {"_id": f"user:{user_id}"},
+            {"$set": {
+                "user_id": user_id,
+                "min_version": user["token_version"],
+                "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)
+            }},
+            upsert=True
+        )
+        with self._lock:
+            self._min_version[user_id] = user["token_version"]
+        self._legacy.pop(user_id)
+        return user
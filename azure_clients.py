@@ -0,0 +1,106 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+# Completions run much longer than Search/Blob calls and are billed per attempt:
+# the SDK's own defaults (600s, 2 retries) unless overridden
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "600"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_sessions = {}
+_blob_services = {}
+_openai_client = None
+
+
+# ------------------ Pooled HTTP Sessions ------------------
+class _PooledSession(requests.Session):
+    """Session that applies the configured timeouts unless a call passes its own."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+def _build_session():
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=None,             # embedding/search/index calls are safe to repeat
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        backoff_jitter=HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = _PooledSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(name):
+    """
+    Process-wide keep-alive session per endpoint ("openai", "search", ...),
+    with bounded retries and jittered backoff on 429/5xx honoring Retry-After.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = _build_session()
+    return session
+
+
+# ------------------ SDK Clients ------------------
+def get_blob_service(conn_str=None):
+    """Singleton BlobServiceClient (one per connection string)."""
+    from azure.storage.blob import BlobServiceClient
+
+    conn_str = conn_str or os.getenv("AZURE_BLOB_CONNECTION_STRING")
+    client = _blob_services.get(conn_str)
+    if client is None:
+        with _lock:
+            client = _blob_services.get(conn_str)
+            if client is None:
+                client = _blob_services[conn_str] = BlobServiceClient.from_connection_string(
+                    conn_str,
+                    connection_timeout=HTTP_CONNECT_TIMEOUT,
+                    read_timeout=HTTP_READ_TIMEOUT,
+                    retry_total=HTTP_MAX_RETRIES,
+                )
+    return client
+
+
+def get_openai_client():
+    """Singleton AzureOpenAI client; the SDK keeps its own connection pool."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AzureOpenAI
+
+        with _lock:
+            if _openai_client is None:
+                _openai_client = AzureOpenAI(
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    api_version=os.getenv("AZURE_API_VERSION", "2024-12-01-preview"),
+                    max_retries=OPENAI_MAX_RETRIES,
+                    timeout=OPENAI_TIMEOUT,
+                )
+    return _openai_client
@@ -0,0 +1,129 @@
+"""
+Benchmark the /compare paragraph matcher on synthetic contract pairs.
+
+    python bench_compare.py --paragraphs 3000 --legacy-max 1500
+
+Builds a contract of N paragraphs, derives a revised version (edited
+clauses, changed amounts and dates, deletions, insertions, a moved
+section) and times the previous greedy fuzz.ratio/partial_ratio loop
+against compare_engine.compare_paragraphs. The legacy loop is quadratic
+in pure Python, so it is skipped above --legacy-max paragraphs.
+"""
+import time
+import random
+import argparse
+from rapidfuzz import fuzz
+from compare_engine import compare_paragraphs
+
+PARA_MATCH_THRESHOLD = 80
+MIN_PARTIAL_THRESHOLD = 60
+
+WORDS = (
+    "insured policy premium benefit claim hospital treatment exclusion coverage period "
+    "sum assured nominee maturity rider waiting surrender renewal grace notice insurer "
+    "liability accident illness disease condition expense payable shall company terms"
+).split()
+
+
+def make_contract(n, rng):
+    paras = []
+    for k in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(25, 70))]
+        paras.append(
+            f"{k + 1}. " + " ".join(words).capitalize()
+            + f" Amount Rs. {rng.randint(1, 99) * 1000} payable by {rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2024."
+        )
+    return paras
+
+
+def revise(paras, rng):
+    out = []
+    for p in paras:
+        roll = rng.random()
+        if roll < 0.05:
+            continue                                   # deleted clause
+        if roll < 0.20:
+            words = p.split()
+            for _ in range(max(1, len(words) // 15)):  # light edits
+                words[rng.randrange(len(words))] = rng.choice(WORDS)
+            p = " ".join(words)
+        elif roll < 0.25:
+            p = p.replace("Rs. ", "Rs. 1")             # changed amount
+        out.append(p)
+        if rng.random() < 0.03:
+            out.append(" ".join(rng.choice(WORDS) for _ in range(40)).capitalize() + ".")  # inserted clause
+    if len(out) > 40:                                  # moved section
+        start = len(out) // 3
+        section = out[start:start + 20]
+        del out[start:start + 20]
+        out.extend(section)
+    return out
+
+
+def legacy_match(paras1, paras2):
+    """The pre-engine greedy loop (paragraph level only)."""
+    matched_2 = set()
+    plan = []
+    for i, p1 in enumerate(paras1):
+        best_score, best_j = -1, None
+        for j, p2 in enumerate(paras2):
+            if j in matched_2:
+                continue
+            score = fuzz.ratio(p1, p2)
+            if score > best_score:
+                best_score, best_j = score, j
+        if best_score >= PARA_MATCH_THRESHOLD and best_j is not None:
+            plan.append(("same", i, best_j))
+            matched_2.add(best_j)
+            continue
+        best_score, best_j = -1, None
+        for j, p2 in enumerate(paras2):
+            if j in matched_2:
+                continue
+            score = fuzz.partial_ratio(p1, p2)
+            if score > best_score:
+                best_score, best_j = score, j
+        if best_j is None or best_score < MIN_PARTIAL_THRESHOLD:
+            plan.append(("removed", i, None))
+        else:
+            plan.append(("partial", i, best_j))
+            matched_2.add(best_j)
+    return plan
+
+
+def summarize(plan):
+    counts = {"same": 0, "partial": 0, "removed": 0}
+    for status, _, _ in plan:
+        counts[status] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[300, 1000, 3000])
+    parser.add_argument("--legacy-max", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for n in args.paragraphs:
+        rng = random.Random(args.seed)
+        paras1 = make_contract(n, rng)
+        paras2 = revise(paras1, rng)
+
+        t0 = time.perf_counter()
+        plan, new = compare_paragraphs(paras1, paras2, PARA_MATCH_THRESHOLD, MIN_PARTIAL_THRESHOLD)
+        engine_s = time.perf_counter() - t0
+        line = f"{n:>6} vs {len(paras2):>6} paragraphs | engine {engine_s:7.3f}s {summarize(plan)} new={len(new)}"
+
+        if n <= args.legacy_max:
+            t0 = time.perf_counter()
+            legacy = legacy_match(paras1, paras2)
+            legacy_s = time.perf_counter() - t0
+            line += f" | legacy {legacy_s:7.3f}s {summarize(legacy)} | x{legacy_s / engine_s:.1f}"
+        else:
+            line += " | legacy skipped"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import re
+from dotenv import load_dotenv
+from embeddings import estimate_tokens
+
+load_dotenv()
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+
+# ------------------ Units ------------------
+_SENTENCE = re.compile(r"\S.*?(?:[.!?;:](?=\s)|$)", re.DOTALL)
+_WORD = re.compile(r"\S+")
+_JOIN_TOKENS = 1  # the "\n" between two units of a chunk
+
+
+def _largest_fitting(n, fits):
+    """Largest k in 1..n with fits(k) (fits is monotone: true up to some k); 0 when even 1 doesn't fit."""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _token_windows(text, spans, max_tokens):
+    """
+    Cut `text` into windows of consecutive spans (word or character
+    (start, end) pairs), each as long as its measured token count allows.
+    """
+    windows = []
+    i = 0
+    while i < len(spans):
+        start = spans[i][0]
+        k = _largest_fitting(
+            len(spans) - i, lambda k: estimate_tokens(text[start:spans[i + k - 1][1]]) <= max_tokens
+        )
+        if k == 0:
+            if spans[i][1] - start > 1:
+                # one "word" over budget on its own (e.g. a long encoded string): split its characters
+                chars = [(c, c + 1) for c in range(start, spans[i][1])]
+                windows.extend(_token_windows(text, chars, max_tokens))
+                i += 1
+                continue
+            k = 1
+        windows.append((start, spans[i + k - 1][1]))
+        i += k
+    return windows
+
+
+def _split_oversized(text, start, max_tokens):
+    """Split a block that alone exceeds the budget at sentence, then word, boundaries."""
+    pieces = []
+    for m in _SENTENCE.finditer(text):
+        sent, s_start = m.group(0), start + m.start()
+        if estimate_tokens(sent) <= max_tokens:
+            pieces.append((sent, s_start))
+            continue
+        # a single run-on "sentence": fall back to word windows grown by measured tokens
+        words = [w.span() for w in _WORD.finditer(sent)]
+        for a, b in _token_windows(sent, words, max_tokens):
+            pieces.append((sent[a:b], s_start + a))
+    return pieces
+
+
+def _tail(unit, budget):
+    """
+    The longest run of trailing sentences of a unit that fits in `budget`
+    tokens (trailing words if not even the last sentence fits), as a unit
+    with its offsets; None if nothing fits.
+    """
+    text, page, start, end, _ = unit
+    if budget <= 0:
+        return None
+    for pattern in (_SENTENCE, _WORD):
+        starts = [m.start() for m in pattern.finditer(text)][1:]  # the whole unit is known not to fit
+        n = _largest_fitting(len(starts), lambda k: estimate_tokens(text[starts[-k]:]) <= budget)
+        if n:
+            piece = text[starts[-n]:]
+            return piece, page, start + starts[-n], end, estimate_tokens(piece)
+    return None
+
+
+def _page_units(page, max_tokens):
+    """(text, page_number, char_start, char_end, tokens) for each block of a page."""
+    units = []
+    offset = 0
+    for block in page.blocks:
+        tokens = estimate_tokens(block)
+        if tokens <= max_tokens:
+            units.append((block, page.number, offset, offset + len(block), tokens))
+        else:
+            for piece, start in _split_oversized(block, offset, max_tokens):
+                units.append((piece, page.number, start, start + len(piece), estimate_tokens(piece)))
+        offset += len(block) + 1  # blocks are joined with "\n" in page.text
+    return units
+
+
+# ------------------ Chunking ------------------
+def _make_chunk(units):
+    first, last = units[0], units[-1]
+    return {
+        "content": "\n".join(u[0] for u in units),
+        "page": first[1],
+        "page_end": last[1],
+        "char_start": first[2],
+        "char_end": last[3],
+        "tokens": estimate_tokens("\n".join(u[0] for u in units)),
+    }
+
+
+def chunk_pages(pages, max_tokens=None, overlap_tokens=None):
+    """
+    Pack page blocks into chunks of at most `max_tokens` tokens.
+
+    Blocks (paragraphs / tables) are never split unless a single block is
+    over budget, and then only into pieces measured to fit. Consecutive
+    chunks share up to `overlap_tokens` tokens: whole trailing blocks, or
+    the trailing sentences (or words) of the last block when it is larger
+    than the overlap. Chunks may run across a page break so sparse
+    pages don't each take an index slot. Every chunk records the page and
+    character offsets (into PageText.text) where it starts and ends.
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+
+    current, current_tokens = [], 0
+    fresh = 0  # units in `current` that are not overlap carried from the previous chunk
+    for page in pages:
+        for unit in _page_units(page, max_tokens):
+            if current and current_tokens + _JOIN_TOKENS + unit[4] > max_tokens:
+                yield _make_chunk(current)
+                # every carried unit costs its tokens plus the join that follows it
+                budget = min(overlap_tokens, max_tokens - unit[4])
+                carried, carried_tokens = [], 0
+                for prev in reversed(current):
+                    room = budget - carried_tokens - _JOIN_TOKENS
+                    if prev[4] > room:
+                        # blocks are usually bigger than the overlap: carry the end of this one
+                        part = _tail(prev, room)
+                        if part:
+                            carried.insert(0, part)
+                            carried_tokens += part[4] + _JOIN_TOKENS
+                        break
+                    carried.insert(0, prev)
+                    carried_tokens += prev[4] + _JOIN_TOKENS
+                current, fresh = carried, 0
+                current_tokens = carried_tokens - _JOIN_TOKENS if carried else 0
+            current_tokens += unit[4] + (_JOIN_TOKENS if current else 0)
+            current.append(unit)
+            fresh += 1
+    if current and fresh:
+        yield _make_chunk(current)
@@ -0,0 +1,175 @@
+"""
+Concurrent /classify-docs pipeline.
+
+Text extraction (PDF parsing, charset detection) is CPU-bound and runs on
+a process pool; the intent call is I/O-bound and runs on a bounded thread
+pool shared by all requests, which caps concurrent LLM calls per process.
+Keyword classification is cheap and runs between the two. Results are
+yielded as each file finishes, tagged with the file's upload index.
+"""
+import io
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import chardet
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+load_dotenv()
+
+# 0 = one per CPU; 1 extracts on the intent threads instead of worker processes
+CLASSIFY_EXTRACT_WORKERS = int(os.getenv("CLASSIFY_EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+# Concurrent intent (LLM) calls per process, across all requests
+CLASSIFY_INTENT_WORKERS = int(os.getenv("CLASSIFY_INTENT_WORKERS", "8"))
+
+OTHER = "Other"
+
+
+# ------------------ Text Extraction ------------------
+def _safe_lower(s: str) -> str:
+    return (s or "").lower()
+
+
+def extract_text_from_bytes(file_bytes: bytes, filename: str) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".pdf"):
+        try:
+            doc = fitz.open(stream=file_bytes, filetype="pdf")
+            text = []
+            for page in doc:
+                txt = page.get_text() or ""
+                if txt.strip():
+                    text.append(txt)
+            doc.close()
+            return _safe_lower("\n".join(text))
+        except Exception as e:
+            logging.error(f"PDF read failed: {e}")
+    if name.endswith(".docx") and docx:
+        try:
+            d = docx.Document(io.BytesIO(file_bytes))
+            return _safe_lower(" ".join(p.text for p in d.paragraphs))
+        except Exception as e:
+            logging.error(f"DOCX read failed: {e}")
+    try:
+        det = chardet.detect(file_bytes or b"")
+        enc = det.get("encoding") or "utf-8"
+        return _safe_lower(file_bytes.decode(enc, errors="ignore"))
+    except Exception:
+        return _safe_lower(file_bytes.decode("utf-8", errors="ignore"))
+
+
+# ------------------ Pools ------------------
+_extract_pool = None
+_intent_pool = ThreadPoolExecutor(max_workers=CLASSIFY_INTENT_WORKERS, thread_name_prefix="classify-intent")
+_pool_lock = threading.Lock()
+
+
+def _get_extract_pool():
+    """The shared extraction process pool, started on first use (None when extracting inline)."""
+    global _extract_pool
+    if CLASSIFY_EXTRACT_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _extract_pool is None:
+            # spawn keeps the Mongo client and app threads out of the workers
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=CLASSIFY_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _extract_pool
+
+
+def _reset_extract_pool(pool):
+    """Drop a broken pool (a worker died) so the next batch starts a fresh one."""
+    global _extract_pool
+    with _pool_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_extract(file_bytes, filename):
+    pool = _get_extract_pool()
+    if pool is None:
+        return _intent_pool.submit(extract_text_from_bytes, file_bytes, filename), None
+    try:
+        return pool.submit(extract_text_from_bytes, file_bytes, filename), pool
+    except RuntimeError:
+        # Pool shut down or broken by an earlier batch
+        _reset_extract_pool(pool)
+        pool = _get_extract_pool()
+        return pool.submit(extract_text_from_bytes, file_bytes, filename), pool
+
+
+# ------------------ Pipeline ------------------
+def classify_files(files, classify, extract_intent):
+    """
+    Classify uploaded files concurrently.
+
+    `files` is a list of (filename, bytes). `classify(text)` returns
+    (category, receiver) and `extract_intent(text)` the intent sentence.
+    Yields one result per file in completion order:
+
+        {"index", "name", "status": "Done", "category", "intent"}
+        {"index", "name", "status": "Failed", "category": "Other", "intent": "", "error"}
+
+    `index` is the file's position in `files`. A failing file never stops
+    the others. Stopping the generator early (client disconnect) cancels
+    work that has not started yet.
+    """
+    stages = {}          # future → ("extract", index, pool) or ("intent", index, category)
+
+    def failed(index, error):
+        logging.error(f"❌ Classify failed for {files[index][0]}: {error}")
+        return {"index": index, "name": files[index][0], "status": "Failed",
+                "category": OTHER, "intent": "", "error": str(error)}
+
+    for index, (filename, file_bytes) in enumerate(files):
+        future, pool = _submit_extract(file_bytes, filename)
+        stages[future] = ("extract", index, pool)
+
+    try:
+        while stages:
+            done, _ = wait(stages, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index, payload = stages.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        _reset_extract_pool(payload)
+                    yield failed(index, e)
+                    continue
+
+                if stage == "extract":
+                    try:
+                        category, _receiver = classify(result)
+                    except Exception as e:
+                        yield failed(index, e)
+                        continue
+                    stages[_intent_pool.submit(extract_intent, result)] = ("intent", index, category or OTHER)
+                else:
+                    yield {"index": index, "name": files[index][0], "status": "Done",
+                           "category": payload, "intent": result}
+    finally:
+        for future in stages:
+            future.cancel()
+
+
+def classify_summary(results, started):
+    """Closing record of a batch."""
+    done = sum(1 for r in results if r["status"] == "Done")
+    return {
+        "total": len(results),
+        "done": done,
+        "failed": len(results) - done,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
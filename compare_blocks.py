@@ -0,0 +1,263 @@
+import os
+import re
+import uuid
+from functools import lru_cache
+from datetime import datetime
+import fitz  # PyMuPDF
+from dateutil import parser as dateparser
+import diff_match_patch as dmp_module
+from pymongo import ASCENDING
+from dotenv import load_dotenv
+from compare_engine import iter_compare_paragraphs, compare_lines, text_hash
+
+load_dotenv()
+
+# ---------- Config ----------
+PARA_MATCH_THRESHOLD = 80   # lower to catch minor changes
+LINE_MATCH_THRESHOLD = 85   # slightly lower for OCR tolerance
+MIN_PARTIAL_THRESHOLD = 60
+
+# Blocks returned per page of GET /compare/<id>/blocks (and by ?format=blocks)
+COMPARE_PAGE_SIZE = int(os.getenv("COMPARE_PAGE_SIZE", "200"))
+COMPARE_MAX_PAGE_SIZE = int(os.getenv("COMPARE_MAX_PAGE_SIZE", "1000"))
+
+DATE_RE = re.compile(r"\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b")
+NUMERIC_RE = re.compile(r"\b\d+(?:\.\d+)?\b")  # matches integers and decimals
+
+# ---------- Helpers ----------
+
+def normalize_whitespace(text: str) -> str:
+    text = text.replace('\r', '\n')
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = "\n".join(ln.strip() for ln in text.splitlines())
+    return text.strip()
+
+_DATE_PARTS_RE = re.compile(r"(\d{1,2})[-/](\d{1,2})[-/](\d{4})")
+
+@lru_cache(maxsize=8192)
+def normalize_date(token: str) -> str:
+    """One DATE_RE match as dd-mm-yyyy (day first), or unchanged if it isn't a date."""
+    # Fast path: day-first with a 4-digit year needs no parser
+    m = _DATE_PARTS_RE.fullmatch(token)
+    if m:
+        day, month, year = (int(g) for g in m.groups())
+        try:
+            return datetime(year, month, day).strftime("%d-%m-%Y")
+        except ValueError:
+            pass
+    try:
+        d = dateparser.parse(token, dayfirst=True)
+        return d.strftime("%d-%m-%Y")
+    except Exception:
+        return token
+
+def normalize_dates(text: str) -> str:
+    return DATE_RE.sub(lambda m: normalize_date(m.group(0)), text)
+
+
+class TextRecord:
+    """
+    A paragraph or line with the features the diff compares, computed once:
+    numeric tokens, normalized dates and a hash of the text.
+    """
+    __slots__ = ("text", "page", "numbers", "dates", "hash")
+
+    def __init__(self, text, page=None):
+        self.text = text
+        self.page = page
+        self.numbers = tuple(NUMERIC_RE.findall(text))
+        self.dates = tuple(normalize_date(d) for d in DATE_RE.findall(text))
+        self.hash = text_hash(text)
+
+    def lines(self):
+        return [TextRecord(ln.strip(), self.page) for ln in self.text.splitlines() if ln.strip()]
+
+
+def values_changed(a: TextRecord, b: TextRecord) -> bool:
+    """Whether numeric or date values differ between two records."""
+    return a.numbers != b.numbers or a.dates != b.dates
+
+def extract_paragraphs_with_pages(file_bytes: bytes):
+    """Paragraph records in reading order, page numbers 1-based."""
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    paras = []
+    for page_no, page in enumerate(doc, start=1):
+        raw = page.get_text("text") or ""
+        raw = normalize_whitespace(raw)
+        # Split on blank lines OR newline + capital letter
+        for p in re.split(r"(?:\n\s*\n)|(?:\n(?=[A-Z]))", raw):
+            p = p.strip()
+            if p:
+                paras.append(TextRecord(normalize_dates(p), page_no))
+    doc.close()
+    return paras
+
+def word_ops(a: TextRecord, b: TextRecord):
+    """
+    Word-level diff as [[op, text], ...] with op 0 = same, -1 = removed,
+    1 = new, plus whether a number/date changed (then the whole of `a` is
+    removed and the whole of `b` is new).
+    """
+    if values_changed(a, b):
+        return [[-1, a.text], [1, b.text]], True
+
+    dmp = dmp_module.diff_match_patch()
+    diffs = dmp.diff_main(a.text, b.text)
+    dmp.diff_cleanupSemantic(diffs)
+    return [[op, data] for op, data in diffs], False
+
+# ------------------ Blocks ------------------
+# A comparison is a list of blocks in reading order:
+#   {"seq", "type": "para", "status": "same" | "partial" | "removed" | "new",
+#    "page1", "page2", "ops": [[op, text], ...], "value_changed"}
+# "partial" blocks carry "lines" ({"status", "ops", "value_changed"}) instead
+# of "ops"; "removed" / "new" blocks have a single op holding the paragraph.
+
+def _line_blocks(p1, p2):
+    lines1, lines2 = p1.lines(), p2.lines()
+    line_plan, new_lines = compare_lines(
+        [ln.text for ln in lines1], [ln.text for ln in lines2], LINE_MATCH_THRESHOLD, MIN_PARTIAL_THRESHOLD,
+        [ln.hash for ln in lines1], [ln.hash for ln in lines2]
+    )
+    lines = []
+    for status, li, lj in line_plan:
+        if status == "removed":
+            lines.append({"status": "removed", "ops": [[-1, lines1[li].text]], "value_changed": False})
+        else:
+            ops, value_changed = word_ops(lines1[li], lines2[lj])
+            lines.append({"status": status, "ops": ops, "value_changed": value_changed})
+    # New lines in p2 not matched
+    for lj in new_lines:
+        lines.append({"status": "new", "ops": [[1, lines2[lj].text]], "value_changed": False})
+    return lines
+
+def iter_compare_blocks(paras1, paras2):
+    """
+    Blocks for two documents given as paragraph records. Once the
+    whole-document paragraph matching is done, blocks are yielded one at a
+    time: first one per paragraph of the first document, then the
+    paragraphs of the second one that were never matched.
+    """
+    plan = iter_compare_paragraphs(
+        [p.text for p in paras1], [p.text for p in paras2], PARA_MATCH_THRESHOLD, MIN_PARTIAL_THRESHOLD,
+        [p.hash for p in paras1], [p.hash for p in paras2]
+    )
+    for seq, (status, i, j) in enumerate(plan, start=1):
+        block = {
+            "seq": seq,
+            "type": "para",
+            "status": status,
+            "page1": paras1[i].page if i is not None else None,
+            "page2": paras2[j].page if j is not None else None,
+        }
+        if status == "same":
+            block["ops"], block["value_changed"] = word_ops(paras1[i], paras2[j])
+        elif status == "partial":
+            block["lines"] = _line_blocks(paras1[i], paras2[j])
+        elif status == "removed":
+            block["ops"], block["value_changed"] = [[-1, paras1[i].text]], False
+        else:
+            block["ops"], block["value_changed"] = [[1, paras2[j].text]], False
+        yield block
+
+def iter_block_pages(blocks):
+    """
+    Group consecutive blocks by the page they belong to: page1 for the
+    first document's paragraphs, page2 for new ones. Yields (doc, page, blocks).
+    """
+    key, batch = None, []
+    for block in blocks:
+        k = (2, block["page2"]) if block["status"] == "new" else (1, block["page1"])
+        if batch and k != key:
+            yield key[0], key[1], batch
+            batch = []
+        key = k
+        batch.append(block)
+    if batch:
+        yield key[0], key[1], batch
+
+# ------------------ HTML View ------------------
+_OP_CLASS = {0: "same", -1: "removed", 1: "new"}
+
+def ops_html(ops, value_changed=False) -> str:
+    # Number/date changes are shown as whole removed/new spans, line breaks kept as-is
+    parts = []
+    for op, data in ops:
+        txt = data if value_changed else data.replace("\n", "<br/>")
+        parts.append(f'<span class="{_OP_CLASS[op]}">{txt}</span>')
+    return "".join(parts)
+
+def block_html(block) -> str:
+    status = block["status"]
+    if status == "same":
+        return f'<div class="para same">{ops_html(block["ops"], block["value_changed"])}</div>'
+    if status in ("removed", "new"):
+        return f'<div class="para {status}">{block["ops"][0][1]}</div>'
+    para_html = ['<div class="para">']
+    for line in block["lines"]:
+        if line["status"] in ("removed", "new"):
+            para_html.append(f'<div class="line {line["status"]}">{line["ops"][0][1]}</div>')
+        else:
+            para_html.append(f'<div class="line {line["status"]}">{ops_html(line["ops"], line["value_changed"])}</div>')
+    para_html.append('</div>')
+    return "".join(para_html)
+
+def render_html(blocks) -> str:
+    return '<div class="compare-output">' + "\n".join(block_html(b) for b in blocks) + '</div>'
+
+# ------------------ Stored Comparisons ------------------
+class ComparisonStore:
+    """
+    Comparison results kept in MongoDB so clients can page through them:
+    one header document per comparison and one document per block, keyed
+    by (comparison_id, seq). Both carry created_at, which the TTL indexes in
+    mongo_indexes.INDEX_SPEC expire after COMPARE_RETENTION_SECONDS.
+    """
+
+    def __init__(self, comparisons, blocks):
+        self.comparisons = comparisons
+        self.blocks = blocks
+
+    def create(self, **fields):
+        comparison_id = str(uuid.uuid4())
+        self.comparisons.insert_one({
+            "_id": comparison_id,
+            "status": "running",
+            "total": 0,
+            "created_at": datetime.utcnow(),
+            **fields,
+        })
+        return comparison_id
+
+    def append(self, comparison_id, blocks):
+        if blocks:
+            now = datetime.utcnow()
+            self.blocks.insert_many(
+                [{**b, "comparison_id": comparison_id, "created_at": now} for b in blocks], ordered=False
+            )
+
+    def finish(self, comparison_id, total, status="done", error=None):
+        self.comparisons.update_one(
+            {"_id": comparison_id},
+            {"$set": {"status": status, "total": total, "error": error, "finished_at": datetime.utcnow()}}
+        )
+
+    def get(self, comparison_id, user_id=None):
+        """The comparison; with `user_id`, only when that user created it."""
+        query = {"_id": comparison_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return self.comparisons.find_one(query)
+
+    def page(self, comparison_id, cursor=0, limit=None):
+        """Blocks with seq > `cursor`, at most `limit`; returns (blocks, next_cursor or None)."""
+        limit = max(1, min(limit or COMPARE_PAGE_SIZE, COMPARE_MAX_PAGE_SIZE))
+        docs = list(
+            self.blocks.find({"comparison_id": comparison_id, "seq": {"$gt": cursor}}, {"_id": 0, "comparison_id": 0, "created_at": 0})
+            .sort("seq", ASCENDING)
+            .limit(limit + 1)
+        )
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        return docs, (docs[-1]["seq"] if has_more else None)
@@ -0,0 +1,220 @@
+import os
+import hashlib
+from collections import defaultdict, deque
+import numpy as np
+from rapidfuzz import fuzz, process
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Threads used by rapidfuzz.process.cdist (-1 = all cores)
+COMPARE_WORKERS = int(os.getenv("COMPARE_WORKERS", "-1"))
+# Largest residual score matrix aligned with the order-preserving DP;
+# bigger ones are matched greedily by score only
+COMPARE_DP_MAX_CELLS = int(os.getenv("COMPARE_DP_MAX_CELLS", str(25_000_000)))
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+# ------------------ Matching Steps ------------------
+def anchor_identical(items_a, items_b, hashes_a=None, hashes_b=None):
+    """
+    Pair identical items by hash, k-th occurrence with k-th occurrence.
+    Returns {i: j}.
+    """
+    hashes_a = hashes_a or [text_hash(t) for t in items_a]
+    hashes_b = hashes_b or [text_hash(t) for t in items_b]
+    positions = defaultdict(deque)
+    for j, h in enumerate(hashes_b):
+        positions[h].append(j)
+    pairs = {}
+    for i, h in enumerate(hashes_a):
+        if positions.get(h):
+            pairs[i] = positions[h].popleft()
+    return pairs
+
+
+def score_matrix(items_a, items_b, scorer=fuzz.ratio, cutoff=0):
+    """All-pairs similarity as a uint8 matrix (scores under `cutoff` are 0)."""
+    if not items_a or not items_b:
+        return np.zeros((len(items_a), len(items_b)), dtype=np.uint8)
+    return process.cdist(
+        items_a, items_b, scorer=scorer, score_cutoff=cutoff,
+        dtype=np.uint8, workers=COMPARE_WORKERS
+    )
+
+
+def monotone_alignment(scores):
+    """
+    Order-preserving assignment: the set of pairs (i, j) with nonzero score,
+    increasing in both i and j, that maximizes the total score (a weighted
+    LCS). Each DP row is computed with vectorized NumPy ops.
+    """
+    n, m = scores.shape
+    table = np.zeros((n + 1, m + 1), dtype=np.int32)
+    for i in range(1, n + 1):
+        row = scores[i - 1].astype(np.int32)
+        prev = table[i - 1]
+        candidate = np.maximum(prev[1:], np.where(row > 0, prev[:-1] + row, 0))
+        table[i, 1:] = np.maximum.accumulate(candidate)
+
+    pairs = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        if table[i, j] == table[i - 1, j]:
+            i -= 1
+        elif table[i, j] == table[i, j - 1]:
+            j -= 1
+        else:
+            pairs.append((i - 1, j - 1))
+            i -= 1
+            j -= 1
+    pairs.reverse()
+    return pairs
+
+
+def greedy_assignment(scores, rows=None, cols=None):
+    """Highest scores first over the given rows/columns; pairs (i, j) with nonzero score."""
+    rows = np.arange(scores.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+    cols = np.arange(scores.shape[1]) if cols is None else np.asarray(cols, dtype=np.int64)
+    if not len(rows) or not len(cols):
+        return []
+    sub = scores[np.ix_(rows, cols)]
+    r, c = np.nonzero(sub)
+    if not len(r):
+        return []
+    order = np.argsort(-sub[r, c].astype(np.int32), kind="stable")
+    used_rows, used_cols, pairs = set(), set(), []
+    for k in order:
+        i, j = int(rows[r[k]]), int(cols[c[k]])
+        if i in used_rows or j in used_cols:
+            continue
+        used_rows.add(i)
+        used_cols.add(j)
+        pairs.append((i, j))
+    return pairs
+
+
+# ------------------ Engine ------------------
+def match_items(items_a, items_b, threshold, scorer=fuzz.ratio, exclude_a=(), exclude_b=(),
+                hashes_a=None, hashes_b=None):
+    """
+    Match two lists of texts: identical items are anchored by hash, the rest
+    are scored with rapidfuzz cdist (cut off at `threshold`), aligned in
+    document order where possible, and any remaining pairs above the
+    threshold (moved text) are assigned greedily by score.
+
+    Items in `exclude_a` / `exclude_b` take no part. Returns {i: (j, score)}.
+    """
+    exclude_a, exclude_b = set(exclude_a), set(exclude_b)
+    rows = [i for i in range(len(items_a)) if i not in exclude_a]
+    cols = [j for j in range(len(items_b)) if j not in exclude_b]
+
+    matches = {}
+    if scorer is fuzz.ratio:
+        anchored = anchor_identical(
+            [items_a[i] for i in rows], [items_b[j] for j in cols],
+            [hashes_a[i] for i in rows] if hashes_a else None,
+            [hashes_b[j] for j in cols] if hashes_b else None,
+        )
+        for ri, cj in anchored.items():
+            matches[rows[ri]] = (cols[cj], 100)
+        taken = {j for j, _ in matches.values()}
+        rows = [i for i in rows if i not in matches]
+        cols = [j for j in cols if j not in taken]
+
+    scores = score_matrix([items_a[i] for i in rows], [items_b[j] for j in cols], scorer, threshold)
+    if scores.size and scores.size <= COMPARE_DP_MAX_CELLS:
+        aligned = monotone_alignment(scores)
+    else:
+        aligned = []
+    for ri, cj in aligned:
+        matches[rows[ri]] = (cols[cj], int(scores[ri, cj]))
+
+    done_r = {ri for ri, _ in aligned}
+    done_c = {cj for _, cj in aligned}
+    left_r = [ri for ri in range(len(rows)) if ri not in done_r]
+    left_c = [cj for cj in range(len(cols)) if cj not in done_c]
+    for ri, cj in greedy_assignment(scores, left_r, left_c):
+        matches[rows[ri]] = (cols[cj], int(scores[ri, cj]))
+    return matches
+
+
+def best_partial(text, items, candidates, threshold):
+    """Index among `candidates` whose item best contains `text` (fuzz.partial_ratio >= threshold), else None."""
+    if not candidates:
+        return None
+    best = process.extractOne(
+        text, {j: items[j] for j in candidates}, scorer=fuzz.partial_ratio, score_cutoff=threshold
+    )
+    return best[2] if best else None
+
+
+def iter_compare_paragraphs(paras1, paras2, para_threshold, partial_threshold, hashes1=None, hashes2=None):
+    """
+    Paragraph-level plan for /compare.
+
+    The fuzz.ratio matching (>= `para_threshold`: cdist scores and the
+    order-preserving alignment) runs over the whole document before the
+    first entry is yielded; only the partial matching is done lazily.
+    One entry per paragraph of the first document is yielded in order:
+    ("same", i, j), ("partial", i, j) when a still unmatched paragraph of
+    the second document contains it (fuzz.partial_ratio >=
+    `partial_threshold`), or ("removed", i, None). Finally ("new", None, j)
+    for every paragraph of the second document that was never matched.
+    """
+    same = match_items(paras1, paras2, para_threshold, hashes_a=hashes1, hashes_b=hashes2)
+    free = set(range(len(paras2))) - {j for j, _ in same.values()}
+
+    for i in range(len(paras1)):
+        if i in same:
+            yield "same", i, same[i][0]
+            continue
+        j = best_partial(paras1[i], paras2, sorted(free), partial_threshold)
+        if j is None:
+            yield "removed", i, None
+        else:
+            free.discard(j)
+            yield "partial", i, j
+
+    for j in sorted(free):
+        yield "new", None, j
+
+
+def compare_paragraphs(paras1, paras2, para_threshold, partial_threshold, hashes1=None, hashes2=None):
+    """
+    Whole plan at once: (plan, unmatched_2) where `plan` has the entries of
+    iter_compare_paragraphs for the first document and `unmatched_2` the
+    indexes of the new paragraphs of the second.
+    """
+    plan, new = [], []
+    for status, i, j in iter_compare_paragraphs(paras1, paras2, para_threshold, partial_threshold, hashes1, hashes2):
+        if status == "new":
+            new.append(j)
+        else:
+            plan.append((status, i, j))
+    return plan, new
+
+
+def compare_lines(lines1, lines2, line_threshold, partial_threshold, hashes1=None, hashes2=None):
+    """
+    Line-level plan inside a partially matched paragraph: ("same", i, j),
+    ("partial", i, j) or ("removed", i, None) per line of the first
+    paragraph, plus the unmatched line indexes of the second.
+    """
+    same = match_items(lines1, lines2, line_threshold, hashes_a=hashes1, hashes_b=hashes2)
+    taken = {j for j, _ in same.values()}
+    partial = match_items(lines1, lines2, partial_threshold, exclude_a=same.keys(), exclude_b=taken)
+    taken.update(j for j, _ in partial.values())
+
+    plan = []
+    for i in range(len(lines1)):
+        if i in same:
+            plan.append(("same", i, same[i][0]))
+        elif i in partial:
+            plan.append(("partial", i, partial[i][0]))
+        else:
+            plan.append(("removed", i, None))
+    return plan, [j for j in range(len(lines2)) if j not in taken]
@@ -0,0 +1,125 @@
+import os
+import re
+from dotenv import load_dotenv
+from embeddings import estimate_tokens
+
+load_dotenv()
+
+# Token budget for the retrieved context of a chat prompt
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+# A truncated last chunk shorter than this is left out instead
+CHAT_CONTEXT_MIN_TAIL_TOKENS = int(os.getenv("CHAT_CONTEXT_MIN_TAIL_TOKENS", "60"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+_OVERLAP_PROBE = 40       # chars of a chunk's head/tail looked up in another chunk
+_OVERLAP_WINDOW = 4000    # how far from the other chunk's edge an overlap may start
+
+
+def source_label(hit, default_name=None):
+    """Citation tag for a chunk, e.g. "[policy.pdf, p. 3-4]"."""
+    name = hit.get("filename") or default_name
+    page, page_end = hit.get("page"), hit.get("page_end")
+    if page and page_end and page_end != page:
+        where = f"p. {page}-{page_end}"
+    elif page:
+        where = f"p. {page}"
+    else:
+        where = None
+    parts = [p for p in (name, where) if p]
+    return f"[{', '.join(parts)}]" if parts else ""
+
+
+def _strip_overlap(text, kept):
+    """
+    Remove text this chunk shares with an already kept chunk of the same
+    source: consecutive chunks repeat a few trailing blocks of each other.
+    """
+    for other in kept:
+        if len(text) <= _OVERLAP_PROBE or len(other) <= _OVERLAP_PROBE:
+            continue
+        # other's tail == text's head
+        idx = other.rfind(text[:_OVERLAP_PROBE], max(0, len(other) - _OVERLAP_WINDOW))
+        if idx >= 0 and text.startswith(other[idx:]):
+            text = text[len(other) - idx:].lstrip()
+            continue
+        # text's tail == other's head
+        idx = text.rfind(other[:_OVERLAP_PROBE], max(0, len(text) - _OVERLAP_WINDOW))
+        if idx >= 0 and other.startswith(text[idx:]):
+            text = text[:idx].rstrip()
+    return text
+
+
+def _longest_prefix(units, max_tokens):
+    """Largest n such that the first n units, space-joined, fit in `max_tokens`."""
+    lo, hi = 0, len(units)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(" ".join(units[:mid])) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to whole sentences within `max_tokens` (whole words if one sentence is too long)."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = _SENTENCE_END.split(text)
+    n = _longest_prefix(sentences, max_tokens)
+    if n:
+        return " ".join(sentences[:n])
+    words = text.split()
+    return " ".join(words[:_longest_prefix(words, max_tokens)])
+
+
+def build_context(hits, max_tokens=None, separator="\n\n---\n\n", default_name=None):
+    """
+    Pack ranked search hits into a prompt context of at most `max_tokens`.
+
+    Hits are taken best first; exact duplicates are skipped and text shared
+    with an already packed chunk of the same source is cut away. Each chunk
+    is prefixed with its filename/page tag. The first chunk that no longer
+    fits is sentence-truncated into the remaining budget (or dropped if too
+    little is left) and packing stops there.
+
+    Returns (context_text, used_hits, tokens).
+    """
+    max_tokens = max_tokens or CHAT_CONTEXT_TOKENS
+    sep_tokens = estimate_tokens(separator)
+    parts, used_hits, kept_by_source, seen = [], [], {}, set()
+    used = 0
+
+    for hit in hits:
+        text = (hit.get("content") or "").strip()
+        key = " ".join(text.split()).lower()
+        if not text or key in seen:
+            continue
+        seen.add(key)
+
+        source = hit.get("metadata") or hit.get("filename")
+        kept = kept_by_source.setdefault(source, [])
+        text = _strip_overlap(text, kept)
+        if estimate_tokens(text) < 5:
+            continue
+
+        label = source_label(hit, default_name)
+        header = f"{label}\n" if label else ""
+        cost = estimate_tokens(header + text) + (sep_tokens if parts else 0)
+        remaining = max_tokens - used
+        if cost > remaining:
+            room = remaining - estimate_tokens(header) - (sep_tokens if parts else 0)
+            if room >= CHAT_CONTEXT_MIN_TAIL_TOKENS:
+                text = truncate_to_tokens(text, room)
+                if text:
+                    parts.append(header + text)
+                    used_hits.append(hit)
+                    used += estimate_tokens(header + text) + (sep_tokens if len(parts) > 1 else 0)
+            break
+
+        parts.append(header + text)
+        kept.append(text)
+        used_hits.append(hit)
+        used += cost
+
+    return separator.join(parts), used_hits, used
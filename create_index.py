@@ -33,7 +33,12 @@ index_config = {
             "dimensions": 1536,  # ✅ FIXED: must be named "dimensions"
             "vectorSearchConfiguration": "default"
         },
-        {"name": "metadata", "type": "Edm.String", "searchable": True}
+        {"name": "metadata", "type": "Edm.String", "searchable": True},
+        # Chunk provenance: where the chunk starts/ends in the source PDF
+        {"name": "page", "type": "Edm.Int32", "filterable": True, "sortable": True},
+        {"name": "page_end", "type": "Edm.Int32", "filterable": True},
+        {"name": "char_start", "type": "Edm.Int32"},
+        {"name": "char_end", "type": "Edm.Int32"}
     ],
     "vectorSearch": {
         "algorithmConfigurations": [
@@ -31,7 +31,11 @@ index_config = {
             "vectorSearchConfiguration": "default"
         },
         {"name": "metadata", "type": "Edm.String", "searchable": True},   # "source:<blob_name>"
-        {"name": "filename", "type": "Edm.String", "searchable": True}    # ✅ Added field
+        {"name": "filename", "type": "Edm.String", "searchable": True},   # ✅ Added field
+        {"name": "page", "type": "Edm.Int32", "filterable": True, "sortable": True},
+        {"name": "page_end", "type": "Edm.Int32", "filterable": True},
+        {"name": "char_start", "type": "Edm.Int32"},
+        {"name": "char_end", "type": "Edm.Int32"}
     ],
     "vectorSearch": {
         "algorithmConfigurations": [
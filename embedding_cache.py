@@ -0,0 +1,144 @@
+import os
+import re
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MEMORY_MB = int(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64"))
+
+_ENTRY_OVERHEAD = 240  # rough per-entry cost of the key, array header and dict slot
+
+
+def normalize_for_key(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def cache_key(text: str, deployment: str) -> str:
+    """Content address of an embedding: deployment name + normalized text."""
+    payload = f"{deployment or ''}\n{normalize_for_key(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache: an in-memory LRU bounded by bytes in front of
+    a SQLite table storing float32 vectors. The LRU holds array("f") values
+    (4 bytes per dimension, as counted) and hands out lists. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, memory_bytes=EMBEDDING_CACHE_MEMORY_MB * 1024 * 1024):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self._lru = OrderedDict()
+        self._lru_size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        if self.path:
+            try:
+                self._conn().execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dims INTEGER, vector BLOB)"
+                )
+            except sqlite3.Error as e:
+                logging.error(f"❌ Embedding cache disabled, cannot open {self.path}: {e}")
+                self.path = None
+
+    # ---------- SQLite ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- LRU ----------
+    def _remember(self, key, vector):
+        """Keep an array("f") vector in the LRU."""
+        size = len(vector) * vector.itemsize + _ENTRY_OVERHEAD
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return
+            self._lru[key] = vector
+            self._lru_size += size
+            while self._lru_size > self.memory_bytes and self._lru:
+                _, old = self._lru.popitem(last=False)
+                self._lru_size -= len(old) * old.itemsize + _ENTRY_OVERHEAD
+                self.stats["evictions"] += 1
+
+    # ---------- Public API ----------
+    def get_many(self, keys):
+        """Return {key: vector} for every key found in memory or on disk."""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector.tolist()
+                    self.stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+
+        if missing and self.path:
+            try:
+                conn = self._conn()
+                for start in range(0, len(missing), 500):
+                    part = missing[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob)
+                        found[key] = vector.tolist()
+                        self._remember(key, vector)
+                        with self._lock:
+                            self.stats["disk_hits"] += 1
+            except sqlite3.Error as e:
+                logging.warning(f"⚠ Embedding cache read failed: {e}")
+
+        with self._lock:
+            self.stats["misses"] += len(set(keys) - found.keys())
+        return found
+
+    def put_many(self, items):
+        """Store {key: vector} in memory and on disk."""
+        if not items:
+            return
+        vectors = {key: array("f", vector) for key, vector in items.items()}
+        for key, vector in vectors.items():
+            self._remember(key, vector)
+        if self.path:
+            try:
+                self._conn().executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, dims, vector) VALUES (?, ?, ?)",
+                    [(key, len(v), v.tobytes()) for key, v in vectors.items()]
+                )
+            except sqlite3.Error as e:
+                logging.warning(f"⚠ Embedding cache write failed: {e}")
+        with self._lock:
+            self.stats["writes"] += len(items)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._lru)
+            stats["memory_bytes"] = self._lru_size
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+embedding_cache = EmbeddingCache()
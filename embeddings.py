@@ -0,0 +1,161 @@
+import os
+import logging
+import requests
+from dotenv import load_dotenv
+from embedding_cache import embedding_cache, cache_key
+from azure_clients import get_session
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+load_dotenv()
+
+EMBEDDING_DEPLOYMENT = os.getenv("AZURE_EMBEDDING_DEPLOYMENT")
+EMBEDDING_URL = (
+    f"{os.getenv('AZURE_OPENAI_ENDPOINT')}openai/deployments/"
+    f"{EMBEDDING_DEPLOYMENT}/embeddings?api-version={os.getenv('AZURE_API_VERSION')}"
+)
+EMBEDDING_HEADERS = {
+    "api-key": os.getenv("AZURE_OPENAI_API_KEY"),
+    "Content-Type": "application/json"
+}
+
+# Older Azure embedding deployments only accept 16 inputs per request;
+# raise this for deployments that allow larger batches (up to 2048).
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "32000"))
+
+_encoder = None
+
+
+# ------------------ Token Estimation ------------------
+def estimate_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken when it is installed, otherwise fall back to
+    the usual ~4 characters per token estimate.
+    """
+    global _encoder
+    if not text:
+        return 0
+    if tiktoken is not None and _encoder is None:
+        try:
+            # Downloads the BPE file on first use (cached under TIKTOKEN_CACHE_DIR)
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logging.warning(f"⚠️ tiktoken encoding unavailable, estimating tokens as chars/4: {e}")
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+# ------------------ Batching ------------------
+def plan_batches(texts, max_items=None, max_tokens=None):
+    """
+    Group text indexes into batches that stay under the item and token budget.
+    A single text larger than the token budget gets a batch of its own.
+    """
+    max_items = max_items or EMBEDDING_BATCH_SIZE
+    max_tokens = max_tokens or EMBEDDING_BATCH_TOKENS
+
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _post_batch(inputs):
+    data = {"input": inputs, "model": EMBEDDING_DEPLOYMENT}
+    return get_session("openai").post(EMBEDDING_URL, headers=EMBEDDING_HEADERS, json=data)
+
+
+def _embed_batch(texts, indexes, vectors, failures):
+    """
+    Embed one batch and write results into `vectors` by original index.
+    A rejected batch (4xx other than 429) is bisected so that one bad chunk
+    only fails itself instead of the whole batch.
+    """
+    try:
+        res = _post_batch([texts[i] for i in indexes])
+    except requests.RequestException as e:
+        for i in indexes:
+            failures[i] = str(e)
+        return
+
+    if res.status_code == 200:
+        returned = set()
+        for item in res.json().get("data", []):
+            pos = item.get("index")
+            if pos is None or pos >= len(indexes):
+                continue
+            vectors[indexes[pos]] = item["embedding"]
+            returned.add(pos)
+        for pos, i in enumerate(indexes):
+            if pos not in returned:
+                failures[i] = "No embedding returned for input"
+        return
+
+    if 400 <= res.status_code < 500 and res.status_code != 429 and len(indexes) > 1:
+        mid = len(indexes) // 2
+        _embed_batch(texts, indexes[:mid], vectors, failures)
+        _embed_batch(texts, indexes[mid:], vectors, failures)
+        return
+
+    for i in indexes:
+        failures[i] = f"{res.status_code}: {res.text}"
+
+
+def get_embeddings(texts, max_items=None, max_tokens=None):
+    """
+    Embed many texts with as few requests as possible.
+
+    Texts already in the embedding cache are not sent to the service.
+
+    Returns (vectors, failures): `vectors` is aligned with `texts` and holds
+    an empty list for every text that could not be embedded, `failures` maps
+    the index of each failed text to the error message.
+    """
+    texts = list(texts)
+    vectors = [[] for _ in texts]
+    failures = {}
+
+    keys = {}
+    for i, text in enumerate(texts):
+        if text and text.strip():
+            keys[i] = cache_key(text, EMBEDDING_DEPLOYMENT)
+        else:
+            failures[i] = "Empty text"
+
+    cached = embedding_cache.get_many(list(keys.values()))
+    pending = []
+    for i, key in keys.items():
+        if key in cached:
+            vectors[i] = cached[key]
+        else:
+            pending.append(i)
+
+    pending_texts = [texts[i] for i in pending]
+    for batch in plan_batches(pending_texts, max_items, max_tokens):
+        _embed_batch(texts, [pending[j] for j in batch], vectors, failures)
+
+    embedding_cache.put_many({keys[i]: vectors[i] for i in pending if vectors[i]})
+
+    for i, err in sorted(failures.items()):
+        logging.warning(f"❌ Embedding failed for chunk {i + 1}/{len(texts)}: {err}")
+
+    return vectors, failures
+
+
+def get_embedding(text):
+    vectors, _failures = get_embeddings([text])
+    return vectors[0]
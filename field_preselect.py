@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import math
+from dotenv import load_dotenv
+from embeddings import estimate_tokens
+
+load_dotenv()
+
+# Page text sent to the extraction model per call, and the most calls per PDF
+EXTRACT_MAX_TOKENS = int(os.getenv("EXTRACT_MAX_TOKENS", "6000"))
+EXTRACT_MAX_BATCHES = int(os.getenv("EXTRACT_MAX_BATCHES", "3"))
+# Best-scoring pages kept per field group, and leading pages always kept (policy schedule)
+EXTRACT_PAGES_PER_FIELD = int(os.getenv("EXTRACT_PAGES_PER_FIELD", "2"))
+EXTRACT_LEADING_PAGES = int(os.getenv("EXTRACT_LEADING_PAGES", "2"))
+
+_DATE = r"\b\d{1,2}(?:st|nd|rd|th)?[-/ .](?:\d{1,2}|[A-Za-z]{3,9})[-/ .,]+\d{2,4}\b"
+_MONEY = r"(?:rs\.?|inr|₹|\$|usd)\s*[\d,]+(?:\.\d+)?"
+
+# Field group → (weighted) patterns that mark a page as likely to contain it
+FIELD_PATTERNS = {
+    "policyholderName": [
+        (r"policy\s*holder|proposer|name of (?:the )?(?:insured|life assured)|insured (?:person|name)|member name", 3),
+        (r"\b(?:mr|mrs|ms|shri|smt)\.?\s+[A-Z][a-z]+", 1),
+    ],
+    "policyNumber": [
+        (r"policy\s*(?:no|number|#)|certificate\s*(?:no|number)", 3),
+    ],
+    "premiumAmount": [
+        (r"sum assured|sum insured|total benefit|maturity amount", 3),
+        (_MONEY, 1),
+    ],
+    "deductibles": [
+        (r"premium(?: per| payable| amount| frequency)?|instal?ment|deductible", 2),
+        (r"monthly|quarterly|half[- ]yearly|annually|yearly", 1),
+    ],
+    "dates": [
+        (r"date of (?:issue|commencement|expiry|maturity)|issue date|start date|end date|"
+         r"inception|expir(?:y|ation)|valid (?:from|till|until|upto)|period of (?:insurance|cover)", 3),
+        (_DATE, 1),
+    ],
+    "providerName": [
+        (r"insurance (?:company|co\.)|assurance|insurer|\b(?:limited|ltd)\b", 2),
+    ],
+    "policyholderAddress": [
+        (r"address|pin\s*code|pincode|\broad\b|street|nagar|district", 2),
+    ],
+    "termsAndExclusions": [
+        (r"exclusion|not covered|shall not (?:be liable|pay)|waiting period|we will not pay", 3),
+    ],
+}
+_COMPILED = {
+    field: [(re.compile(p, re.IGNORECASE), w) for p, w in patterns]
+    for field, patterns in FIELD_PATTERNS.items()
+}
+# Exclusion lists run over several pages, so that group keeps more of them
+_PAGES_FOR = {"termsAndExclusions": 2}
+
+
+def score_pages(pages):
+    """{field: [(score, page_number)] best first} from weighted, log-damped keyword hits."""
+    scores = {field: [] for field in _COMPILED}
+    for page in pages:
+        if page.empty:
+            continue
+        for field, patterns in _COMPILED.items():
+            score = sum(w * math.log1p(len(rx.findall(page.text))) for rx, w in patterns)
+            if score > 0:
+                scores[field].append((score, page.number))
+    for ranked in scores.values():
+        ranked.sort(key=lambda s: (-s[0], s[1]))
+    return scores
+
+
+def select_pages(pages, per_field=None, leading=None):
+    """
+    Page numbers worth sending to the model, most relevant first: the
+    leading pages, then the best pages of each field group round-robin.
+    """
+    per_field = EXTRACT_PAGES_PER_FIELD if per_field is None else per_field
+    leading = EXTRACT_LEADING_PAGES if leading is None else leading
+    chosen = [p.number for p in pages[:leading] if not p.empty]
+    ranked = score_pages(pages)
+    limits = {field: per_field * _PAGES_FOR.get(field, 1) for field in ranked}
+    for rank in range(max(limits.values())):
+        for field, field_pages in ranked.items():
+            if rank < min(limits[field], len(field_pages)) and field_pages[rank][1] not in chosen:
+                chosen.append(field_pages[rank][1])
+    return chosen
+
+
+def _page_block(page):
+    return f"--- Page {page.number} ---\n{page.text}\n"
+
+
+def preselect_pages(pages, max_tokens=None, max_batches=None):
+    """
+    Page text for the field-extraction prompt(s).
+
+    Documents that fit in `max_tokens` go to the model whole. Larger ones are
+    cut down to the pages selected by `select_pages`; when those still don't
+    fit in one prompt they are split into up to `max_batches` prompts (in
+    page order) whose answers are merged by `merge_extractions`.
+    Returns a list of texts, one per model call.
+    """
+    max_tokens = max_tokens or EXTRACT_MAX_TOKENS
+    max_batches = max_batches or EXTRACT_MAX_BATCHES
+    full = "".join(p.text + "\n" for p in pages if not p.empty)
+    if estimate_tokens(full) <= max_tokens:
+        return [full]
+
+    by_number = {p.number: p for p in pages}
+    budget = max_tokens * max_batches
+    kept, used = [], 0
+    for number in select_pages(pages):
+        cost = estimate_tokens(_page_block(by_number[number]))
+        if used + cost > budget:
+            continue
+        kept.append(number)
+        used += cost
+
+    batches, current, current_tokens = [], [], 0
+    for number in sorted(kept):
+        block = _page_block(by_number[number])
+        cost = estimate_tokens(block)
+        if current and current_tokens + cost > max_tokens:
+            batches.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += cost
+    if current:
+        batches.append("".join(current))
+    return batches or [full[:max_tokens * 4]]
+
+
+# ------------------ Reduce ------------------
+def loads_model_json(raw):
+    """Parse the model's JSON answer, tolerating code fences and surrounding text."""
+    cleaned = re.sub(r"^```(?:json)?|```$", "", raw.strip(), flags=re.MULTILINE).strip()
+    match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+    return json.loads(match.group(0) if match else cleaned)
+
+
+# Raw-text fields travel with the field they were read for
+_RAW_OF = {"issueDate": "issueDateRaw", "expirationDate": "expirationDateRaw"}
+
+
+def merge_extractions(partials):
+    """
+    Reduce per-batch extraction results: every field takes the non-null value
+    with the highest confidence, exclusion lists are concatenated without
+    duplicates.
+    """
+    merged = {}
+    for part in partials:
+        for field, item in part.items():
+            if field in _RAW_OF.values():
+                continue
+            if field == "termsAndExclusions":
+                terms = merged.setdefault(field, [])
+                for term in ([item] if isinstance(item, str) else item or []):
+                    if term not in terms:
+                        terms.append(term)
+                continue
+            if not isinstance(item, dict) or item.get("value") in (None, ""):
+                merged.setdefault(field, {"value": None, "confidence": 0})
+                continue
+            best = merged.get(field)
+            if not best or best.get("value") is None or (item.get("confidence") or 0) > (best.get("confidence") or 0):
+                merged[field] = item
+                if field in _RAW_OF:
+                    merged[_RAW_OF[field]] = part.get(_RAW_OF[field])
+    for raw_field in _RAW_OF.values():
+        merged.setdefault(raw_field, None)
+    if "termsAndExclusions" in merged and not merged["termsAndExclusions"]:
+        merged["termsAndExclusions"] = None
+    return merged
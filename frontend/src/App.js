@@ -9,6 +9,7 @@ function App() {
     if (token) {
       const timeout = setTimeout(() => {
         localStorage.removeItem("token");
+        localStorage.removeItem("user_id");
         setToken(null);
       }, 200 * 60 * 1000); // 25 minutes
       return () => clearTimeout(timeout);
@@ -12,6 +12,7 @@ import MultiDocVoiceChat from "./components/MultiDocVoiceChat";
 // NEW imports
 import ClassifyAndRoute from "./components/ClassifyAndRoute";
 import CategoryManager from "./components/CategoryManager";
+import { authHeaders } from "./api";
 
 // (Optional) If something still imports the old file, you can keep it:
 // import ClassificationRouting from "./components/ClassificationRouting";
@@ -21,7 +22,13 @@ function MainLayout({ onLogout }) {
   const [sidebarOpen, setSidebarOpen] = useState(true);
 
   const handleLogout = () => {
+    // Revoke the token server-side; the local session ends either way
+    const token = localStorage.getItem("token");
+    if (token) {
+      fetch("/logout", { method: "POST", headers: authHeaders() }).catch(() => {});
+    }
     localStorage.removeItem("token");
+    localStorage.removeItem("user_id");
     localStorage.removeItem("name");
     onLogout();
   };
@@ -0,0 +1,9 @@
+// src/api.js
+// Helper: auth header from localStorage token
+export function authHeaders(extra = {}) {
+  const token = localStorage.getItem("token");
+  return {
+    ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    ...extra,
+  };
+}
@@ -12,6 +12,7 @@ import {
   Tooltip,
   Legend,
 } from "chart.js";
+import { authHeaders } from "../api";
 
 ChartJS.register(
   LineElement,
@@ -33,19 +34,19 @@ const Analytics = () => {
   });
   const [trend, setTrend] = useState([]);
   const [filter, setFilter] = useState("all");
+  const [pdfCursor, setPdfCursor] = useState(null);
+  const [pdfTotal, setPdfTotal] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const fetchAnalytics = useCallback(async () => {
     try {
-      const user_id = localStorage.getItem("token");
+      const res = await axios.post("/analytics", { filter }, { headers: authHeaders() });
 
-      const res = await axios.post("/analytics", {
-        filter,
-        user_id,
-      });
-
-      const pdfRes = await axios.post("/analytics/pdf-details", {
-        user_id,
-      });
+      const pdfRes = await axios.post(
+        "/analytics/pdf-details",
+        { include_total: true },
+        { headers: authHeaders() }
+      );
 
       const combinedAnalytics = {
         total_pdfs: res.data.total_pdfs || 0,
@@ -57,18 +58,34 @@ const Analytics = () => {
 
       console.log("✅ Combined Analytics:", combinedAnalytics);
       setAnalytics(combinedAnalytics);
+      setPdfCursor(pdfRes.data.next_cursor || null);
+      setPdfTotal(pdfRes.data.total ?? null);
     } catch (err) {
       console.error("Analytics Error:", err);
     }
   }, [filter]);
 
+  // Next page of the PDF table (keyset cursor from the previous page)
+  const loadMorePdfs = async () => {
+    if (!pdfCursor) return;
+    setLoadingMore(true);
+    try {
+      const res = await axios.post(
+        "/analytics/pdf-details",
+        { cursor: pdfCursor },
+        { headers: authHeaders() }
+      );
+      setAnalytics((prev) => ({ ...prev, pdfs: [...prev.pdfs, ...(res.data.pdfs || [])] }));
+      setPdfCursor(res.data.next_cursor || null);
+    } catch (err) {
+      console.error("PDF details Error:", err);
+    }
+    setLoadingMore(false);
+  };
+
   const fetchTrendData = useCallback(async () => {
     try {
-      const user_id = localStorage.getItem("token");
-      const res = await axios.post("/analytics/trends", {
-        filter,
-        user_id,
-      });
+      const res = await axios.post("/analytics/trends", { filter }, { headers: authHeaders() });
       setTrend(res.data.trend);
     } catch (err) {
       console.error("Trend Error:", err);
@@ -248,6 +265,16 @@ const Analytics = () => {
             ))}
           </tbody>
         </table>
+        {pdfTotal != null && (
+          <p>
+            Showing {analytics.pdfs.length} of {pdfTotal}
+          </p>
+        )}
+        {pdfCursor && (
+          <button onClick={loadMorePdfs} disabled={loadingMore}>
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        )}
       </div>
     </div>
   );
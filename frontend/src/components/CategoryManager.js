@@ -1,20 +1,12 @@
 // src/components/CategoryManager.js
 import React, { useEffect, useState } from "react";
 import "./CategoryManager.css";
+import { authHeaders } from "../api";
 
 // Regex for email validation
 const EMAIL_REGEX = /^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$/;
 const isValidEmail = (s) => EMAIL_REGEX.test((s || "").trim());
 
-// Helper: auth header from localStorage token
-function authHeaders(extra = {}) {
-  const token = localStorage.getItem("token");
-  return {
-    ...(token ? { Authorization: `Bearer ${token}` } : {}),
-    ...extra,
-  };
-}
-
 export default function CategoryManager() {
   const [categories, setCategories] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import './Chatbot.css';
+import { streamChat } from './chatStream';
 
 const ChatBot = ({ pdfId }) => {
   const [chatOpen, setChatOpen] = useState(false);
@@ -31,25 +32,25 @@ const ChatBot = ({ pdfId }) => {
       { sender: 'bot', text: '...', loading: true }
     ]);
 
-    fetch("/chat", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ pdf_id: pdfId, question }),
+    // The typing bubble is replaced by the answer as soon as tokens arrive
+    const replaceLast = (...next) => {
+      setMessages(prev => [...prev.slice(0, -1), ...next]);
+    };
+
+    streamChat("/chat", { pdf_id: pdfId, question }, {
+      onToken: (_, answer) => replaceLast({ sender: 'bot', text: answer }),
     })
-      .then(res => res.json())
-      .then(data => {
-        setMessages(prev => [
-          ...prev.slice(0, -1),
-          { sender: 'bot', text: data.answer || "Hmm, I couldn’t find anything relevant." },
+      .then(({ answer }) => {
+        replaceLast(
+          { sender: 'bot', text: answer || "Hmm, I couldn’t find anything relevant." },
           { sender: 'suggestions' }
-        ]);
+        );
       })
       .catch(() => {
-        setMessages(prev => [
-          ...prev.slice(0, -1),
+        replaceLast(
           { sender: 'bot', text: "Oops! Something went wrong. Try again later." },
           { sender: 'suggestions' }
-        ]);
+        );
       });
   };
 
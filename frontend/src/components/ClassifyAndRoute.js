@@ -2,20 +2,12 @@
 import React, { useState, useEffect } from "react";
 import "./ClassifyAndRoute.css";
 import { FiTrash2 } from "react-icons/fi";
+import { authHeaders } from "../api";
 
 // Regex for email validation
 const EMAIL_REGEX = /^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$/;
 const isValidEmail = (s) => EMAIL_REGEX.test((s || "").trim());
 
-// Helper: auth header from localStorage token
-function authHeaders(extra = {}) {
-  const token = localStorage.getItem("token");
-  return {
-    ...(token ? { Authorization: `Bearer ${token}` } : {}),
-    ...extra,
-  };
-}
-
 export default function ClassifyAndRoute() {
   const [files, setFiles] = useState([]);
   const [rows, setRows] = useState([]);
@@ -86,11 +78,34 @@ export default function ClassifyAndRoute() {
   };
 
   // ---------- Upload & classify ----------
+  // Results stream back as NDJSON in completion order; each carries the
+  // file's upload index, which maps it to its placeholder row.
+  const applyResult = (batchId, result) => {
+    const effectiveCat = result.category || "Other";
+    setRows((prev) =>
+      prev.map((row) =>
+        row.batchId === batchId && row.batchIndex === result.index
+          ? {
+              ...row,
+              name: result.name || row.name,
+              status: result.status || "Done",
+              category: effectiveCat,
+              intent: result.intent || "",
+              toEmail: effectiveCat === "Other" ? "" : findEmailForCategory(effectiveCat),
+            }
+          : row
+      )
+    );
+  };
+
   const handleUploadAndClassify = async () => {
     if (!files.length || loading) return;
     setLoading(true);
 
-    const placeholders = files.map((f) => ({
+    const batchId = Date.now();
+    const placeholders = files.map((f, i) => ({
+      batchId,
+      batchIndex: i,
       name: f.name,
       status: "Processing…",
       category: "Other",
@@ -103,43 +118,48 @@ export default function ClassifyAndRoute() {
       const form = new FormData();
       files.forEach((f) => form.append("files", f));
 
-      const res = await fetch("/classify-docs", {
+      const res = await fetch("/classify-docs?stream=1", {
         method: "POST",
-        headers: authHeaders(),
+        headers: authHeaders({ Accept: "application/x-ndjson" }),
         body: form,
       });
-      const data = await res.json();
-
-      if (!res.ok) {
-        throw new Error(data?.error || "Server error");
-      }
-
-      setRows((prev) => {
-        const updated = [...prev];
-        for (let i = 0; i < files.length; i++) {
-          const result = data.results[i] || {};
-          const effectiveCat = result.category || "Other";
-          const defaultEmail =
-            effectiveCat === "Other" ? "" : findEmailForCategory(effectiveCat);
 
-          updated[i] = {
-            name: result.name || placeholders[i].name,
-            status: result.status || "Done",
-            category: effectiveCat,
-            intent: result.intent || "",
-            toEmail: defaultEmail,
-          };
+      if (!(res.headers.get("Content-Type") || "").includes("application/x-ndjson")) {
+        const data = await res.json();
+        if (!res.ok) throw new Error(data?.error || "Server error");
+        (data.results || []).forEach((result, i) =>
+          applyResult(batchId, { index: i, ...result })
+        );
+      } else {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        const handle = (line) => {
+          if (!line.trim()) return;
+          const record = JSON.parse(line);
+          if (record.type === "result") applyResult(batchId, record);
+        };
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let nl;
+          while ((nl = buffer.indexOf("\n")) !== -1) {
+            handle(buffer.slice(0, nl));
+            buffer = buffer.slice(nl + 1);
+          }
         }
-        return updated;
-      });
+        handle(buffer);
+      }
     } catch (e) {
       console.error(e);
+    } finally {
+      // Anything still pending never got a result
       setRows((prev) =>
-        prev.map((r, idx) =>
-          idx < files.length ? { ...r, status: "Failed" } : r
+        prev.map((r) =>
+          r.batchId === batchId && r.status === "Processing…" ? { ...r, status: "Failed" } : r
         )
       );
-    } finally {
       setFiles([]);
       setLoading(false);
     }
@@ -1,5 +1,6 @@
 import React, { useState } from "react";
 import "./ComparePage.css";
+import { streamCompare, blocksToHtml } from "./compareStream";
 
 function ComparePage() {
   const [file1, setFile1] = useState(null);
@@ -22,13 +23,18 @@ function ComparePage() {
     formData.append("pdf2", file2);
 
     setLoading(true);
+    setOutputHtml("");
     try {
-      const res = await fetch("/compare", {
-        method: "POST",
-        body: formData,
+      // Pages of differences are appended as soon as the server has aligned them
+      let html = "";
+      const result = await streamCompare(formData, {
+        onBlocks: (blocks) => {
+          html += (html ? "\n" : "") + blocksToHtml(blocks);
+          setOutputHtml(`<div class="compare-output">${html}</div>`);
+        },
       });
-      const data = await res.json();
-      setOutputHtml(data?.html_result || "No result");
+      if (result.html !== undefined) setOutputHtml(result.html || "No result");
+      else if (!html) setOutputHtml("No result");
     } catch (err) {
       console.error(err);
       setOutputHtml("Error comparing PDFs");
@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useRef } from "react";
 import "./MultiDocVoiceChat.css";
 import { FiTrash2 } from "react-icons/fi";
+import { streamChat } from "./chatStream";
 
 export default function MultiDocVoiceChat() {
   const [files, setFiles] = useState([]);
@@ -27,6 +28,14 @@ export default function MultiDocVoiceChat() {
     .map((d) => d.blob_name)
     .filter(Boolean);
 
+  // one tag per file, however many of its chunks were retrieved
+  const uniqueSources = (sources = []) => {
+    const seen = new Set();
+    return sources
+      .map((s) => ({ ...s, blob_name: s.blob_name || s.source }))
+      .filter((s) => s.filename && !seen.has(s.filename) && seen.add(s.filename));
+  };
+
   const sendMessage = async () => {
     const q = chatInput.trim();
     if (!q || chatLoading) return;
@@ -37,33 +46,29 @@ export default function MultiDocVoiceChat() {
     setChatLoading(true);
 
     try {
-      const res = await fetch("/chat-multidoc", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ question: q, blob_names: currentBlobNames }),
-      });
-      const data = await res.json();
-
-      if (data?.answer) {
-        setMessages((prev) => [
-          ...prev,
-          {
-            role: "assistant",
-            text: data.answer,
-            sources: data.sources || [],
-          },
-        ]);
-      } else {
-        setMessages((prev) => [
-          ...prev,
-          {
-            role: "assistant",
-            text:
-              data?.error ||
-              "Sorry, I couldn't find that in the current documents.",
-          },
-        ]);
-      }
+      // One assistant bubble, filled in as tokens stream from the server
+      let streaming = false;
+      const updateAnswer = (text, sources) => {
+        const replace = streaming;
+        const msg = { role: "assistant", text, sources: uniqueSources(sources) };
+        setMessages((prev) => (replace ? [...prev.slice(0, -1), msg] : [...prev, msg]));
+        streaming = true;
+        setChatLoading(false);
+      };
+
+      let sources = [];
+      const { answer } = await streamChat(
+        "/chat-multidoc",
+        { question: q, blob_names: currentBlobNames },
+        {
+          onSources: (s) => (sources = s),
+          onToken: (_, text) => updateAnswer(text, sources),
+        }
+      );
+      updateAnswer(
+        answer || "Sorry, I couldn't find that in the current documents.",
+        sources
+      );
     } catch (err) {
       console.error("Chat error", err);
       setMessages((prev) => [
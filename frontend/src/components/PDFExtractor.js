@@ -4,6 +4,7 @@ import { FiPlus, FiMinus } from "react-icons/fi";
 import Chatbot from "./Chatbot";
 import "./PDFExtractor.css";
 import { MdFitScreen } from "react-icons/md";
+import { authHeaders } from "../api";
 
 pdfjs.GlobalWorkerOptions.workerSrc = `//cdnjs.cloudflare.com/ajax/libs/pdf.js/${pdfjs.version}/pdf.worker.js`;
 pdfjs.GlobalWorkerOptions.cMapUrl = `//cdnjs.cloudflare.com/ajax/libs/pdf.js/${pdfjs.version}/cmaps/`;
@@ -69,7 +70,6 @@ const handleExtract = () => {
 
   const fd = new FormData();
   fd.append("pdf", pdfFile);
-  fd.append("user_id", localStorage.getItem("token"));
 
   const formatDate = (dateStr) => {
     if (!dateStr) return "";
@@ -78,7 +78,8 @@ const handleExtract = () => {
   };
 
   fetch("/extract", {
-    method: "POST", 
+    method: "POST",
+    headers: authHeaders(),
     body: fd,
   })
     .then((res) => res.json())
@@ -343,13 +344,12 @@ const handleExtract = () => {
   ai_data: originalData,
   user_updated_data:
     Object.keys(userUpdatedData).length > 0 ? userUpdatedData : null,
-  user_id: localStorage.getItem("token"), // ✅ ADD THIS
 };
 
 
     fetch("/save", {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: authHeaders({ "Content-Type": "application/json" }),
       body: JSON.stringify(payload),
     })
       .then((res) => res.json())
@@ -0,0 +1,57 @@
+// Streams a chat answer from /chat or /chat-multidoc as server-sent events.
+// Calls onSources(sources) once, onToken(text) for every delta, and resolves
+// with { answer, sources }. Falls back to the plain JSON reply when the
+// server answers without streaming (e.g. "no relevant content").
+export async function streamChat(url, body, { onSources, onToken, signal } = {}) {
+  const res = await fetch(`${url}?stream=1`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+    body: JSON.stringify(body),
+    signal,
+  });
+
+  if (!(res.headers.get("Content-Type") || "").includes("text/event-stream")) {
+    const data = await res.json();
+    if (data.error) throw new Error(data.error);
+    return { answer: data.answer || "", sources: data.sources || [] };
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+  let sources = [];
+
+  const handle = (raw) => {
+    let event = "message";
+    let data = "";
+    raw.split("\n").forEach((line) => {
+      if (line.startsWith("event:")) event = line.slice(6).trim();
+      else if (line.startsWith("data:")) data += line.slice(5).trim();
+    });
+    const payload = data ? JSON.parse(data) : {};
+    if (event === "sources") {
+      sources = payload.sources || [];
+      onSources && onSources(sources);
+    } else if (event === "token") {
+      answer += payload.text;
+      onToken && onToken(payload.text, answer);
+    } else if (event === "error") {
+      throw new Error(payload.error || "Streaming failed");
+    }
+  };
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      handle(buffer.slice(0, sep));
+      buffer = buffer.slice(sep + 2);
+    }
+  }
+  if (buffer.trim()) handle(buffer);
+
+  return { answer, sources };
+}
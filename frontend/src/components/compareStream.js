@@ -0,0 +1,85 @@
+import { authHeaders } from "../api";
+
+// Streams a PDF comparison from /compare as NDJSON. Calls onMeta(meta) once,
+// onBlocks(blocks, record) for every page of blocks as the server aligns it,
+// and resolves with { comparisonId, total }. Falls back to the plain JSON
+// reply ({ html_result } or { error }) when the server doesn't stream.
+export async function streamCompare(formData, { onMeta, onBlocks, signal } = {}) {
+  const res = await fetch("/compare?stream=1", {
+    method: "POST",
+    headers: authHeaders({ Accept: "application/x-ndjson" }),
+    body: formData,
+    signal,
+  });
+
+  if (!(res.headers.get("Content-Type") || "").includes("application/x-ndjson")) {
+    const data = await res.json();
+    if (data.error) throw new Error(data.error);
+    return { html: data.html_result || "" };
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let result = { comparisonId: null, total: 0 };
+
+  const handle = (line) => {
+    if (!line.trim()) return;
+    const record = JSON.parse(line);
+    if (record.type === "meta") {
+      result.comparisonId = record.comparison_id;
+      onMeta && onMeta(record);
+    } else if (record.type === "blocks") {
+      onBlocks && onBlocks(record.blocks, record);
+    } else if (record.type === "done") {
+      result.total = record.total;
+    } else if (record.type === "error") {
+      throw new Error(record.error || "Comparison failed");
+    }
+  };
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let nl;
+    while ((nl = buffer.indexOf("\n")) !== -1) {
+      handle(buffer.slice(0, nl));
+      buffer = buffer.slice(nl + 1);
+    }
+  }
+  handle(buffer);
+
+  return result;
+}
+
+// ---------- Rendering (same markup as the server's HTML view) ----------
+const OP_CLASS = { 0: "same", "-1": "removed", 1: "new" };
+
+const escapeHtml = (text) =>
+  text.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+
+const opsHtml = (ops, valueChanged) =>
+  ops
+    .map(([op, text]) => {
+      const safe = escapeHtml(text);
+      return `<span class="${OP_CLASS[op]}">${valueChanged ? safe : safe.replace(/\n/g, "<br/>")}</span>`;
+    })
+    .join("");
+
+function blockHtml(block) {
+  if (block.status === "same") {
+    return `<div class="para same">${opsHtml(block.ops, block.value_changed)}</div>`;
+  }
+  if (block.status === "removed" || block.status === "new") {
+    return `<div class="para ${block.status}">${escapeHtml(block.ops[0][1])}</div>`;
+  }
+  const lines = block.lines.map((line) =>
+    line.status === "removed" || line.status === "new"
+      ? `<div class="line ${line.status}">${escapeHtml(line.ops[0][1])}</div>`
+      : `<div class="line ${line.status}">${opsHtml(line.ops, line.value_changed)}</div>`
+  );
+  return `<div class="para">${lines.join("")}</div>`;
+}
+
+export const blocksToHtml = (blocks) => blocks.map(blockHtml).join("\n");
@@ -1,10 +1,14 @@
 import os
 import fitz
-import requests
-import uuid
 import re
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
+from azure_clients import get_blob_service
+from embeddings import get_embedding as _batched_get_embedding
+from ingest_pipeline import run_ingestion, chunk_text, chunk_provenance
+from retrieval import get_backend
+from answer_cache import answer_cache
+from pdf_pages import iter_pages
+from chunking import chunk_pages
 import logging
 
 # Optional: configure logging format and level
@@ -19,23 +23,6 @@ BLOB_CONN_STR = os.getenv("AZURE_BLOB_CONNECTION_STRING")
 
 BLOB_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER")
 
-EMBEDDING_URL = (
-    f"{os.getenv('AZURE_OPENAI_ENDPOINT')}openai/deployments/"
-    f"{os.getenv('AZURE_EMBEDDING_DEPLOYMENT')}/embeddings?api-version={os.getenv('AZURE_API_VERSION')}"
-)
-EMBEDDING_HEADERS = {
-    "api-key": os.getenv("AZURE_OPENAI_API_KEY"),
-    "Content-Type": "application/json"
-}
-
-SEARCH_URL = (
-    f"{os.getenv('AZURE_SEARCH_ENDPOINT')}/indexes/{os.getenv('AZURE_MULTI_DOC_INDEX')}"
-    f"/docs/index?api-version=2023-07-01-Preview"
-)
-SEARCH_HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": os.getenv("AZURE_SEARCH_API_KEY")
-}
 
 
 # ------------------ Normalization ------------------
@@ -52,70 +39,60 @@ def normalize_text(text: str) -> str:
 
 
 # ------------------ Chunk Extraction ------------------
-def extract_chunks(pdf_bytes):
+def iter_chunks(pdf_bytes):
     """
-    Extract text from PDF.
-    - Each page = 1 chunk.
+    Extract text from PDF lazily.
+    - Token-sized chunks with overlap, split on paragraph/table blocks.
     - Normalize text for consistent embeddings.
     """
     doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    chunks = []
 
-    for page in doc:
-        raw_text = page.get_text("text").strip()
-        if not raw_text:
-            continue
-        norm_text = normalize_text(raw_text)
-        chunks.append(norm_text)
+    for chunk in chunk_pages(iter_pages(doc)):
+        chunk["content"] = normalize_text(chunk["content"])
+        yield chunk
 
-    return chunks
+
+def extract_chunks(pdf_bytes):
+    return list(iter_chunks(pdf_bytes))
 
 
 # ------------------ Embedding ------------------
 def get_embedding(text):
-    data = {"input": text, "model": os.getenv("AZURE_EMBEDDING_DEPLOYMENT")}
-    res = requests.post(EMBEDDING_URL, headers=EMBEDDING_HEADERS, json=data)
-    if res.status_code == 200:
-        return res.json()["data"][0]["embedding"]
+    return _batched_get_embedding(text)
 
-    print("❌ Embedding failed:", res.text)
-    return []
 
-
-def push_chunks(chunks, blob_name, filename):
+def push_chunks(chunks, blob_name, filename, reingest=False):
     if not os.getenv("AZURE_MULTI_DOC_INDEX"):
         raise ValueError("❌ Missing AZURE_MULTI_DOC_INDEX in .env")
 
-    documents = []
-    for i, chunk in enumerate(chunks):
-        logging.info(f"🔄 Chunk {i + 1}/{len(chunks)} for {blob_name}")
-        vector = get_embedding(chunk)
-        if not vector:
-            continue
-        documents.append({
-            "@search.action": "upload",
-            "id": str(uuid.uuid4()),
-            "content": chunk,
+    def make_document(doc_id, chunk, vector):
+        return {
+            "id": doc_id,
+            "content": chunk_text(chunk),
             "embedding": vector,
             "metadata": f"source:{blob_name}",
-            "filename": filename
-        })
-
-    if documents:
-        payload = {"value": documents}
-        res = requests.post(SEARCH_URL, headers=SEARCH_HEADERS, json=payload)
-        logging.info(f"Azure Search upload response: {res.status_code} - {res.text}")
-    else:
-        logging.warning(f"⚠ No chunks to upload for {blob_name}")
-
-
-def process_blob(blob_name, filename):
-    blob_service = BlobServiceClient.from_connection_string(BLOB_CONN_STR)
-    blob_client = blob_service.get_blob_client(BLOB_CONTAINER, blob_name)
+            "filename": filename,
+            **chunk_provenance(chunk)
+        }
+
+    backend = get_backend("multi_doc")
+    existing_ids = backend.source_ids(blob_name) if reingest else None
+    summary = run_ingestion(chunks, make_document, backend, blob_name, existing_ids)
+    # Cached chat answers may quote chunks that just changed
+    answer_cache.invalidate(blob_name)
+    if not summary["uploaded"] and not summary["unchanged"]:
+        logging.warning(f"⚠ No chunks uploaded for {blob_name}")
+    for doc_id, error in summary["upload_failures"]:
+        logging.error(f"❌ Azure Search rejected chunk {doc_id} of {blob_name}: {error}")
+    return summary
+
+
+def process_blob(blob_name, filename, reingest=False):
+    blob_client = get_blob_service(BLOB_CONN_STR).get_blob_client(BLOB_CONTAINER, blob_name)
     pdf_bytes = blob_client.download_blob().readall()
-    chunks = extract_chunks(pdf_bytes)
-    logging.info(f"✅ Extracted {len(chunks)} chunks from {filename}")
-    push_chunks(chunks, blob_name, filename)
+    summary = push_chunks(iter_chunks(pdf_bytes), blob_name, filename, reingest=reingest)
+    logging.info(f"✅ Extracted {summary['chunks']} chunks from {filename}")
+    return summary
 
 
 if __name__ == "__main__":
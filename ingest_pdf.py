@@ -1,9 +1,12 @@
 import os
 import fitz  # PyMuPDF – used for reading PDF
-import requests
-import uuid
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
+from embeddings import get_embedding as _batched_get_embedding
+from ingest_pipeline import run_ingestion, chunk_text, chunk_provenance
+from retrieval import get_backend
+from answer_cache import answer_cache
+from pdf_pages import iter_pages
+from chunking import chunk_pages
 
 # Load environment variables
 load_dotenv()
@@ -15,89 +18,59 @@ BLOB_CONN_STR = (
 )
 BLOB_CONTAINER = os.getenv('AZURE_STORAGE_CONTAINER')
 
-EMBEDDING_URL = (
-    f"{os.getenv('AZURE_OPENAI_ENDPOINT')}openai/deployments/"
-    f"{os.getenv('AZURE_EMBEDDING_DEPLOYMENT')}/embeddings?api-version={os.getenv('AZURE_API_VERSION')}"
-)
-EMBEDDING_HEADERS = {
-    "api-key": os.getenv("AZURE_OPENAI_API_KEY"),
-    "Content-Type": "application/json"
-}
-
-SEARCH_URL = (
-    f"{os.getenv('AZURE_SEARCH_ENDPOINT')}/indexes/{os.getenv('AZURE_SEARCH_INDEX')}"
-    f"/docs/index?api-version=2023-07-01-Preview"
-)
-SEARCH_HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": os.getenv("AZURE_SEARCH_API_KEY")
-}
 
 
-# 📄 Extract Text Page-by-Page
-def extract_chunks(pdf_path):
+# 📄 Extract Token-sized Chunks (with page provenance)
+def iter_chunks(pdf_path):
     doc = fitz.open(pdf_path)
-    chunks = []
-    for page in doc:
-        text = page.get_text().strip()
-        if text:
-            chunks.append(text)
-    return chunks
+    yield from chunk_pages(iter_pages(doc))
+
+
+def extract_chunks(pdf_path):
+    return list(iter_chunks(pdf_path))
 
 
 # 🧠 Get Embedding Vector for Each Chunk
 def get_embedding(text):
-    data = {
-        "input": text,
-        "model": os.getenv("AZURE_EMBEDDING_DEPLOYMENT")
-    }
-    res = requests.post(EMBEDDING_URL, headers=EMBEDDING_HEADERS, json=data)
-    if res.status_code == 200:
-        return res.json()['data'][0]['embedding']
-    else:
-        print("❌ Embedding failed:", res.text)
-        return []
+    return _batched_get_embedding(text)
 
 
 # 🔍 Push Chunk + Embedding to Azure Cognitive Search
-def push_chunks_to_search(chunks, source_name):
-    documents = []
-    for i, chunk in enumerate(chunks):
-        print(f"🔄 Processing chunk {i+1}/{len(chunks)}")
-        vector = get_embedding(chunk)
-        if not vector:
-            print("❌ Skipping chunk due to missing embedding")
-            continue
-        documents.append({
-            "@search.action": "upload",
-            "id": str(uuid.uuid4()),
-            "content": chunk,
+def push_chunks_to_search(chunks, source_name, reingest=False):
+    """
+    Embed and index chunks under `source_name`. With `reingest`, only chunks
+    that changed since the last ingestion of that source are embedded and
+    uploaded, and chunks that disappeared are deleted.
+    """
+    def make_document(doc_id, chunk, vector):
+        return {
+            "id": doc_id,
+            "content": chunk_text(chunk),
             "embedding": vector,
-            "metadata": f"source:{source_name}"
-        })
-
-    if not documents:
-        print("❌ No documents to upload to Azure Search.")
-        return
-
-    payload = {"value": documents}
-    res = requests.post(SEARCH_URL, headers=SEARCH_HEADERS, json=payload)
-
-    print("🔍 Azure Search Response:")
-    print("Status Code:", res.status_code)
-    print("Response Body:", res.text)
-
-    if res.status_code == 200:
-        print("✅ Chunks uploaded to Azure Cognitive Search successfully.")
+            "metadata": f"source:{source_name}",
+            **chunk_provenance(chunk)
+        }
+
+    backend = get_backend("pdf")
+    existing_ids = backend.source_ids(source_name) if reingest else None
+    summary = run_ingestion(chunks, make_document, backend, source_name, existing_ids)
+    # Cached chat answers may quote chunks that just changed
+    answer_cache.invalidate(source_name)
+
+    if not summary["uploaded"] and not summary["unchanged"]:
+        print("❌ No documents uploaded to Azure Cognitive Search.")
+    elif summary["upload_failures"]:
+        print(f"❌ {len(summary['upload_failures'])} chunks failed to upload:", summary["upload_failures"])
     else:
-        print("❌ Failed to upload to Azure Cognitive Search.")
+        print("✅ Chunks uploaded to Azure Cognitive Search successfully.")
+    return summary
 
 
 # 🚀 Run Everything Together
-def process_pdf(pdf_path):
-    chunks = extract_chunks(pdf_path)
-    print(f"✅ Extracted {len(chunks)} chunks from PDF")
-    push_chunks_to_search(chunks, source_name=os.path.basename(pdf_path))
+def process_pdf(pdf_path, reingest=False):
+    summary = push_chunks_to_search(iter_chunks(pdf_path), source_name=os.path.basename(pdf_path), reingest=reingest)
+    print(f"✅ Extracted {summary['chunks']} chunks from PDF")
+    return summary
 
 
 # testing ke liye sample uthao
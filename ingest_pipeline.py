@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from embeddings import (
+    get_embeddings,
+    estimate_tokens,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_TOKENS,
+)
+
+load_dotenv()
+
+# Stage sizing – Azure Search accepts at most 1000 actions / 16 MB per request
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+SEARCH_UPLOAD_BATCH_DOCS = int(os.getenv("SEARCH_UPLOAD_BATCH_DOCS", "500"))
+SEARCH_UPLOAD_BATCH_BYTES = int(os.getenv("SEARCH_UPLOAD_BATCH_BYTES", str(8 * 1024 * 1024)))
+
+
+# ------------------ Upload Stage ------------------
+class _UploadBuffer:
+    """Collects documents and flushes them by count and serialized size."""
+
+    def __init__(self, executor, backend):
+        self.executor = executor
+        self.backend = backend
+        self.documents = []
+        self.size = 0
+        self.futures = []
+
+    def add(self, document):
+        doc_size = len(json.dumps(document))
+        if self.documents and (
+            len(self.documents) >= SEARCH_UPLOAD_BATCH_DOCS
+            or self.size + doc_size > SEARCH_UPLOAD_BATCH_BYTES
+        ):
+            self.flush()
+        self.documents.append(document)
+        self.size += doc_size
+
+    def flush(self):
+        if not self.documents:
+            return
+        batch, self.documents, self.size = self.documents, [], 0
+        # Backpressure: keep at most two batches queued behind the uploaders
+        queued = [f for _, f in self.futures if not f.done()]
+        if len(queued) >= 2:
+            wait(queued, return_when=FIRST_COMPLETED)
+        self.futures.append(
+            (len(batch), self.executor.submit(self.backend.upload, batch))
+        )
+
+
+# ------------------ Chunk Identity ------------------
+def chunk_id(source, position, text):
+    """
+    Deterministic index key: source + chunk position + content hash, so
+    re-ingesting a document overwrites its chunks instead of duplicating them.
+    """
+    source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{source_hash}-{position:05d}-{content_hash}"
+
+
+# ------------------ Pipeline ------------------
+def chunk_text(chunk):
+    """Chunks are either plain strings or chunk dicts from chunking.chunk_pages."""
+    return chunk["content"] if isinstance(chunk, dict) else chunk
+
+
+def chunk_provenance(chunk):
+    """Index fields locating a chunk in its source PDF (empty for plain-string chunks)."""
+    if not isinstance(chunk, dict):
+        return {}
+    return {k: chunk[k] for k in ("page", "page_end", "char_start", "char_end") if k in chunk}
+
+
+def _iter_embed_batches(chunks):
+    batch, batch_tokens = [], 0
+    for doc_id, chunk in chunks:
+        tokens = chunk.get("tokens") if isinstance(chunk, dict) else None
+        tokens = tokens or estimate_tokens(chunk_text(chunk))
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((doc_id, chunk))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _embed(batch):
+    vectors, failures = get_embeddings([chunk_text(chunk) for _, chunk in batch])
+    return batch, vectors, failures
+
+
+def run_ingestion(chunks, make_document, backend, source, existing_ids=None):
+    """
+    Staged extract → embed → upload pipeline.
+
+    `chunks` may be any iterable (a generator keeps extraction lazy).
+    Embedding batches run on a bounded worker pool; finished vectors are
+    turned into index documents with `make_document(doc_id, chunk, vector)`
+    and uploaded to the retrieval `backend` in size-capped batches while
+    later batches are still embedding.
+
+    Re-ingest mode: pass the ids already indexed for `source` as
+    `existing_ids`. Chunks whose deterministic id is among them are unchanged
+    and skipped; ids that no longer occur are deleted afterwards.
+    """
+    summary = {
+        "chunks": 0, "embedded": 0, "uploaded": 0, "unchanged": 0, "deleted": 0,
+        "embed_failures": {}, "upload_failures": []
+    }
+    seen_ids = set()
+
+    def new_chunks():
+        for i, chunk in enumerate(chunks):
+            doc_id = chunk_id(source, i, chunk_text(chunk))
+            seen_ids.add(doc_id)
+            summary["chunks"] += 1
+            if existing_ids and doc_id in existing_ids:
+                summary["unchanged"] += 1
+                continue
+            yield doc_id, chunk
+
+    max_in_flight = INGEST_EMBED_WORKERS * 2
+
+    with ThreadPoolExecutor(max_workers=INGEST_EMBED_WORKERS) as embed_pool, \
+            ThreadPoolExecutor(max_workers=2) as upload_pool:
+        buffer = _UploadBuffer(upload_pool, backend)
+        in_flight = set()
+
+        def collect(done):
+            for future in done:
+                batch, vectors, failures = future.result()
+                for pos, (doc_id, chunk) in enumerate(batch):
+                    if pos in failures:
+                        summary["embed_failures"][doc_id] = failures[pos]
+                        continue
+                    summary["embedded"] += 1
+                    buffer.add(make_document(doc_id, chunk, vectors[pos]))
+
+        for batch in _iter_embed_batches(new_chunks()):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(embed_pool.submit(_embed, batch))
+
+        collect(wait(in_flight).done)
+        buffer.flush()
+
+        for count, future in buffer.futures:
+            failed = future.result()
+            summary["uploaded"] += count - len(failed)
+            summary["upload_failures"].extend(failed)
+
+    if existing_ids:
+        vanished = existing_ids - seen_ids
+        if vanished:
+            failed = backend.delete(vanished)
+            summary["deleted"] = len(vanished) - len(failed)
+
+    logging.info(
+        f"📦 Ingestion {source}: {summary['uploaded']}/{summary['chunks']} chunks indexed, "
+        f"{summary['unchanged']} unchanged, {summary['deleted']} deleted "
+        f"({len(summary['embed_failures'])} embed failures, {len(summary['upload_failures'])} upload failures)"
+    )
+    return summary
@@ -0,0 +1,220 @@
+import os
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# How often a running job renews its lease, independent of stage transitions
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+
+
+class JobProgress:
+    """Handed to job handlers so they can report which pipeline stage is running."""
+
+    def __init__(self, queue, job_id, lease_owner=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.lease_owner = lease_owner
+
+    def stage(self, name):
+        now = datetime.utcnow()
+        job = self.queue.collection.find_one({"_id": self.job_id}, {"stages": 1})
+        stages = (job or {}).get("stages", [])
+        for st in stages:
+            if st["status"] == "running":
+                st["status"] = "done"
+                st["finished_at"] = now
+        found = False
+        for st in stages:
+            if st["name"] == name:
+                st["status"] = "running"
+                st["started_at"] = now
+                found = True
+        if not found:
+            stages.append({"name": name, "status": "running", "started_at": now})
+        self.queue.collection.update_one(
+            self.queue._owned(self.job_id, self.lease_owner),
+            {"$set": {
+                "stages": stages,
+                "current_stage": name,
+                "updated_at": now,
+                # Each stage transition doubles as a heartbeat
+                "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            }}
+        )
+
+
+class _NoProgress:
+    """Stand-in used when the pipeline runs synchronously inside a request."""
+
+    def stage(self, name):
+        pass
+
+
+NO_PROGRESS = _NoProgress()
+
+
+class JobQueue:
+    """
+    MongoDB-backed job queue. Jobs are claimed atomically with a lease, so a
+    job whose worker died is picked up again by any instance once the lease
+    expires.
+    """
+
+    def __init__(self, collection, workers=JOB_WORKERS):
+        self.collection = collection
+        self.workers = workers
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def register(self, kind, handler):
+        """`handler(payload, progress)` returns the job result (JSON-serializable)."""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, stages=()):
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        self.collection.insert_one({
+            "_id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "payload": payload,
+            "stages": [{"name": s, "status": "pending"} for s in stages],
+            "current_stage": None,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        })
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id, user_id=None):
+        """The job without its payload; with `user_id`, only when that user enqueued it."""
+        query = {"_id": job_id}
+        if user_id is not None:
+            query["payload.user_id"] = user_id
+        return self.collection.find_one(query, {"payload": 0, "lease_until": 0, "lease_owner": 0})
+
+    # ---------- Worker side ----------
+    @staticmethod
+    def _owned(job_id, lease_owner):
+        """Filter matching the job only while this claim still holds its lease."""
+        return {"_id": job_id, "lease_owner": lease_owner} if lease_owner else {"_id": job_id}
+
+    def _claim(self):
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {
+                "kind": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": self._worker_id,
+                    # Fencing token: only this claim may renew or finish the job
+                    "lease_owner": f"{self._worker_id}:{uuid.uuid4().hex}",
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _heartbeat(self, job_id, lease_owner, stop):
+        """Renew the lease until `stop` is set or another worker took the job over."""
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                renewed = self.collection.update_one(
+                    {"_id": job_id, "lease_owner": lease_owner, "status": "running"},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+                )
+                if renewed.matched_count == 0:
+                    logging.warning(f"⚠️ Job {job_id} lease lost, its result will be discarded")
+                    return
+            except Exception as e:
+                logging.error(f"❌ Job {job_id} heartbeat failed: {e}")
+
+    def _finish(self, job_id, lease_owner=None, **fields):
+        now = datetime.utcnow()
+        job = self.collection.find_one({"_id": job_id}, {"stages": 1})
+        stages = (job or {}).get("stages", [])
+        for st in stages:
+            if st["status"] == "running":
+                st["status"] = "done" if fields.get("status") == "done" else "failed"
+                st["finished_at"] = now
+            elif st["status"] == "pending" and fields.get("status") == "done":
+                # optional stages the job never entered (e.g. OCR of a text PDF)
+                st["status"] = "skipped"
+        result = self.collection.update_one(
+            self._owned(job_id, lease_owner),
+            {"$set": {**fields, "stages": stages, "updated_at": now, "finished_at": now},
+             "$unset": {"lease_until": "", "lease_owner": ""}}
+        )
+        if result.matched_count == 0:
+            logging.warning(f"⚠️ Job {job_id} was re-claimed by another worker, not recording its outcome")
+        return result.matched_count > 0
+
+    def _run(self, job):
+        handler = self.handlers[job["kind"]]
+        owner = job.get("lease_owner")
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job["_id"], owner, stop), name=f"job-heartbeat-{job['_id']}", daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = handler(job["payload"], JobProgress(self, job["_id"], owner))
+            if self._finish(job["_id"], owner, status="done", result=result):
+                logging.info(f"✅ Job {job['_id']} ({job['kind']}) finished")
+        except Exception as e:
+            logging.error(f"❌ Job {job['_id']} ({job['kind']}) failed: {e}")
+            if job.get("attempts", 1) >= JOB_MAX_ATTEMPTS:
+                self._finish(job["_id"], owner, status="failed", error=str(e))
+            else:
+                self.collection.update_one(
+                    self._owned(job["_id"], owner),
+                    {"$set": {"status": "queued", "error": str(e), "updated_at": datetime.utcnow()},
+                     "$unset": {"lease_until": "", "lease_owner": ""}}
+                )
+        finally:
+            stop.set()
+
+    def _loop(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                logging.error(f"❌ Job queue poll failed: {e}")
+                job = None
+            if job:
+                self._run(job)
+                continue
+            self._wakeup.wait(JOB_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
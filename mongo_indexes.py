@@ -0,0 +1,203 @@
+"""
+MongoDB indexes for every hot query, applied idempotently.
+
+    python mongo_indexes.py                       # create the indexes
+    python mongo_indexes.py --explain             # fail on any COLLSCAN plan
+    python mongo_indexes.py --explain --scratch   # same, against a throwaway database
+
+tests/test_mongo_indexes.py runs the same plan checks under pytest.
+
+The app applies INDEX_SPEC at startup (MONGO_ENSURE_INDEXES=0 to skip).
+--explain runs explain() for each query in hot_queries() and exits non-zero
+if a winning plan contains a collection scan.
+"""
+import os
+import sys
+import uuid
+import logging
+import argparse
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1").lower() in ("1", "true", "yes")
+# Stored /compare results are deleted this long after they were created. Changing it
+# later needs a collMod on the existing index (ensure_indexes logs the conflict).
+COMPARE_RETENTION_SECONDS = int(os.getenv("COMPARE_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Finished (done / failed) jobs are deleted this long after finished_at; queued and running jobs have none
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# collection → indexes
+INDEX_SPEC = {
+    "extracted_data": [
+        # /chat, /save
+        IndexModel([("pdf_id", ASCENDING)], name="pdf_id_unique", unique=True),
+        # /analytics/*, calculate_analytics, and the (timestamp, _id) keyset of /analytics/pdf-details
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                   name="user_timestamp_id"),
+        # least accurate PDF of an analytics period
+        IndexModel([("user_id", ASCENDING), ("corrections", ASCENDING), ("timestamp", ASCENDING)],
+                   name="user_corrections_timestamp"),
+    ],
+    "users": [
+        # login / signup
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "categories": [
+        # every classify call and the category routes (one document per user)
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "jobs": [
+        # JobQueue._claim: queued jobs and expired leases, oldest first
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=JOB_RETENTION_SECONDS),
+    ],
+    "analytics_daily": [
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], name="user_day"),
+    ],
+    "revoked_tokens": [
+        # revocations disappear once the tokens they cover have expired
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "comparisons": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=COMPARE_RETENTION_SECONDS),
+    ],
+    "comparison_blocks": [
+        # GET /compare/<id>/blocks
+        IndexModel([("comparison_id", ASCENDING), ("seq", ASCENDING)], name="comparison_seq_unique", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=COMPARE_RETENTION_SECONDS),
+    ],
+}
+
+
+def ensure_indexes(db, spec=None):
+    """
+    Create the indexes in `spec` (default INDEX_SPEC). Existing identical
+    indexes are a no-op; an index that can't be built (e.g. duplicates
+    under a unique constraint) is logged and skipped. Returns the names created or confirmed.
+    """
+    spec = spec or INDEX_SPEC
+    done = []
+    for collection, models in spec.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                db[collection].create_indexes([model])
+                done.append(f"{collection}.{name}")
+            except OperationFailure as e:
+                logging.warning(f"⚠️ Could not create index {collection}.{name}: {e}")
+    return done
+
+
+# ------------------ Query Plans ------------------
+def hot_queries():
+    """(label, collection, filter, sort) for the queries the routes run most."""
+    now = datetime.utcnow()
+    month_ago = now - timedelta(days=30)
+    return [
+        ("/chat, /save: record by pdf_id", "extracted_data", {"pdf_id": "sample"}, None),
+        ("/analytics, /analytics/trends: period of a user", "extracted_data",
+         {"user_id": "sample", "timestamp": {"$gte": month_ago}}, None),
+        ("/analytics/pdf-details: first page", "extracted_data",
+         {"user_id": "sample"}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ("/analytics/pdf-details: next page", "extracted_data",
+         {"user_id": "sample", "$or": [
+             {"timestamp": {"$lt": now}},
+             {"timestamp": now, "_id": {"$lt": ObjectId()}},
+         ]}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ("/analytics: least accurate PDF", "extracted_data",
+         {"user_id": "sample", "corrections": 3, "timestamp": {"$gte": month_ago}}, [("timestamp", ASCENDING)]),
+        ("/analytics: rollup days", "analytics_daily",
+         {"user_id": "sample", "day": {"$gte": month_ago}}, [("day", ASCENDING)]),
+        ("/login, /signup: user by email", "users", {"email": "sample@example.com"}, None),
+        ("load_current_user: user by _id", "users", {"_id": ObjectId()}, None),
+        ("/classify-docs: categories of a user", "categories", {"user_id": "sample"}, None),
+        ("JobQueue._claim", "jobs", {
+            "kind": {"$in": ["extract", "multi_doc"]},
+            "$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}],
+        }, [("created_at", ASCENDING)]),
+        ("/compare/<id>/blocks", "comparison_blocks",
+         {"comparison_id": "sample", "seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ]
+
+
+def _stages(plan):
+    """Every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def explain_query(db, collection, query, sort=None):
+    """Stage names of the winning plan of a find()."""
+    cursor = db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    winning = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+    return list(_stages(winning))
+
+
+def explain_hot_queries(db):
+    """[(label, stages, ok)] with ok False when the winning plan scans the collection."""
+    results = []
+    for label, collection, query, sort in hot_queries():
+        stages = explain_query(db, collection, query, sort)
+        results.append((label, stages, "COLLSCAN" not in stages))
+    return results
+
+
+def _seed_scratch(db):
+    """A few documents per collection so the planner has real collections to plan against."""
+    now = datetime.utcnow()
+    db["extracted_data"].insert_many([
+        {"pdf_id": str(uuid.uuid4()), "user_id": f"user{i % 3}", "timestamp": now - timedelta(days=i),
+         "corrections": i % 4, "pdfName": f"doc{i}.pdf"} for i in range(20)
+    ])
+    db["users"].insert_many([{"email": f"user{i}@example.com"} for i in range(5)])
+    db["categories"].insert_many([{"user_id": f"user{i}", "categories": []} for i in range(5)])
+    db["jobs"].insert_many([{"kind": "extract", "status": "done", "created_at": now, "finished_at": now}
+                            for _ in range(5)])
+    db["analytics_daily"].insert_many([
+        {"_id": f"user0:{i}", "user_id": "user0", "day": now - timedelta(days=i)} for i in range(5)
+    ])
+    db["comparisons"].insert_one({"_id": "c", "status": "done", "created_at": now})
+    db["comparison_blocks"].insert_many([{"comparison_id": "c", "seq": i, "created_at": now} for i in range(1, 6)])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--explain", action="store_true", help="check the hot queries' plans for COLLSCAN")
+    parser.add_argument("--scratch", action="store_true", help="use a throwaway database (dropped afterwards)")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    db_name = f"pdf_data_indexcheck_{uuid.uuid4().hex[:8]}" if args.scratch else "pdf_data"
+    db = client[db_name]
+    try:
+        if args.scratch:
+            _seed_scratch(db)
+        for name in ensure_indexes(db):
+            print(f"✅ {name}")
+        if not args.explain:
+            sys.exit(0)
+
+        failures = 0
+        for label, stages, ok in explain_hot_queries(db):
+            failures += not ok
+            print(f"{'✅' if ok else '❌'} {label}: {' > '.join(stages)}")
+        print("✅ No collection scans" if not failures else f"❌ {failures} queries scan a collection")
+        sys.exit(1 if failures else 0)
+    finally:
+        if args.scratch:
+            client.drop_database(db_name)
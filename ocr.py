@@ -0,0 +1,124 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+from pdf_pages import page_from_text
+
+load_dotenv()
+
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+OCR_MIN_PAGE_WORDS = int(os.getenv("OCR_MIN_PAGE_WORDS", "5"))
+# Leave unset to use the tesseract binary on PATH (e.g. r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+TESSERACT_CMD = os.getenv("TESSERACT_CMD")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(tesseract_cmd):
+    import pytesseract
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _ocr_page(doc, index, dpi):
+    """Render a single page straight from the open PDF and OCR it."""
+    import pytesseract
+    from PIL import Image
+
+    try:
+        pix = doc[index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        return index, pytesseract.image_to_string(img), None
+    except Exception as e:
+        return index, "", str(e)
+
+
+def _ocr_batch(pdf_bytes, page_indexes, dpi):
+    """OCR a batch of pages of one PDF, opening it once; the handle never leaves this call."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return [_ocr_page(doc, i, dpi) for i in page_indexes]
+    finally:
+        doc.close()
+
+
+def _get_pool():
+    """The process pool shared by every OCR call in this process, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps the Mongo client and app threads out of the workers
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(TESSERACT_CMD,)
+            )
+        return _pool
+
+
+def _reset_pool(pool):
+    """Drop a broken pool (a worker died) so the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_pages(pdf_bytes, page_indexes, dpi=None):
+    """
+    OCR the given 0-based page indexes in parallel and return {index: text}.
+    Pages are rendered one at a time inside the workers, so the full list of
+    page images never exists in memory. Concurrent calls share one pool of
+    OCR_WORKERS processes; each call sends the PDF once per batch of pages.
+    """
+    page_indexes = list(page_indexes)
+    if not page_indexes:
+        return {}
+    dpi = dpi or OCR_DPI
+    batches = min(OCR_WORKERS, len(page_indexes))
+
+    if batches <= 1:
+        _init_worker(TESSERACT_CMD)
+        outcomes = _ocr_batch(pdf_bytes, page_indexes, dpi)
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(_ocr_batch, pdf_bytes, page_indexes[i::batches], dpi) for i in range(batches)]
+        outcomes = []
+        try:
+            for future in as_completed(futures):
+                outcomes.extend(future.result())
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            raise
+
+    results = {}
+    for index, text, error in outcomes:
+        if error:
+            logging.error(f"❌ Tesseract OCR failed on page {index + 1}: {error}")
+        results[index] = text
+    return results
+
+
+def ocr_sparse_pages(pdf_bytes, pages, min_words=None):
+    """
+    Re-read the pages whose text layer is empty or near-empty with OCR and
+    return the page list with those entries replaced.
+    """
+    min_words = OCR_MIN_PAGE_WORDS if min_words is None else min_words
+    targets = [p.number - 1 for p in pages if p.word_count < min_words]
+    logging.info(f"🔎 OCR on {len(targets)}/{len(pages)} pages")
+
+    texts = ocr_pages(pdf_bytes, targets)
+    updated = list(pages)
+    for index, text in texts.items():
+        page = page_from_text(index + 1, text)
+        if page.word_count > updated[index].word_count:
+            updated[index] = page
+    return updated
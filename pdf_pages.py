@@ -0,0 +1,87 @@
+import os
+import re
+from typing import NamedTuple, Tuple
+import fitz  # PyMuPDF
+
+# Table detection is accurate but costs tens of ms per page, so it is opt-in
+CHUNK_DETECT_TABLES = os.getenv("CHUNK_DETECT_TABLES", "0").lower() in ("1", "true", "yes")
+
+
+class PageText(NamedTuple):
+    number: int                # 1-based page number
+    text: str                  # page text: the blocks joined with "\n"
+    word_count: int
+    empty: bool
+    blocks: Tuple[str, ...]    # paragraph / table blocks in reading order
+
+
+def make_page(number, blocks):
+    blocks = tuple(b for b in (blk.strip() for blk in blocks) if b)
+    text = "\n".join(blocks)
+    return PageText(number, text, len(text.split()), not text, blocks)
+
+
+def page_from_text(number, text):
+    """Build a page from plain text (e.g. OCR output), one block per paragraph."""
+    return make_page(number, re.split(r"\n\s*\n", text or ""))
+
+
+# ------------------ Block Extraction ------------------
+def _inside(rect, bbox):
+    x0, y0, x1, y1 = bbox
+    return x0 >= rect.x0 - 1 and y0 >= rect.y0 - 1 and x1 <= rect.x1 + 1 and y1 <= rect.y1 + 1
+
+
+def _table_blocks(page):
+    """Detected tables as (bbox, text) with one ' | '-joined line per row."""
+    tables = []
+    try:
+        found = page.find_tables()
+    except Exception:
+        return tables
+    for table in found.tables:
+        rows = [" | ".join((cell or "").strip() for cell in row) for row in table.extract()]
+        tables.append((fitz.Rect(table.bbox), "\n".join(r for r in rows if r.strip(" |"))))
+    return tables
+
+
+def page_blocks(page):
+    """
+    Text blocks of a fitz page in reading order. With CHUNK_DETECT_TABLES on,
+    every block inside a detected table is replaced by one block for the
+    whole table so chunking never cuts through it.
+    """
+    raw = [b for b in page.get_text("blocks", sort=True) if b[6] == 0]
+    if not CHUNK_DETECT_TABLES:
+        return [b[4] for b in raw]
+
+    tables = _table_blocks(page)
+    blocks, emitted = [], set()
+    for b in raw:
+        for t, (rect, table_text) in enumerate(tables):
+            if _inside(rect, b[:4]):
+                if t not in emitted:
+                    blocks.append(table_text)
+                    emitted.add(t)
+                break
+        else:
+            blocks.append(b[4])
+    return blocks
+
+
+# ------------------ Single-pass Page Extraction ------------------
+def iter_pages(doc):
+    for i, page in enumerate(doc):
+        yield make_page(i + 1, page_blocks(page))
+
+
+def extract_pages(doc):
+    """
+    Read every page of an open fitz document exactly once. Chunking, word
+    counts and the scanned-PDF/OCR decision all work off this result.
+    """
+    return list(iter_pages(doc))
+
+
+def open_pdf(pdf_bytes):
+    return fitz.open(stream=pdf_bytes, filetype="pdf")
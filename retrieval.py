@@ -0,0 +1,178 @@
+import os
+import time
+import random
+import threading
+import requests
+from dotenv import load_dotenv
+from azure_clients import get_session
+
+load_dotenv()
+
+# "azure" (Azure Cognitive Search) or "local" (in-process NumPy store, see vector_store.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "azure").lower()
+SEARCH_API_VERSION = "2023-07-01-Preview"
+SEARCH_UPLOAD_RETRIES = int(os.getenv("SEARCH_UPLOAD_RETRIES", "3"))
+
+# Per-item status codes Azure Search reports as transient
+RETRYABLE_ITEM_STATUS = {409, 422, 429, 503}
+
+# Logical index → env var holding the Azure index name
+INDEX_ENV = {
+    "pdf": "AZURE_SEARCH_INDEX",
+    "multi_doc": "AZURE_MULTI_DOC_INDEX",
+}
+
+
+def odata_filter(sources=None, filenames=None):
+    """OData filter restricting results to the given sources and/or filenames."""
+    clauses = []
+    if sources:
+        clauses.append(" or ".join(f"metadata eq 'source:{s.replace(chr(39), chr(39) * 2)}'" for s in sources))
+    if filenames:
+        clauses.append(" or ".join(f"filename eq '{f.replace(chr(39), chr(39) * 2)}'" for f in filenames))
+    return " and ".join(f"({c})" for c in clauses) or None
+
+
+class RetrievalBackend:
+    """
+    Interface every retrieval backend implements. Documents are dicts with
+    "id", "content", "embedding", "metadata" ("source:<key>") and optional
+    "filename" / provenance fields.
+    """
+
+    def upload(self, documents):
+        """Insert or replace documents by id; returns [(id, error)] for failures."""
+        raise NotImplementedError
+
+    def delete(self, ids):
+        """Delete documents by id; returns [(id, error)] for failures."""
+        raise NotImplementedError
+
+    def source_ids(self, source):
+        """Set of document ids stored for a source."""
+        raise NotImplementedError
+
+    def search(self, text=None, vector=None, k=20, top=None, sources=None, filenames=None, select=None):
+        """
+        Keyword search on `text`, vector search on `vector`, or hybrid when
+        both are given. Returns hit dicts (without embeddings) best first.
+        """
+        raise NotImplementedError
+
+
+# ------------------ Azure Cognitive Search ------------------
+def _backoff(attempt):
+    time.sleep(min(30, 2 ** attempt) + random.uniform(0, 1))
+
+
+class AzureSearchBackend(RetrievalBackend):
+    def __init__(self, index_name):
+        self.index_name = index_name
+        base = f"{os.getenv('AZURE_SEARCH_ENDPOINT')}/indexes/{index_name}/docs"
+        self.index_url = f"{base}/index?api-version={SEARCH_API_VERSION}"
+        self.search_url = f"{base}/search?api-version={SEARCH_API_VERSION}"
+        self.headers = {
+            "Content-Type": "application/json",
+            "api-key": os.getenv("AZURE_SEARCH_API_KEY")
+        }
+
+    def _post(self, url, payload):
+        return get_session("search").post(url, headers=self.headers, json=payload)
+
+    def upload(self, documents):
+        """
+        Whole-request 429/5xx retries happen in the pooled session; here only
+        the items the service reports as transiently failed are retried.
+        """
+        pending = [{"@search.action": "mergeOrUpload", **d} for d in documents]
+        permanent, failed = [], []
+        for attempt in range(SEARCH_UPLOAD_RETRIES + 1):
+            if attempt:
+                _backoff(attempt)
+            failed = []
+            try:
+                res = self._post(self.index_url, {"value": pending})
+            except requests.RequestException as e:
+                return permanent + [(d["id"], str(e)) for d in pending]
+
+            if res.status_code not in (200, 207):
+                return permanent + [(d["id"], f"{res.status_code}: {res.text}") for d in pending]
+
+            by_id = {d["id"]: d for d in pending}
+            retry = []
+            for item in res.json().get("value", []):
+                if item.get("status"):
+                    continue
+                error = f"{item.get('statusCode')}: {item.get('errorMessage')}"
+                if item.get("statusCode") in RETRYABLE_ITEM_STATUS and item.get("key") in by_id:
+                    retry.append(by_id[item["key"]])
+                    failed.append((item.get("key"), error))
+                else:
+                    permanent.append((item.get("key"), error))
+
+            if not retry:
+                return permanent
+            pending = retry
+
+        return permanent + failed
+
+    def delete(self, ids):
+        ids = sorted(ids)
+        failed = []
+        for start in range(0, len(ids), 1000):
+            batch = [{"@search.action": "delete", "id": i} for i in ids[start:start + 1000]]
+            failed.extend(self.upload(batch))
+        return failed
+
+    def source_ids(self, source):
+        """Paged by id, so sources with more than 1000 chunks are covered."""
+        base_filter = odata_filter(sources=[source])
+        ids, last = set(), None
+        while True:
+            flt = base_filter if last is None else f"{base_filter} and id gt '{last}'"
+            res = self._post(self.search_url, {
+                "search": "*", "filter": flt, "select": "id", "orderby": "id asc", "top": 1000
+            })
+            res.raise_for_status()
+            page = [doc["id"] for doc in res.json().get("value", [])]
+            ids.update(page)
+            if len(page) < 1000:
+                return ids
+            last = page[-1].replace("'", "''")
+
+    def search(self, text=None, vector=None, k=20, top=None, sources=None, filenames=None, select=None):
+        payload = {"search": text or "*"}
+        if vector:
+            payload["vector"] = {"value": vector, "fields": "embedding", "k": k}
+        flt = odata_filter(sources, filenames)
+        if flt:
+            payload["filter"] = flt
+        if select:
+            payload["select"] = select
+        if top:
+            payload["top"] = top
+        res = self._post(self.search_url, payload)
+        res.raise_for_status()
+        return res.json().get("value", [])
+
+
+# ------------------ Backend Selection ------------------
+_backends = {}
+_lock = threading.Lock()
+
+
+def get_backend(kind):
+    """Process-wide backend for the logical index `kind` ("pdf" or "multi_doc")."""
+    backend = _backends.get(kind)
+    if backend is None:
+        with _lock:
+            backend = _backends.get(kind)
+            if backend is None:
+                index_name = os.getenv(INDEX_ENV[kind]) or kind
+                if RETRIEVAL_BACKEND == "local":
+                    from vector_store import LocalVectorStore
+                    backend = LocalVectorStore(index_name)
+                else:
+                    backend = AzureSearchBackend(index_name)
+                _backends[kind] = backend
+    return backend
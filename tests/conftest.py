@@ -0,0 +1,28 @@
+import os
+import uuid
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# Tests that need MongoDB run against a throwaway database on this server
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"no mongod at {TEST_MONGO_URI}: {e}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def mongo_db(mongo_client):
+    """A fresh database, dropped after the test."""
+    name = f"smartdoc_test_{uuid.uuid4().hex[:8]}"
+    yield mongo_client[name]
+    mongo_client.drop_database(name)
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from collections import defaultdict
+from statistics import mean
+import pytest
+from Analytics import (
+    FIELDS, _EMPTY, _analytics_query, _accuracy, count_corrections, calculate_analytics,
+    calculate_analytics_from_rollups, backfill_rollups, insert_record, rollups_ready
+)
+
+
+# ------------------ Reference Implementation ------------------
+def calculate_analytics_python(pdf_collection, period="month", user_id=None):
+    """The original per-record loop the aggregation pipeline replaced."""
+    records = list(pdf_collection.find(_analytics_query(period, user_id)))
+
+    if not records:
+        return dict(_EMPTY)
+
+    total_pdfs = len(records)
+    field_confidence = defaultdict(list)
+    manual_reviews = defaultdict(int)
+    lowest_accuracy_pdf = {"pdfName": None, "accuracy": 100.0}
+
+    for rec in records:
+        ai_data = rec.get("ai_data", {})
+        user_data = rec.get("user_updated_data", {})
+
+     
+        for field in FIELDS:
+            ai_conf = ai_data.get("field_confidences", {}).get(field)
+            if ai_conf is not None:
+                try:
+                    field_confidence[field].append(float(ai_conf))
+                except ValueError:
+                    pass  # skip non-numeric
+
+            ai_val = ai_data.get(field)
+            user_val = user_data.get(field)
+            if ai_val:
+                is_corrected = user_val and str(ai_val).strip() != str(user_val).strip()
+                if is_corrected:
+                    manual_reviews[field] += 1
+
+        accuracy = _accuracy(count_corrections(ai_data, user_data))
+
+        if accuracy < lowest_accuracy_pdf["accuracy"]:
+            lowest_accuracy_pdf = {
+                "pdfName": rec.get("pdfName"),
+                "accuracy": accuracy
+            }
+
+    field_avg_conf = {k: round(mean(v), 2) for k, v in field_confidence.items()}
+    top_fields_review = sorted(manual_reviews, key=manual_reviews.get, reverse=True)[:3]
+
+    return {
+        "total_pdfs": total_pdfs,
+        "field_confidences": field_avg_conf,
+        "top_review_fields": top_fields_review,
+        "lowest_accuracy_pdf": lowest_accuracy_pdf
+    }
+
+
+# ------------------ Fixtures ------------------
+def fixture_records(user_id):
+    now = datetime.utcnow()
+    base = {"user_id": user_id}
+    return [
+        {**base, "pdfName": "clean.pdf", "timestamp": now - timedelta(hours=1),
+         "ai_data": {"issueDate": "01-01-2024", "field_confidences": {"name": 90, "contractAmount": 80, "issueDate": 95}}},
+        {**base, "pdfName": "one_fix.pdf", "timestamp": now - timedelta(days=2),
+         "ai_data": {"name": "A Kumar", "issueDate": "02-02-2024", "field_confidences": {"name": 60, "contractAmount": "70", "issueDate": 85}},
+         "user_updated_data": {"name": "Anil Kumar"}},
+        {**base, "pdfName": "two_fixes.pdf", "timestamp": now - timedelta(days=3),
+         "ai_data": {"contractAmount": 5000, "issueDate": "03-03-2024", "field_confidences": {"name": 40, "contractAmount": 55, "issueDate": None}},
+         "user_updated_data": {"contractAmount": "6000", "issueDate": " 04-03-2024 "}},
+        {**base, "pdfName": "whitespace_only.pdf", "timestamp": now - timedelta(days=10),
+         "ai_data": {"name": "Ravi", "field_confidences": {"name": "n/a", "contractAmount": 65}},
+         "user_updated_data": {"name": " Ravi ", "issueDate": "05-05-2024"}},
+        {**base, "pdfName": "raw_output.pdf", "timestamp": now - timedelta(days=20),
+         "ai_data": {"raw_output": "not json"}},
+        {**base, "pdfName": "old.pdf", "timestamp": now - timedelta(days=90),
+         "ai_data": {"name": "Old", "field_confidences": {"name": 10}}, "user_updated_data": {"name": "New"}},
+        {"user_id": "someone_else", "pdfName": "other.pdf", "timestamp": now,
+         "ai_data": {"name": "X"}, "user_updated_data": {"name": "Y"}},
+    ]
+
+
+@pytest.fixture
+def records(mongo_db):
+    collection = mongo_db["extracted_data"]
+    collection.insert_many(fixture_records("parity_user"))
+    return collection
+
+
+@pytest.mark.parametrize("user_id", ["parity_user", "someone_else", "nobody"])
+@pytest.mark.parametrize("period", ["day", "week", "month", "all"])
+def test_pipeline_matches_python_loop(records, user_id, period):
+    assert calculate_analytics(records, period, user_id) == calculate_analytics_python(records, period, user_id)
+
+
+def test_empty_collection(mongo_db):
+    assert calculate_analytics(mongo_db["extracted_data"], "month", "parity_user") == _EMPTY
+
+
+def test_rollups_ready_only_after_backfill(records, mongo_db):
+    rollups = mongo_db["analytics_daily"]
+    # Rollups written for new uploads alone don't make a user's history complete
+    insert_record(records, rollups, {"user_id": "parity_user", "pdfName": "new.pdf",
+                                     "timestamp": datetime.utcnow(), "ai_data": {"name": "N"}})
+    assert not rollups_ready(rollups, "parity_user")
+
+    backfill_rollups(records, rollups, "parity_user")
+    assert rollups_ready(rollups, "parity_user")
+    assert not rollups_ready(rollups, "someone_else")
+
+    fast = calculate_analytics_from_rollups(records, rollups, "all", "parity_user")
+    slow = calculate_analytics_python(records, "all", "parity_user")
+    assert fast["total_pdfs"] == slow["total_pdfs"]
+    assert fast["field_confidences"] == slow["field_confidences"]
+    assert fast["lowest_accuracy_pdf"]["accuracy"] == slow["lowest_accuracy_pdf"]["accuracy"]
@@ -0,0 +1,29 @@
+import pytest
+from mongo_indexes import INDEX_SPEC, ensure_indexes, explain_query, hot_queries, _seed_scratch
+
+HOT_QUERIES = hot_queries()
+
+
+@pytest.fixture
+def indexed_db(mongo_db):
+    _seed_scratch(mongo_db)
+    ensure_indexes(mongo_db)
+    return mongo_db
+
+
+def test_every_index_is_created(indexed_db):
+    for collection, models in INDEX_SPEC.items():
+        names = set(indexed_db[collection].index_information())
+        for model in models:
+            assert model.document["name"] in names, f"{collection}.{model.document['name']} missing"
+
+
+def test_ensure_indexes_is_idempotent(indexed_db):
+    expected = [f"{c}.{m.document['name']}" for c, models in INDEX_SPEC.items() for m in models]
+    assert ensure_indexes(indexed_db) == expected
+
+
+@pytest.mark.parametrize("label, collection, query, sort", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_an_index(indexed_db, label, collection, query, sort):
+    stages = explain_query(indexed_db, collection, query, sort)
+    assert "COLLSCAN" not in stages, f"{label}: {' > '.join(stages)}"
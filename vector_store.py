@@ -0,0 +1,308 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+from retrieval import RetrievalBackend
+
+try:
+    import fcntl  # POSIX only; on Windows a single worker is assumed
+except ImportError:
+    fcntl = None
+
+load_dotenv()
+
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+# Compact the matrix once this fraction of its rows are deleted tombstones
+VECTOR_STORE_COMPACT_RATIO = float(os.getenv("VECTOR_STORE_COMPACT_RATIO", "0.25"))
+# Rows scored per matrix product, bounds the temporary score buffer
+VECTOR_STORE_SCAN_ROWS = int(os.getenv("VECTOR_STORE_SCAN_ROWS", "65536"))
+DEFAULT_TOP = 50          # Azure Search default page size
+RRF_K = 60                # reciprocal rank fusion constant
+BM25_K1, BM25_B = 1.2, 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def top_k(matrix, queries, k, rows=None):
+    """
+    Batched cosine top-k over pre-normalized rows: scores every query against
+    the matrix in VECTOR_STORE_SCAN_ROWS blocks, keeping each block's best k
+    via argpartition. Returns one [(row, score)] list per query, best first.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries / np.where(norms == 0, 1, norms)
+    candidates = np.arange(matrix.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+    if k <= 0 or not len(candidates):
+        return [[] for _ in queries]
+
+    best_rows = [np.empty(0, dtype=np.int64)] * len(queries)
+    best_scores = [np.empty(0, dtype=np.float32)] * len(queries)
+    for start in range(0, len(candidates), VECTOR_STORE_SCAN_ROWS):
+        block = candidates[start:start + VECTOR_STORE_SCAN_ROWS]
+        scores = queries @ matrix[block].T            # (queries, block)
+        kk = min(k, len(block))
+        part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        for q in range(len(queries)):
+            best_rows[q] = np.concatenate([best_rows[q], block[part[q]]])
+            best_scores[q] = np.concatenate([best_scores[q], scores[q, part[q]]])
+
+    results = []
+    for rows_q, scores_q in zip(best_rows, best_scores):
+        order = np.argsort(-scores_q)[:k]
+        results.append([(int(rows_q[i]), float(scores_q[i])) for i in order])
+    return results
+
+
+class _BM25:
+    """Inverted index over the live rows, rebuilt lazily after writes."""
+
+    def __init__(self, docs):
+        self.postings = {}
+        self.lengths = {}
+        for row, doc in enumerate(docs):
+            if doc is None:
+                continue
+            terms = Counter(tokenize(doc.get("content")))
+            self.lengths[row] = sum(terms.values())
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[row] = tf
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0
+
+    def search(self, text, k, allowed=None):
+        scores = Counter()
+        n = len(self.lengths)
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for row, tf in posting.items():
+                if allowed is not None and row not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[row] / (self.avg_length or 1))
+                scores[row] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+
+class LocalVectorStore(RetrievalBackend):
+    """
+    In-process retrieval backend for local testing and small tenants.
+
+    Embeddings live in a memory-mapped float32 matrix (`vectors.f32`, rows
+    pre-normalized, capacity grown by doubling) next to a JSON sidecar
+    (`meta.json`) holding the other fields of each row. Upserts overwrite
+    rows in place, deletes leave tombstones until enough pile up to compact
+    the matrix. Searches are cosine (vector), BM25 (keyword) or both fused
+    with reciprocal rank fusion, like Azure's hybrid queries.
+    """
+
+    def __init__(self, index_name, directory=None):
+        self.index_name = index_name
+        self.path = os.path.join(directory or VECTOR_STORE_DIR, index_name)
+        os.makedirs(self.path, exist_ok=True)
+        self.matrix_path = os.path.join(self.path, "vectors.f32")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self._lock = threading.RLock()
+        self._dim = None
+        self._docs = []          # row → stored fields, None for a deleted row
+        self._rows = {}          # id → row
+        self._matrix = None
+        self._bm25 = None
+        self._mtime = None
+        self._load()
+
+    # ---------- Persistence ----------
+    @contextmanager
+    def _file_lock(self):
+        """Cross-process lock so several app workers can share one store."""
+        with open(os.path.join(self.path, ".lock"), "a") as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _open_matrix(self, capacity):
+        if not self._dim or not capacity:
+            self._matrix = None
+            return
+        needed = capacity * self._dim * 4
+        with open(self.matrix_path, "ab") as fh:
+            if fh.tell() < needed:
+                fh.truncate(needed)
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def _load(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            self._mtime = self._stamp()
+        except FileNotFoundError:
+            meta = {"dim": None, "capacity": 0, "docs": []}
+        self._dim = meta["dim"]
+        self._docs = meta["docs"]
+        self._rows = {doc["id"]: row for row, doc in enumerate(self._docs) if doc is not None}
+        self._open_matrix(meta["capacity"])
+        self._bm25 = None
+
+    def _stamp(self):
+        st = os.stat(self.meta_path)
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        """Pick up writes made by another process."""
+        try:
+            stamp = self._stamp()
+        except FileNotFoundError:
+            return
+        if stamp != self._mtime:
+            self._load()
+
+    def _save(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+        meta = {
+            "dim": self._dim,
+            "capacity": 0 if self._matrix is None else self._matrix.shape[0],
+            "docs": self._docs,
+        }
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self.meta_path)
+        self._mtime = self._stamp()
+        self._bm25 = None
+
+    def _ensure_capacity(self, rows):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(1024, capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        self._open_matrix(new_capacity)
+
+    def _compact(self):
+        live = [row for row, doc in enumerate(self._docs) if doc is not None]
+        vectors = np.array(self._matrix[live]) if live and self._matrix is not None else None
+        self._docs = [self._docs[row] for row in live]
+        self._rows = {doc["id"]: row for row, doc in enumerate(self._docs)}
+        self._matrix = None
+        os.remove(self.matrix_path)
+        if vectors is not None:
+            self._ensure_capacity(len(vectors))
+            self._matrix[:len(vectors)] = vectors
+        logging.info(f"🧹 Compacted vector store {self.index_name}: {len(live)} rows kept")
+
+    # ---------- RetrievalBackend ----------
+    def upload(self, documents):
+        failed = []
+        with self._lock, self._file_lock():
+            self._refresh()
+            for doc in documents:
+                fields = {k: v for k, v in doc.items() if k not in ("@search.action", "embedding")}
+                vector = np.asarray(doc.get("embedding") or [], dtype=np.float32)
+                if not vector.size:
+                    failed.append((doc.get("id"), "missing embedding"))
+                    continue
+                if self._dim is None:
+                    self._dim = int(vector.size)
+                if vector.size != self._dim:
+                    failed.append((doc.get("id"), f"embedding has {vector.size} dims, index has {self._dim}"))
+                    continue
+
+                row = self._rows.get(fields["id"])
+                if row is None:
+                    row = len(self._docs)
+                    self._docs.append(None)
+                    self._ensure_capacity(row + 1)
+                    self._rows[fields["id"]] = row
+                norm = np.linalg.norm(vector)
+                self._matrix[row] = vector / norm if norm else vector
+                self._docs[row] = fields
+            self._save()
+        return failed
+
+    def delete(self, ids):
+        with self._lock, self._file_lock():
+            self._refresh()
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._docs[row] = None
+            deleted = len(self._docs) - len(self._rows)
+            if self._docs and deleted / len(self._docs) >= VECTOR_STORE_COMPACT_RATIO:
+                self._compact()
+            self._save()
+        return []
+
+    def source_ids(self, source):
+        metadata = f"source:{source}"
+        with self._lock:
+            self._refresh()
+            return {doc["id"] for doc in self._docs if doc is not None and doc.get("metadata") == metadata}
+
+    def _candidate_rows(self, sources, filenames):
+        if not sources and not filenames:
+            return None
+        metadata = {f"source:{s}" for s in sources or ()}
+        filenames = set(filenames or ())
+        return [
+            row for row, doc in enumerate(self._docs)
+            if doc is not None
+            and (not metadata or doc.get("metadata") in metadata)
+            and (not filenames or doc.get("filename") in filenames)
+        ]
+
+    def search(self, text=None, vector=None, k=20, top=None, sources=None, filenames=None, select=None):
+        top = top or DEFAULT_TOP
+        keyword = text if text and text.strip() != "*" else None
+        with self._lock:
+            self._refresh()
+            rows = self._candidate_rows(sources, filenames)
+            if rows is None:
+                rows = [row for row, doc in enumerate(self._docs) if doc is not None]
+
+            ranked = []
+            if vector and rows and self._matrix is not None:
+                ranked.append(top_k(self._matrix, vector, k, rows)[0])
+            if keyword and rows:
+                if self._bm25 is None:
+                    self._bm25 = _BM25(self._docs)
+                ranked.append(self._bm25.search(keyword, top, allowed=set(rows)))
+
+            if not ranked:
+                scored = [(row, 1.0) for row in rows[:top]]
+            elif len(ranked) == 1:
+                scored = ranked[0][:top]
+            else:
+                fused = Counter()
+                for ranking in ranked:
+                    for rank, (row, _) in enumerate(ranking):
+                        fused[row] += 1 / (RRF_K + rank + 1)
+                scored = fused.most_common(top)
+
+            fields = [f.strip() for f in select.split(",")] if select else None
+            hits = []
+            for row, score in scored:
+                doc = self._docs[row]
+                hit = {f: doc[f] for f in fields if f in doc} if fields else dict(doc)
+                hit["@search.score"] = score
+                hits.append(hit)
+            return hits